@@ -0,0 +1,156 @@
+"""
+Latency, query count and peak memory of the main GroRoulette and marketplace routes, for
+every dataset selected with --bench-sizes. See conftest.py for the datasets and the report.
+"""
+import pytest
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.urls import reverse
+
+from groroulette.models import Spin, SpinItem
+from marketplace.models import Product
+from marketplace.pagination import encode_cursor
+from orders.models import Basket, BasketItem
+
+pytestmark = pytest.mark.django_db
+
+User = get_user_model()
+
+
+def buyer():
+    return User.objects.get(username='seed1')
+
+
+def popular_products(limit=50):
+    return list(Product.objects.order_by('-popularity', 'id')[:limit])
+
+
+def test_spin_create(bench):
+    bench.login(buyer())
+    bench.measure('spin create', 'post', reverse('spin-list-create'), {'budget': '20000'}, expected=(201,))
+
+
+def test_spin_list(bench):
+    bench.login(buyer())
+    bench.measure('spin list', 'get', reverse('spin-list-create'))
+
+
+def test_spin_item_select(bench):
+    # Seeded spins in their selection phase with room for one more pick, and an unselected item of each
+    selecting = Spin.objects.filter(
+        status='selecting', total_items_generated__gt=0, selected_count__lt=F('max_items_to_select')
+    ).select_related('user')
+    spins = list(selecting[:bench.runs + bench.warmup + 1])
+    first_items = {}
+    rows = SpinItem.objects.filter(spin_id__in=[spin.id for spin in spins], is_selected=False).values_list('spin_id', 'id')
+    for spin_id, item_id in rows.order_by('position_in_spin'):
+        first_items.setdefault(spin_id, item_id)
+    spins = [spin for spin in spins if spin.id in first_items]
+
+    def prepare(index):
+        spin = spins[index % len(spins)]
+        bench.login(spin.user)
+        return {
+            'url': reverse('spin-item-bulk-select', args=[spin.id]),
+            'data': {'item_ids': [str(first_items[spin.id])], 'selected': index < len(spins)},
+        }
+
+    bench.measure('spin item select', 'post', prepare=prepare)
+
+
+def test_product_list(bench):
+    bench.login(buyer())
+    bench.measure('product list', 'get', reverse('product-list-create'))
+
+
+# Response size and latency of each output shape of the product list
+PRODUCT_LIST_MODES = {
+    'grid': {'view': 'grid'},
+    'fields': {'fields': 'id,name,price,category'},
+    'expand ratings': {'expand': 'ratings'},
+}
+
+
+@pytest.mark.parametrize('mode', PRODUCT_LIST_MODES)
+def test_product_list_mode(bench, mode):
+    bench.login(buyer())
+    bench.measure(f'product list {mode}', 'get', reverse('product-list-create'), PRODUCT_LIST_MODES[mode])
+
+
+def test_product_list_deep_page(bench):
+    # A page near the end of the price-ordered catalog: with keyset cursors it should cost what page one does
+    bench.login(buyer())
+    last = Product.objects.order_by('-price', '-id').values_list('price', 'id')[100]
+    cursor = encode_cursor(['price', 'id'], list(last))
+    bench.measure('product list deep page', 'get', reverse('product-list-create'), {'ordering': 'price', 'cursor': cursor})
+
+
+def test_product_list_revalidate(bench):
+    # A client that already holds the first page asking again: 304 from the version stamps alone
+    bench.login(buyer())
+    etag = bench.client.get(reverse('product-list-create'))['ETag']
+    bench.measure('product list revalidate', 'get', reverse('product-list-create'), expected=(304,), headers={'If-None-Match': etag})
+
+
+def test_product_changes(bench, settings):
+    # A first sync page of the changes feed: ids only, read from the (updated_at, id) index
+    settings.PRODUCT_CHANGES_LAG = 0
+    bench.login(buyer())
+    bench.measure('product changes', 'get', reverse('product-changes'), {'page_size': 500})
+
+
+@pytest.mark.parametrize('compress', ['', 'gzip'])
+def test_product_export(bench, compress):
+    # The whole catalog streamed as NDJSON; peak memory should not grow with the catalog
+    bench.login(buyer())
+    bench.measure(f'product export {compress}'.strip(), 'get', reverse('product-export'), {'compress': compress})
+
+
+def search_terms():
+    products = popular_products(10)
+    return [product.name.split()[0] for product in products] + [product.name for product in products]
+
+
+def test_product_search(bench):
+    bench.login(buyer())
+    terms = search_terms()
+    bench.measure(
+        'product search', 'get', reverse('product-list-create'),
+        prepare=lambda index: {'data': {'search': terms[index % len(terms)]}},
+    )
+
+
+def test_product_search_like(bench, settings):
+    # The SearchFilter LIKE path that the full-text index replaced, for comparison
+    settings.PRODUCT_SEARCH_BACKEND = 'like'
+    bench.login(buyer())
+    terms = search_terms()
+    bench.measure(
+        'product search like', 'get', reverse('product-list-create'),
+        prepare=lambda index: {'data': {'search': terms[index % len(terms)]}},
+    )
+
+
+def test_rating_create(bench):
+    bench.login(buyer())
+    products = popular_products()
+    bench.measure(
+        'rating create', 'post', reverse('product-rate'), expected=(200, 201),
+        prepare=lambda index: {'data': {'product': products[index % len(products)].id, 'rating': index % 5 + 1}},
+    )
+
+
+def test_basket_checkout(bench):
+    user = buyer()
+    bench.login(user)
+    products = popular_products(5)
+
+    def prepare(index):
+        basket = Basket.objects.create(user=user)
+        BasketItem.objects.bulk_create([
+            BasketItem(basket=basket, product=product, quantity=1, price=product.price, name=product.name, position_in_spin=position)
+            for position, product in enumerate(products, start=1)
+        ])
+        return {'url': reverse('basket-checkout', args=[basket.id])}
+
+    bench.measure('basket checkout', 'post', expected=(201,), prepare=prepare)
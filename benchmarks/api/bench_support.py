@@ -0,0 +1,91 @@
+"""
+Measurement helper for the endpoint benchmarks.
+
+Bench.measure() calls one route repeatedly through the DRF test client:
+
+    warmup   untimed requests, so caches and lazy imports are settled
+    runs     timed requests; latency only, nothing else is instrumented
+    probe    one more request with CaptureQueriesContext and tracemalloc switched on,
+             giving the query count and the peak Python memory of a single request
+
+Latency and instrumentation are kept apart because capturing queries and tracing
+allocations both slow the request down. `prepare(i)` runs before every request, outside
+the timer, and may return a different url or data for that request, so write endpoints
+can be given fresh rows (a new basket, another product) each time.
+"""
+import statistics
+import time
+import tracemalloc
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+RESULTS = []
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+class Bench:
+
+    def __init__(self, dataset, counts, runs=30, warmup=3):
+        self.dataset = dataset
+        self.counts = counts
+        self.runs = runs
+        self.warmup = warmup
+        self.client = APIClient()
+
+    def login(self, user):
+        self.client.force_authenticate(user)
+
+    def measure(self, route, method, url=None, data=None, expected=(200,), prepare=None, headers=None):
+        """Benchmark `method url` and record the result under `route`; prepare(i) may override url and data."""
+        call = getattr(self.client, method)
+
+        def send(index):
+            request = {'url': url, 'data': data}
+            if prepare:
+                request.update(prepare(index))
+            kwargs = {'headers': headers} if method == 'get' else {'format': 'json', 'headers': headers}
+            start = time.perf_counter()
+            response = call(request['url'], request['data'], **kwargs)
+            if response.streaming:  # a streamed body is only produced as it is read; count it without keeping it
+                response.head, response.size = b'', 0
+                for block in response.streaming_content:
+                    response.head = response.head or block[:300]
+                    response.size += len(block)
+            else:
+                response.head, response.size = response.content[:300], len(response.content)
+            elapsed = (time.perf_counter() - start) * 1000
+            assert response.status_code in expected, f'{route}: {response.status_code} {response.head!r}'
+            return elapsed, response
+
+        for index in range(self.warmup):
+            send(index)
+        latencies = [send(self.warmup + index)[0] for index in range(self.runs)]
+
+        tracemalloc.start()
+        try:
+            with CaptureQueriesContext(connection) as queries:
+                _, response = send(self.warmup + self.runs)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        result = {
+            'dataset': self.dataset,
+            'route': route,
+            'runs': self.runs,
+            'p50_ms': round(statistics.median(latencies), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'mean_ms': round(statistics.fmean(latencies), 3),
+            'queries': len(queries),
+            'peak_kib': round(peak / 1024, 1),
+            'response_kib': round(response.size / 1024, 1),
+        }
+        RESULTS.append(result)
+        return result
@@ -0,0 +1,58 @@
+"""
+Compare two endpoint benchmark reports written by `pytest benchmarks/api`.
+
+    python benchmarks/api/compare.py base.json head.json [--threshold 10]
+
+Prints every route of every dataset found in both reports with the change in p50 and
+p95 latency, query count and peak memory. Changes above --threshold percent (or any
+increase in queries) are marked, and the exit status is 1 when there is at least one.
+"""
+import argparse
+import json
+import sys
+
+METRICS = ('p50_ms', 'p95_ms', 'queries', 'peak_kib')
+
+
+def load(path):
+    with open(path) as handle:
+        report = json.load(handle)
+    return report, {(row['dataset'], row['route']): row for row in report['results']}
+
+
+def change(before, after):
+    if not before:
+        return 0.0 if not after else float('inf')
+    return (after - before) / before * 100
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('base')
+    parser.add_argument('head')
+    parser.add_argument('--threshold', type=float, default=10.0, help='Percent change that counts as a regression')
+    args = parser.parse_args()
+
+    base_report, base = load(args.base)
+    head_report, head = load(args.head)
+    print(f"{base_report['commit']} -> {head_report['commit']}")
+    print(f"{'dataset':>8} {'route':<18}" + ''.join(f'{metric:>22}' for metric in METRICS))
+
+    regressions = 0
+    for key in sorted(base.keys() & head.keys()):
+        cells = []
+        for metric in METRICS:
+            before, after = base[key][metric], head[key][metric]
+            delta = change(before, after)
+            worse = after > before if metric == 'queries' else delta > args.threshold
+            regressions += worse
+            cells.append(f"{before:>8g} -> {after:<8g}{'!' if worse else ' '}{delta:+.0f}%".rjust(22))
+        print(f'{key[0]:>8} {key[1]:<18}' + ''.join(cells))
+
+    for key in sorted(base.keys() ^ head.keys()):
+        print(f"{key[0]:>8} {key[1]:<18} only in {'base' if key in base else 'head'}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
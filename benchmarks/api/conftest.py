@@ -0,0 +1,103 @@
+"""
+Fixtures and reporting for the endpoint benchmarks.
+
+Every benchmark runs once per dataset size. A dataset is seeded with the bulk seeder
+(groroulette/management/bulk_seed.py) into the test database once per session and kept for
+all benchmarks of that size; each benchmark runs inside a transaction that is rolled back,
+so writes made while measuring never leak into the next one.
+
+At the end of the session the results are written as JSON to --bench-report (by default
+benchmarks/results/api-<commit>.json); compare two reports with benchmarks/api/compare.py.
+"""
+import datetime
+import json
+import platform
+import subprocess
+from io import StringIO
+from pathlib import Path
+
+import pytest
+
+from bench_support import RESULTS
+
+ROOT = Path(__file__).resolve().parents[2]
+
+DATASETS = {
+    'small': {'products': 500, 'users': 50, 'spins_per_user': 4, 'items_per_spin': 8},
+    'medium': {'products': 5_000, 'users': 500, 'spins_per_user': 6, 'items_per_spin': 10},
+    'large': {'products': 20_000, 'users': 2_000, 'spins_per_user': 8, 'items_per_spin': 10},
+}
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('bench', 'endpoint benchmarks')
+    group.addoption('--bench-sizes', default='small,medium', help=f"Comma separated datasets: {', '.join(DATASETS)}")
+    group.addoption('--bench-runs', type=int, default=30, help='Timed requests per endpoint')
+    group.addoption('--bench-warmup', type=int, default=3, help='Untimed requests before timing')
+    group.addoption('--bench-seed', type=int, default=42, help='Seed for the dataset generator')
+    group.addoption('--bench-report', default=None, help='Where to write the JSON report')
+
+
+def pytest_generate_tests(metafunc):
+    if 'dataset' in metafunc.fixturenames:
+        sizes = [size.strip() for size in metafunc.config.getoption('bench_sizes').split(',') if size.strip()]
+        unknown = set(sizes) - set(DATASETS)
+        if unknown:
+            raise pytest.UsageError(f"Unknown --bench-sizes {sorted(unknown)}; choose from {', '.join(DATASETS)}")
+        metafunc.parametrize('dataset', sizes, indirect=True, scope='session')
+
+
+@pytest.fixture(scope='session')
+def dataset(request, django_db_setup, django_db_blocker):
+    from django.core.cache import cache
+    from django.core.management import call_command
+
+    from groroulette.badges.leaderboard import leaderboards
+    from groroulette.management.bulk_seed import BulkSeeder
+    from groroulette.products.index import candidate_index
+    from groroulette.spins.pool import candidate_pool
+
+    with django_db_blocker.unblock():
+        call_command('flush', interactive=False, verbosity=0)
+        for reset in (cache.clear, candidate_index.clear, candidate_pool.clear, leaderboards.reset):
+            reset()
+        counts = BulkSeeder(StringIO(), seed=request.config.getoption('bench_seed')).run(**DATASETS[request.param])
+    return request.param, counts
+
+
+@pytest.fixture
+def bench(request, dataset, db):
+    from bench_support import Bench
+
+    size, counts = dataset
+    return Bench(
+        size, counts, runs=request.config.getoption('bench_runs'), warmup=request.config.getoption('bench_warmup')
+    )
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def pytest_sessionfinish(session, exitstatus):
+    if not RESULTS:
+        return
+    commit = _commit()
+    path = session.config.getoption('bench_report') or ROOT / 'benchmarks' / 'results' / f'api-{commit}.json'
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    report = {
+        'commit': commit,
+        'created_at': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'runs': session.config.getoption('bench_runs'),
+        'datasets': {size: DATASETS[size] for size in {result['dataset'] for result in RESULTS}},
+        'results': sorted(RESULTS, key=lambda result: (result['dataset'], result['route'])),
+    }
+    path.write_text(json.dumps(report, indent=2))
+    session.config.get_terminal_writer().line(f'\nbenchmark report: {path}')
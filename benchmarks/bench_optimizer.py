@@ -0,0 +1,77 @@
+"""
+Spin optimizer benchmark: budget utilisation and latency of the greedy and knapsack
+optimizers on synthetic catalogs of 1k, 10k and 100k products.
+
+    python benchmarks/bench_optimizer.py [--budget 50000] [--runs 20] [--max-items 10] [--max-quantity 10]
+
+Prices follow a log-normal distribution rounded to the nearest 50 naira, which is close
+to the seeded marketplace catalog. Budgets are drawn between 5,000 and the --budget value.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yardgro_backend.settings')
+
+from groroulette.spins.optimizer import (  # noqa: E402
+    Candidate, GreedyOptimizer, KnapsackOptimizer, spend, to_kobo,
+)
+
+SIZES = [1_000, 10_000, 100_000]
+
+
+def make_catalog(size, rng):
+    catalog = []
+    for pk in range(1, size + 1):
+        naira = max(50, round(rng.lognormvariate(8, 1) / 50) * 50)
+        catalog.append(Candidate(pk, to_kobo(naira)))
+    return catalog
+
+
+def run(optimizer, catalog, budgets, max_items, max_quantity):
+    latencies, utilisation = [], []
+    for budget in budgets:
+        candidates = [c for c in catalog if c.price <= budget]  # what the price__lte query returns
+        start = time.perf_counter()
+        picks = optimizer.solve(candidates, budget, max_items, max_quantity)
+        latencies.append((time.perf_counter() - start) * 1000)
+        utilisation.append(spend(picks) / budget * 100)
+    latencies.sort()
+    return {
+        'p50_ms': statistics.median(latencies),
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1],
+        'utilisation_pct': statistics.mean(utilisation),
+        'min_utilisation_pct': min(utilisation),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--budget', type=int, default=50000, help='Largest budget in naira')
+    parser.add_argument('--runs', type=int, default=20, help='Budgets tried per catalog size')
+    parser.add_argument('--max-items', type=int, default=10)
+    parser.add_argument('--max-quantity', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    budgets = [to_kobo(rng.randrange(5000, args.budget + 1, 50)) for _ in range(args.runs)]
+    optimizers = [GreedyOptimizer(), KnapsackOptimizer(time_budget_ms=50, max_cells=20000, pool_size=256)]
+
+    print(f"{'products':>9} {'optimizer':>9} {'p50 ms':>8} {'p95 ms':>8} {'util %':>7} {'min util %':>10}")
+    for size in SIZES:
+        catalog = make_catalog(size, rng)
+        for optimizer in optimizers:
+            result = run(optimizer, catalog, budgets, args.max_items, args.max_quantity)
+            print(
+                f"{size:>9} {optimizer.name:>9} {result['p50_ms']:>8.2f} {result['p95_ms']:>8.2f} "
+                f"{result['utilisation_pct']:>7.2f} {result['min_utilisation_pct']:>10.2f}"
+            )
+
+
+if __name__ == '__main__':
+    main()
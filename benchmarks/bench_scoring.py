@@ -0,0 +1,97 @@
+"""
+Spin scoring microbenchmark: the vectorised SpinScorer against the same formula written as a
+per-row Python loop, on synthetic candidate index rows.
+
+    python benchmarks/bench_scoring.py [--products 50000] [--runs 20] [--seed 7]
+
+Both timings include turning the index rows into scores, so the NumPy figure covers building
+the arrays as well as the weighted sum.
+"""
+import argparse
+import math
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yardgro_backend.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from groroulette.common.conf import gro_setting  # noqa: E402
+from groroulette.spins.scoring import FEATURES, SpinScorer  # noqa: E402
+
+
+def make_rows(size, rng):
+    rows = []
+    for pk in range(1, size + 1):
+        price = max(5000, round(rng.lognormvariate(8, 1) / 50) * 5000)
+        rating = round(rng.uniform(1, 5), 1) if rng.random() < 0.6 else 0.0
+        rows.append((pk, price, rng.randrange(0, 200), int(rng.paretovariate(1.5)), rating, rng.randrange(1, 12)))
+    return rows
+
+
+def score_loop(rows, preferred_categories, favorite_ids, weights, stock_target):
+    """Reference implementation: the SpinScorer formula, one row at a time."""
+    preferred = {int(pk) for pk in preferred_categories}
+    favorites = set(favorite_ids)
+    max_popularity = max((math.log1p(max(row[3], 0)) for row in rows), default=0) or 1e-9
+    max_quality = max(((1 + row[4]) / max(row[1], 1) for row in rows), default=0) or 1e-12
+    w = [weights.get(name, 0) for name in FEATURES]
+
+    scores = []
+    for product_id, price, stock, popularity, rating, category_id in rows:
+        features = (
+            math.log1p(max(popularity, 0)) / max_popularity,
+            rating / 5,
+            (1 + rating) / max(price, 1) / max_quality,
+            min(stock / stock_target, 1),
+            0.5 * (category_id in preferred) + 0.5 * (product_id in favorites),
+        )
+        scores.append(sum(weight * value for weight, value in zip(w, features)))
+    return scores
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return result, statistics.median(samples), min(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--products', type=int, default=50_000)
+    parser.add_argument('--runs', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    rows = make_rows(args.products, rng)
+    preferred = [1, 2, 3]
+    favorites = rng.sample(range(1, args.products + 1), k=min(200, args.products))
+    weights = gro_setting('SCORE_WEIGHTS')
+    stock_target = gro_setting('SCORE_STOCK_TARGET')
+
+    scorer = SpinScorer(weights, stock_target)
+    vectorised, numpy_p50, numpy_min = timed(lambda: scorer.score(rows, preferred, favorites), args.runs)
+    looped, loop_p50, loop_min = timed(
+        lambda: score_loop(rows, preferred, favorites, weights, stock_target), args.runs
+    )
+    drift = max(abs(a - b) for a, b in zip(vectorised.tolist(), looped))
+
+    print(f'{args.products} candidates, {args.runs} runs')
+    print(f"{'implementation':>15} {'p50 ms':>8} {'min ms':>8}")
+    print(f"{'numpy':>15} {numpy_p50:>8.2f} {numpy_min:>8.2f}")
+    print(f"{'python loop':>15} {loop_p50:>8.2f} {loop_min:>8.2f}")
+    print(f'speed-up x{loop_p50 / numpy_p50:.1f}, max score difference {drift:.2e}')
+
+
+if __name__ == '__main__':
+    main()
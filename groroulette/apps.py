@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class GrorouletteConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'groroulette'
+
+    def ready(self):
+        import groroulette.signals
@@ -0,0 +1,128 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction
+
+from groroulette.models import Badge, BadgeProgress, Spin, SpinItem, UserBadge
+from .leaderboard import record_awards
+from .rules import BADGE_RULES, GOOD_BUDGET_UTILISATION, SpinOutcome
+
+
+# Badge Engine
+# Advances BadgeProgress for completed spins and awards the badges whose rules now pass.
+#
+#   record_completion(spin)   live path, called when a spin is completed
+#   record_batch(spins)       the same for many spins at once (backfill_badges command)
+#
+# Both claim spins through Spin.badges_recorded, so a spin is counted at most once however
+# often it is completed or replayed. The cost per call is a fixed handful of queries for the
+# whole batch: selected items, progress rows, held badges, existing awards, and the writes.
+class BadgeEngine:
+
+    def record_completion(self, spin):
+        """Names of the badges `spin` earned its user."""
+        with transaction.atomic():
+            if not Spin.objects.filter(id=spin.id, badges_recorded=False).update(badges_recorded=True):
+                return []
+            awards = self._record([spin])
+        return [award.badge.name for award in awards]
+
+    def record_batch(self, spins):
+        """Count completed `spins` (oldest first) that have not been counted yet. Returns the UserBadges created."""
+        with transaction.atomic():
+            ids = [spin.id for spin in spins]
+            claimed = set(
+                Spin.objects.select_for_update().filter(id__in=ids, badges_recorded=False).values_list('id', flat=True)
+            )
+            spins = [spin for spin in spins if spin.id in claimed]
+            if not spins:
+                return []
+            Spin.objects.filter(id__in=claimed).update(badges_recorded=True)
+            return self._record(spins)
+
+    def _record(self, spins):
+        outcomes = self._outcomes(spins)
+        user_ids = {outcome.user_id for outcome in outcomes}
+
+        BadgeProgress.objects.bulk_create(
+            [BadgeProgress(user_id=user_id) for user_id in user_ids], ignore_conflicts=True
+        )
+        progress = {
+            row.user_id: row for row in BadgeProgress.objects.select_for_update().filter(user_id__in=user_ids)
+        }
+        held = defaultdict(set)
+        for user_id, name in UserBadge.objects.filter(user_id__in=user_ids).values_list('user_id', 'badge__name'):
+            held[user_id].add(name)
+
+        due = []
+        for outcome in outcomes:
+            user_progress = progress[outcome.user_id]
+            advance(user_progress, outcome)
+            for rule in BADGE_RULES.values():
+                if rule.name not in held[outcome.user_id] and rule.earned(user_progress, outcome):
+                    held[outcome.user_id].add(rule.name)
+                    due.append((rule, outcome))
+
+        BadgeProgress.objects.bulk_update(
+            progress.values(), ['spins_completed', 'categories', 'budget_streak', 'best_budget_streak']
+        )
+        return self._award(due)
+
+    def _outcomes(self, spins):
+        selected = defaultdict(list)
+        rows = SpinItem.objects.filter(spin__in=spins, is_selected=True).values_list(
+            'spin_id', 'category_name', 'total_price'
+        )
+        for spin_id, category_name, total_price in rows:
+            selected[spin_id].append((category_name, total_price))
+        return [
+            SpinOutcome(
+                spin_id=spin.id,
+                user_id=spin.user_id,
+                budget=spin.budget,
+                max_items=spin.max_items_to_select,
+                selected_count=len(selected[spin.id]),
+                selected_value=sum((price for _, price in selected[spin.id]), Decimal('0')),
+                categories=frozenset(name for name, _ in selected[spin.id] if name),
+            )
+            for spin in spins
+        ]
+
+    def _award(self, due):
+        if not due:
+            return []
+        names = {rule.name for rule, _ in due}
+        badges = {badge.name: badge for badge in Badge.objects.filter(name__in=names)}
+        for rule, _ in due:
+            if rule.name not in badges:
+                badges[rule.name], _ = Badge.objects.get_or_create(
+                    name=rule.name,
+                    defaults={'title': rule.title, 'description': rule.description, 'points': rule.points},
+                )
+        awards = [
+            UserBadge(user_id=outcome.user_id, badge=badges[rule.name], name=rule.title, spin_id=outcome.spin_id)
+            for rule, outcome in due
+        ]
+        # ignore_conflicts skips rows that are already there without saying which, so leave out
+        # the ones that exist before inserting (the progress rows locked above keep other awards
+        # to these users waiting) and only score the rest
+        existing = set(
+            UserBadge.objects.filter(spin_id__in={award.spin_id for award in awards})
+            .values_list('user_id', 'badge_id', 'spin_id')
+        )
+        awards = [award for award in awards if (award.user_id, award.badge_id, award.spin_id) not in existing]
+        UserBadge.objects.bulk_create(awards, ignore_conflicts=True)
+        record_awards(awards)  # bulk_create sends no post_save, so points are added here
+        return awards
+
+
+def advance(progress, outcome):
+    """Move a user's BadgeProgress forward by one completed spin."""
+    progress.spins_completed += 1
+    if not outcome.categories <= set(progress.categories):
+        progress.categories = sorted(set(progress.categories) | outcome.categories)
+    if outcome.budget and outcome.selected_value / outcome.budget >= GOOD_BUDGET_UTILISATION:
+        progress.budget_streak += 1
+        progress.best_budget_streak = max(progress.best_budget_streak, progress.budget_streak)
+    else:
+        progress.budget_streak = 0
@@ -0,0 +1,277 @@
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from groroulette.common.conf import gro_setting
+from groroulette.models import LeaderboardScore, UserBadge
+from profiles.models import BuyerProfile
+
+
+# Leaderboards
+# Badge points per user, on three kinds of board:
+#
+#   global            every point ever earned
+#   week:<year>-W<nn> points earned in that ISO week
+#   buyer:<type>      every point earned while the user was a BuyerProfile.buyer_type buyer
+#
+# LeaderboardScore rows are the source of truth and are advanced by record_awards() whenever
+# badges are awarded. On top of them each board is kept as a sorted structure for top-N and
+# rank lookups in O(log n): a Redis sorted set (GROROULETTE['LEADERBOARD_BACKEND'] = 'redis')
+# or, per process, a sorted list searched with bisect ('local'). Both load a board from the
+# table on first use and are then updated in place when the awarding transaction commits.
+#
+# Updates carry a user's total as read from the table after the commit, not the points just
+# awarded, and a board only ever raises a total. A board loaded after the award committed
+# already counts it, so a delta applied on top would count it twice; a total read back from
+# the table is the same number either way, and an older total arriving late is ignored.
+# A local board only sees the awards of its own process, so it reloads from the table once
+# older than GROROULETTE['LEADERBOARD_TTL'] seconds to pick up other workers' (and Celery's).
+#
+# Both order by points, highest first, then by user id, lowest first: the user who reached a
+# tied score first in id order keeps the higher rank, whichever backend is configured.
+GLOBAL_BOARD = 'global'
+
+
+def weekly_board(when=None):
+    year, week, _ = (when or timezone.now()).isocalendar()
+    return f'week:{year}-W{week:02d}'
+
+
+def buyer_board(buyer_type):
+    return f'buyer:{buyer_type}'
+
+
+def load_board(name):
+    return list(LeaderboardScore.objects.filter(board=name, points__gt=0).values_list('user_id', 'points'))
+
+
+# Sorted Board
+# One board as a list of (-points, user_id) kept in order, plus the points of each user.
+class SortedBoard:
+
+    def __init__(self, scores=()):
+        self._points = dict(scores)
+        self._keys = sorted((-points, user_id) for user_id, points in self._points.items())
+
+    def update(self, user_id, points):
+        """Raise `user_id` to `points`; a total no higher than the board's is ignored."""
+        current = self._points.get(user_id)
+        if current is not None:
+            if current >= points:
+                return
+            del self._keys[bisect_left(self._keys, (-current, user_id))]
+        self._points[user_id] = points
+        insort(self._keys, (-points, user_id))
+
+    def top(self, limit):
+        return [(user_id, -negated) for negated, user_id in self._keys[:limit]]
+
+    def rank(self, user_id):
+        points = self._points.get(user_id)
+        if points is None:
+            return None
+        return bisect_left(self._keys, (-points, user_id)) + 1, points
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class LocalLeaderboards:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._boards = {}  # name -> (SortedBoard, loaded at)
+
+    def _board(self, name):
+        board, loaded_at = self._boards.get(name, (None, 0))
+        ttl = gro_setting('LEADERBOARD_TTL')
+        if board is None or (ttl and time.monotonic() - loaded_at > ttl):
+            board = SortedBoard(load_board(name))
+            self._boards[name] = (board, time.monotonic())
+        return board
+
+    def update(self, name, user_id, points):
+        with self._lock:
+            if name in self._boards:  # unloaded boards read the updated table on first use
+                self._boards[name][0].update(user_id, points)
+
+    def top(self, name, limit):
+        with self._lock:
+            return self._board(name).top(limit)
+
+    def rank(self, name, user_id):
+        with self._lock:
+            return self._board(name).rank(user_id)
+
+    def size(self, name):
+        with self._lock:
+            return len(self._board(name))
+
+    def clear(self):
+        with self._lock:
+            self._boards = {}
+
+
+# Redis Leaderboards
+# Scores are stored negated and read in ascending order, so Redis breaks ties by member, and
+# members are zero-padded user ids: ties go to the lowest user id, as on a SortedBoard.
+# (ZREVRANGE would break them by member in reverse instead.)
+#
+# Every write is ZADD LT, which only ever lowers a negated score (raises the points), so the
+# table snapshot that seeds a board and the totals published by record_awards() can land in
+# either order and the board ends up with the highest, latest total for each user. Updates are
+# written whether or not the board is seeded yet; a separate ':loaded' key records the seeding.
+class RedisLeaderboards:
+
+    def __init__(self, url, prefix='groroulette:leaderboard:negated', client=None):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, name):
+        return f'{self.prefix}:{name}'
+
+    @staticmethod
+    def _member(user_id):
+        return f'{user_id:020d}'
+
+    def _ensure(self, name):
+        key = self._key(name)
+        loaded = f'{self.prefix}:loaded:{name}'
+        if not self.client.exists(loaded):
+            scores = load_board(name)
+            if scores:
+                self.client.zadd(key, {self._member(user_id): -points for user_id, points in scores}, lt=True)
+            self.client.set(loaded, 1)
+        return key
+
+    def update(self, name, user_id, points):
+        self.client.zadd(self._key(name), {self._member(user_id): -points}, lt=True)
+
+    def top(self, name, limit):
+        rows = self.client.zrange(self._ensure(name), 0, limit - 1, withscores=True)
+        return [(int(user_id), -int(points)) for user_id, points in rows]
+
+    def rank(self, name, user_id):
+        key = self._ensure(name)
+        with self.client.pipeline() as pipe:
+            position, points = pipe.zrank(key, self._member(user_id)).zscore(key, self._member(user_id)).execute()
+        if position is None:
+            return None
+        return position + 1, -int(points)
+
+    def size(self, name):
+        return self.client.zcard(self._ensure(name))
+
+    def clear(self):
+        keys = list(self.client.scan_iter(f'{self.prefix}:*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+class Leaderboards:
+    """The backend selected by GROROULETTE['LEADERBOARD_BACKEND'], built on first use."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._backend = None
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    name = gro_setting('LEADERBOARD_BACKEND')
+                    if name == 'redis':
+                        self._backend = RedisLeaderboards(gro_setting('LEADERBOARD_REDIS_URL'))
+                    elif name == 'local':
+                        self._backend = LocalLeaderboards()
+                    else:
+                        raise ValueError(f"Unknown leaderboard backend {name!r}; expected 'local' or 'redis'")
+        return self._backend
+
+    def reset(self):
+        """Forget the backend (and, for 'local', every loaded board); the next call rebuilds it."""
+        with self._lock:
+            self._backend = None
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
+
+
+leaderboards = Leaderboards()
+
+
+def record_awards(awards, when=None):
+    """Add the points of newly created UserBadges (with .badge loaded) to every board they count on."""
+    if not awards:
+        return
+    when = when or timezone.now()
+    buyer_types = dict(
+        BuyerProfile.objects.filter(user_id__in={award.user_id for award in awards}, buyer_type__isnull=False)
+        .values_list('user_id', 'buyer_type')
+    )
+    deltas = Counter()
+    for award in awards:
+        boards = [GLOBAL_BOARD, weekly_board(when)]
+        if award.user_id in buyer_types:
+            boards.append(buyer_board(buyer_types[award.user_id]))
+        for board in boards:
+            deltas[board, award.user_id] += award.badge.points
+
+    for (board, user_id), delta in deltas.items():
+        _add_points(board, user_id, delta)
+
+    def publish():
+        totals = LeaderboardScore.objects.filter(
+            board__in={board for board, _ in deltas}, user_id__in={user_id for _, user_id in deltas}
+        ).values_list('board', 'user_id', 'points')
+        for board, user_id, points in totals:
+            if (board, user_id) in deltas:
+                leaderboards.update(board, user_id, points)
+
+    transaction.on_commit(publish)
+
+
+def _add_points(board, user_id, delta):
+    scores = LeaderboardScore.objects.filter(board=board, user_id=user_id)
+    if scores.update(points=F('points') + delta, updated_at=timezone.now()):
+        return
+    try:
+        with transaction.atomic():
+            LeaderboardScore.objects.create(board=board, user_id=user_id, points=delta)
+    except IntegrityError:  # created by a concurrent award
+        scores.update(points=F('points') + delta, updated_at=timezone.now())
+
+
+def rebuild_scores():
+    """Recompute every LeaderboardScore from user_badges. Offline use only (rebuild_leaderboards command)."""
+    awards = (
+        UserBadge.objects.values('user_id', 'earned_at__iso_year', 'earned_at__week')
+        .annotate(points=Coalesce(Sum('badge__points'), 0))
+    )
+    buyer_types = dict(BuyerProfile.objects.filter(buyer_type__isnull=False).values_list('user_id', 'buyer_type'))
+    totals = Counter()
+    for row in awards.iterator():
+        user_id, points = row['user_id'], row['points']
+        totals[GLOBAL_BOARD, user_id] += points
+        totals[f"week:{row['earned_at__iso_year']}-W{row['earned_at__week']:02d}", user_id] += points
+        if user_id in buyer_types:
+            totals[buyer_board(buyer_types[user_id]), user_id] += points
+
+    with transaction.atomic():
+        LeaderboardScore.objects.all().delete()
+        LeaderboardScore.objects.bulk_create(
+            [LeaderboardScore(board=board, user_id=user_id, points=points) for (board, user_id), points in totals.items()],
+            batch_size=1000,
+        )
+    transaction.on_commit(leaderboards.clear)
+    return len(totals)
@@ -0,0 +1,63 @@
+from decimal import Decimal
+from typing import Callable, NamedTuple
+
+
+# Badge Rules
+# Every badge is a rule registered with @badge_rule under its Badge.BADGE_TYPES key. A rule is
+# a predicate over the user's BadgeProgress counters (already advanced for the spin that was
+# just completed) and the SpinOutcome of that spin, so checking every rule is O(rules) with
+# no queries. Rules are evaluated only for badges the user does not hold yet.
+#
+# To add a badge: add its key to Badge.BADGE_TYPES and register a rule for it here.
+BUDGET_STREAK_FOR_MASTER = 3       # completed spins in a row that used the budget well
+GOOD_BUDGET_UTILISATION = Decimal('0.9')  # selected value / budget that counts as using it well
+CATEGORIES_FOR_EXPLORER = 5        # distinct categories selected across all spins
+SPINS_FOR_LOYALTY = 10             # completed spins
+
+
+class SpinOutcome(NamedTuple):
+    spin_id: object
+    user_id: int
+    budget: Decimal
+    max_items: int
+    selected_count: int
+    selected_value: Decimal
+    categories: frozenset
+
+
+class BadgeRule(NamedTuple):
+    name: str
+    title: str
+    description: str
+    points: int
+    earned: Callable
+
+
+BADGE_RULES = {}
+
+
+def badge_rule(name, title, description, points=10):
+    def register(earned):
+        BADGE_RULES[name] = BadgeRule(name, title, description, points, earned)
+        return earned
+    return register
+
+
+@badge_rule('smart_shopper', 'Smart Shopper', 'Collected all items from a spin!', points=10)
+def selected_every_slot(progress, outcome):
+    return 0 < outcome.max_items <= outcome.selected_count
+
+
+@badge_rule('budget_master', 'Budget Master', 'Used your budget well spin after spin!', points=15)
+def budget_streak(progress, outcome):
+    return progress.budget_streak >= BUDGET_STREAK_FOR_MASTER
+
+
+@badge_rule('variety_explorer', 'Variety Explorer', 'Selected items from many different categories!', points=12)
+def many_categories(progress, outcome):
+    return len(progress.categories) >= CATEGORIES_FOR_EXPLORER
+
+
+@badge_rule('loyal_customer', 'Loyal Customer', 'Played GroRoulette many times!', points=20)
+def many_spins(progress, outcome):
+    return progress.spins_completed >= SPINS_FOR_LOYALTY
@@ -0,0 +1,123 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from .conf import gro_setting
+
+
+# Cache Backends
+# Small key/value caches used by GroRoulette for derived data (see groroulette/spins/pool.py).
+# Both backends keep a catalog version next to the entries: callers put it in their keys and
+# bump it when the catalog changes, so stale entries are never read again and simply age out.
+#
+#   LocalLRUCache  per process, bounded by entry count, version lives in the process
+#   RedisCache     shared by every process using the same Redis, version is a Redis counter
+#
+# Both count hits and misses; stats() reports them for sizing the cache.
+class LocalLRUCache:
+
+    def __init__(self, max_entries=512, ttl=300):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def version(self):
+        return self._version
+
+    def bump_version(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()  # nothing keyed on the old version can be read again
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        return {
+            'backend': 'local',
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'version': self._version,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+
+class RedisCache:
+
+    def __init__(self, url, ttl=300, prefix='groroulette:pool', client=None):
+        if client is None:
+            import redis
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def _key(self, name):
+        return f'{self.prefix}:{name}'
+
+    def get(self, key):
+        raw = self.client.get(self._key(key))
+        self.client.incr(self._key('hits' if raw is not None else 'misses'))
+        return pickle.loads(raw) if raw is not None else None
+
+    def set(self, key, value):
+        self.client.set(self._key(key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ex=self.ttl)
+
+    def version(self):
+        return int(self.client.get(self._key('version')) or 0)
+
+    def bump_version(self):
+        self.client.incr(self._key('version'))
+
+    def clear(self):
+        self.client.delete(self._key('hits'), self._key('misses'))
+        self.bump_version()
+
+    def stats(self):
+        hits, misses, version = self.client.mget(self._key('hits'), self._key('misses'), self._key('version'))
+        return {
+            'backend': 'redis',
+            'version': int(version or 0),
+            'hits': int(hits or 0),
+            'misses': int(misses or 0),
+        }
+
+
+def build_cache():
+    """The backend selected by GROROULETTE['CANDIDATE_CACHE_BACKEND'], or None when caching is off."""
+    backend = gro_setting('CANDIDATE_CACHE_BACKEND')
+    ttl = gro_setting('CANDIDATE_CACHE_TTL')
+    if backend == 'local':
+        return LocalLRUCache(gro_setting('CANDIDATE_CACHE_SIZE'), ttl)
+    if backend == 'redis':
+        return RedisCache(gro_setting('CANDIDATE_CACHE_REDIS_URL'), ttl)
+    if backend:
+        raise ValueError(f"Unknown candidate cache backend {backend!r}; expected 'local', 'redis' or None")
+    return None
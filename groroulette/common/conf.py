@@ -0,0 +1,46 @@
+from django.conf import settings
+
+
+# GroRoulette settings
+# Deployments override any of these through a GROROULETTE dict in settings.py,
+# the same way SIMPLE_JWT and REST_FRAMEWORK are configured.
+DEFAULTS = {
+    'OPTIMIZER': 'knapsack',              # 'knapsack' or 'greedy'
+    'OPTIMIZER_TIME_BUDGET_MS': 50,       # wall-clock budget before falling back to greedy
+    'OPTIMIZER_MAX_CELLS': 20000,         # budget resolution of the knapsack table
+    'OPTIMIZER_POOL_SIZE': 256,           # candidates considered by the knapsack solver
+    'MAX_QUANTITY_PER_ITEM': 10,
+    'MAX_ITEMS_PER_SPIN': 50,             # most distinct products one spin may hold; the optimizers clamp to it
+    'CANDIDATE_INDEX_TTL': 300,           # seconds before a process reloads its candidate index
+    'CANDIDATE_CACHE_BACKEND': 'local',   # candidate pool cache: 'local' (per-process LRU), 'redis' or None
+    'CANDIDATE_CACHE_SIZE': 512,          # entries kept by the local backend
+    'CANDIDATE_CACHE_TTL': 300,           # seconds an entry lives
+    'CANDIDATE_CACHE_BUCKET': 5000,       # budgets are rounded up to a multiple of this many naira
+    'CANDIDATE_CACHE_REDIS_URL': 'redis://localhost:6379/1',
+    'SCORE_WEIGHTS': {                    # see groroulette/spins/scoring.py
+        'popularity': 0.3,
+        'rating': 0.25,
+        'value': 0.2,
+        'stock': 0.1,
+        'preference': 0.15,
+    },
+    'SCORE_STOCK_TARGET': 20,             # units on hand that count as fully stocked
+    'SPIN_GENERATION_MODE': 'sync',       # default for POST /spins/ when the client sends no "mode"
+    'SPIN_RESULT_MAX_WAIT': 2,            # longest long-poll on /spins/<id>/result/?wait=, in seconds; each one holds
+                                          # a web worker, so clients poll again on the 202's Retry-After instead
+    'SPIN_BATCH_MAX_SPINS': 12,           # most spins one POST /spins/batch/ may generate
+    'SPIN_PENDING_TIMEOUT_MINUTES': 30,   # async spins still 'pending' after this are marked 'failed'
+    'SPIN_ABANDON_AFTER_HOURS': 48,       # idle generated/selecting spins become 'abandoned' after this
+    'SPIN_ARCHIVE_AFTER_DAYS': 30,        # abandoned spins older than this move to the archive table
+    'SPIN_SWEEP_BATCH_SIZE': 500,         # spins per UPDATE / archive transaction
+    'PREFERENCE_CACHE_TTL': 60,           # seconds a cached UserPreference lives; saves invalidate it sooner, but only
+                                          # in the processes sharing the cache (see CACHES in settings.py)
+    'LEADERBOARD_BACKEND': 'local',       # 'local' (per-process sorted lists) or 'redis' (sorted sets)
+    'LEADERBOARD_REDIS_URL': 'redis://localhost:6379/1',
+    'LEADERBOARD_TTL': 30,                # seconds before a 'local' board reloads to pick up other processes' awards
+    'LEADERBOARD_MAX_LIMIT': 100,         # most rows one leaderboard request may return
+}
+
+
+def gro_setting(name):
+    return getattr(settings, 'GROROULETTE', {}).get(name, DEFAULTS[name])
@@ -0,0 +1,91 @@
+import base64
+import binascii
+import uuid
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+# Keyset Pagination
+# Newest-first pages over (created_at, id). The cursor is the key of the last row on the page,
+# and the next page is "rows strictly after that key", so every page is an index range scan
+# no matter how deep the client has paged, and rows inserted meanwhile never shift a page.
+# The queryset should be backed by an index on (..., created_at, id) matching the ordering.
+class KeysetPagination(BasePagination):
+    page_size = 20
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    fields = ('created_at', 'id')
+    id_type = uuid.UUID  # parses the id half of a cursor; anything it rejects is an invalid cursor
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        size = self.get_page_size(request)
+        time_field, id_field = self.fields
+        queryset = queryset.order_by(f'-{time_field}', f'-{id_field}')
+
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            created_at, pk = cursor
+            queryset = queryset.filter(
+                Q(**{f'{time_field}__lt': created_at}) | Q(**{time_field: created_at, f'{id_field}__lt': pk})
+            )
+
+        rows = list(queryset[:size + 1])
+        self.has_next = len(rows) > size
+        rows = rows[:size]
+        self.last = rows[-1] if rows else None
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            created_at, pk = base64.urlsafe_b64decode(encoded.encode()).decode().split('|', 1)
+            created_at = parse_datetime(created_at)
+            pk = self.id_type(pk)
+        except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+            created_at = None
+        if created_at is None:
+            raise NotFound('Invalid cursor')
+        return created_at, pk
+
+    def encode_cursor(self, row):
+        time_field, id_field = self.fields
+        key = f'{getattr(row, time_field).isoformat()}|{getattr(row, id_field)}'
+        return base64.urlsafe_b64encode(key.encode()).decode()
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.last))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
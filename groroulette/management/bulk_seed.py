@@ -0,0 +1,292 @@
+import itertools
+import json
+import math
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from groroulette.models import Spin, SpinItem, UserPreference
+from groroulette.products.masks import preference_keys
+from marketplace.models import Category, Favorite, Product, ProductRating
+from marketplace.ratings import reconcile_rating_aggregates
+from marketplace.search import search_backend
+from marketplace.versions import bump_versions
+from orders.models import Order, OrderItem
+from profiles.models import BuyerProfile
+
+User = get_user_model()
+
+FIXTURES = Path(__file__).resolve().parent / 'commands'
+
+DIETARY_TAGS = [
+    'Vegan', 'Vegetarian', 'Gluten-Free', 'Dairy-Free', 'Organic', 'High-Fiber', 'High-Protein',
+    'Low-Sugar', 'Nuts', 'Shellfish', 'Halal', 'Plant-Based',
+]
+BRANDS = [f'Brand {letter}' for letter in 'ABCDEFGHIJKLMNOPQRST']
+BUYER_TYPES = (('individual', 70), ('household', 20), ('company', 10))
+SPIN_STATUSES = (('completed', 50), ('generated', 25), ('selecting', 10), ('abandoned', 15))
+
+
+# Bulk Seeder
+# Builds a large, realistic GroRoulette data set for performance work:
+#
+#   products   log-normal prices, Pareto popularity, Zipf-weighted categories and brands
+#   users      buyers with one hashed password shared by all, a BuyerProfile and a UserPreference
+#   spins      a Poisson-ish number per user, items drawn by product popularity, spread over
+#              the last 180 days, with selections, completions and abandonments mixed in
+#   ratings, favourites and orders   for a share of users, over popular products
+#
+# Everything is written with chunked bulk_create, one transaction per chunk, from a single
+# random.Random(seed), so the same arguments always give the same database.
+class BulkSeeder:
+
+    def __init__(self, stdout, seed=42, chunk_size=5000, password='test1234'):
+        self.stdout = stdout
+        self.rng = random.Random(seed)
+        self.chunk_size = chunk_size
+        self.password = password
+        self.now = timezone.now()
+        self.counts = {}
+        self.started = time.monotonic()
+
+    def run(self, products, users, spins_per_user, items_per_spin):
+        categories = self.seed_categories()
+        product_rows = self.seed_products(categories, products)
+        user_ids = self.seed_users(users, categories)
+        self.seed_spins(user_ids, product_rows, spins_per_user, items_per_spin)
+        self.seed_engagement(user_ids, product_rows)
+        return self.counts
+
+    # helpers
+
+    def report(self, label, count):
+        self.counts[label] = self.counts.get(label, 0) + count
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(f'{label}: {self.counts[label]:>10,} ({elapsed:.1f}s)')
+
+    def uuid(self):
+        return uuid.UUID(int=self.rng.getrandbits(128), version=4)
+
+    def zipf_weights(self, size, exponent=1.1):
+        return list(itertools.accumulate(1 / (rank ** exponent) for rank in range(1, size + 1)))
+
+    def past(self, days=180):
+        return self.now - timedelta(seconds=self.rng.randrange(days * 86400))
+
+    def write(self, model, rows, label):
+        for start in range(0, len(rows), self.chunk_size):
+            chunk = rows[start:start + self.chunk_size]
+            with transaction.atomic():
+                model.objects.bulk_create(chunk)
+            self.report(label, len(chunk))
+        return rows
+
+    # catalog
+
+    def seed_categories(self):
+        names = [
+            row['fields']['name']
+            for row in json.loads((FIXTURES / 'categories.json').read_text())
+            if row['model'] == 'marketplace.category'
+        ]
+        existing = set(Category.objects.filter(name__in=names).values_list('name', flat=True))
+        Category.objects.bulk_create(
+            [Category(name=name, description=f'All types of {name.lower()}') for name in names if name not in existing]
+        )
+        return list(Category.objects.order_by('id'))
+
+    def seed_products(self, categories, count):
+        category_weights = self.zipf_weights(len(categories), exponent=0.8)
+        brand_weights = self.zipf_weights(len(BRANDS))
+        rows = []
+        for index in range(count):
+            category = self.rng.choices(categories, cum_weights=category_weights)[0]
+            price = max(Decimal('100'), Decimal(round(self.rng.lognormvariate(7.5, 0.9) / 50) * 50))
+            brand = self.rng.choices(BRANDS, cum_weights=brand_weights)[0] if self.rng.random() < 0.7 else ''
+            dietary_tags = self.rng.sample(DIETARY_TAGS, k=self.rng.choice([0, 1, 1, 2, 3]))
+            rows.append(Product(
+                category=category,
+                name=f'{category.name.split()[0]} item {index + 1}',
+                description=f'Seeded {category.name.lower()} product',
+                price=price,
+                price_unit=self.rng.choice(['per kg', 'per pack', 'per piece', 'per litre']),
+                brand=brand,
+                dietary_tags=dietary_tags,
+                preference_keys=preference_keys(dietary_tags, brand),  # bulk_create skips Product.save
+                stock=self.rng.randrange(0, 300),
+                popularity=min(int(self.rng.paretovariate(1.3)), 10_000),
+            ))
+        self.write(Product, rows, 'products')
+        backend = search_backend()
+        if backend is not None:  # bulk_create skips the search index receivers
+            backend.rebuild()
+        bump_versions('categories', 'products')  # nor the version stamps behind the catalog ETags
+        # (id, price, category name, name, popularity) is all the spin and order generators need
+        return [(p.id, p.price, p.category.name, p.name, p.popularity) for p in rows]
+
+    # people
+
+    def seed_users(self, count, categories):
+        password = make_password(self.password)  # hashing once keeps seeding fast
+        first = User.objects.filter(username__startswith='seed').count()
+        category_ids = [str(category.id) for category in categories]
+        user_ids = []
+        for start in range(0, count, self.chunk_size):
+            users = [
+                User(
+                    username=f'seed{first + index + 1}', email=f'seed{first + index + 1}@example.com',
+                    password=password, role='buyer', date_joined=self.past(365),
+                )
+                for index in range(start, min(start + self.chunk_size, count))
+            ]
+            with transaction.atomic():
+                User.objects.bulk_create(users)
+                BuyerProfile.objects.bulk_create([
+                    BuyerProfile(user=user, buyer_type=self.weighted(BUYER_TYPES)) for user in users
+                ])
+                UserPreference.objects.bulk_create([self.preference(user, category_ids) for user in users])
+            user_ids.extend(user.id for user in users)
+            self.report('users', len(users))
+        return user_ids
+
+    def weighted(self, options):
+        values, weights = zip(*options)
+        return self.rng.choices(values, weights=weights)[0]
+
+    def preference(self, user, category_ids):
+        return UserPreference(
+            id=self.uuid(),
+            user=user,
+            dietary_restrictions=self.rng.choice([[], [], [], ['vegetarian'], ['gluten_free'], ['vegan']]),
+            allergies=self.rng.choice([[], [], [], ['nuts'], ['shellfish'], ['dairy']]),
+            preferred_categories=self.rng.sample(category_ids, k=self.rng.choice([0, 0, 1, 2, 3])),
+            excluded_brands=self.rng.sample(BRANDS, k=self.rng.choice([0, 0, 0, 1])),
+            max_budget_default=Decimal(self.rng.randrange(5, 100) * 1000),
+        )
+
+    # spins
+
+    def seed_spins(self, user_ids, products, spins_per_user, items_per_spin):
+        cum_popularity = list(itertools.accumulate(1 + product[4] for product in products))
+        spins, items = [], []
+        for user_id in user_ids:
+            for _ in range(self.poisson(spins_per_user)):
+                spin, spin_items = self.spin(user_id, products, cum_popularity, items_per_spin)
+                spins.append(spin)
+                items.extend(spin_items)
+            if len(items) >= self.chunk_size * 4:
+                self.flush_spins(spins, items)
+                spins, items = [], []
+        self.flush_spins(spins, items)
+
+    def poisson(self, mean):
+        # Knuth's method; fine for the small means used per user
+        limit, k, product = math.exp(-mean), 0, self.rng.random()
+        while product > limit:
+            k += 1
+            product *= self.rng.random()
+        return k
+
+    def spin(self, user_id, products, cum_popularity, items_per_spin):
+        status = self.weighted(SPIN_STATUSES)
+        created_at = self.past()
+        size = max(1, min(len(products), int(self.rng.gauss(items_per_spin, items_per_spin / 4))))
+        picks = {products[index][0]: products[index] for index in self.choose(cum_popularity, size)}
+        max_items = self.rng.randint(min(3, len(picks)), len(picks))
+        spin = Spin(
+            id=self.uuid(), user_id=user_id, currency='NGN', status=status, max_items_to_select=max_items,
+            created_at=created_at,
+        )
+        selected = set()
+        if status in ('selecting', 'completed'):
+            spin.selection_started_at = created_at + timedelta(minutes=self.rng.randint(1, 30))
+            selected = set(self.rng.sample(list(picks), k=self.rng.randint(0 if status == 'selecting' else 1, max_items)))
+        if status == 'completed':
+            spin.completed_at = spin.selection_started_at + timedelta(minutes=self.rng.randint(1, 60))
+
+        items = []
+        for position, (product_id, price, category_name, name, _) in enumerate(picks.values(), start=1):
+            quantity = self.rng.choice([1, 1, 1, 2, 2, 3])
+            items.append(SpinItem(
+                id=self.uuid(), spin=spin, product_id=product_id, name=name, price=price, unit_price=price,
+                quantity=quantity, total_price=price * quantity, position_in_spin=position,
+                category_name=category_name, is_selected=product_id in selected,
+                selected_at=spin.selection_started_at if product_id in selected else None,
+            ))
+        spin.total_items_generated = len(items)
+        spin.total_value = sum((item.total_price for item in items), Decimal('0'))
+        spin.budget = (spin.total_value * Decimal(self.rng.uniform(1.0, 1.3))).quantize(Decimal('1'))
+        spin.selected_count = len(selected)
+        return spin, items
+
+    def choose(self, cum_weights, size):
+        indices = set()
+        while len(indices) < size:
+            indices.update(
+                self.rng.choices(range(len(cum_weights)), cum_weights=cum_weights, k=size - len(indices))
+            )
+        return sorted(indices)
+
+    def flush_spins(self, spins, items):
+        with transaction.atomic(), keep_timestamps(Spin):
+            Spin.objects.bulk_create(spins, batch_size=self.chunk_size)
+            SpinItem.objects.bulk_create(items, batch_size=self.chunk_size)
+        self.report('spins', len(spins))
+        self.report('spin items', len(items))
+
+    # ratings, favourites, orders
+
+    def seed_engagement(self, user_ids, products):
+        cum_popularity = list(itertools.accumulate(1 + product[4] for product in products))
+        ratings, favorites, orders = [], [], []
+        for user_id in user_ids:
+            if self.rng.random() < 0.4:
+                for index in self.choose(cum_popularity, min(len(products), self.rng.randint(1, 8))):
+                    ratings.append(ProductRating(
+                        product_id=products[index][0], user_id=user_id, rating=self.weighted(((5, 40), (4, 30), (3, 15), (2, 8), (1, 7))),
+                        created_at=self.past(),
+                    ))
+            if self.rng.random() < 0.3:
+                for index in self.choose(cum_popularity, min(len(products), self.rng.randint(1, 5))):
+                    favorites.append(Favorite(product_id=products[index][0], user_id=user_id, created_at=self.past()))
+            if self.rng.random() < 0.5:
+                for _ in range(self.poisson(1.5)):
+                    lines = [products[index] for index in self.choose(cum_popularity, min(len(products), self.rng.randint(1, 6)))]
+                    orders.append((Order(user_id=user_id, status='completed', created_at=self.past()), lines))
+
+        with keep_timestamps(ProductRating, Favorite, Order):
+            self.write(ProductRating, ratings, 'ratings')
+            reconcile_rating_aggregates(batch_size=self.chunk_size)  # bulk_create skips the rating receivers
+            self.write(Favorite, favorites, 'favorites')
+            for start in range(0, len(orders), self.chunk_size):
+                chunk = orders[start:start + self.chunk_size]
+                with transaction.atomic():
+                    Order.objects.bulk_create([order for order, _ in chunk])
+                    OrderItem.objects.bulk_create([
+                        OrderItem(order=order, product_id=product_id, quantity=self.rng.randint(1, 4), price=price)
+                        for order, lines in chunk
+                        for product_id, price, *_ in lines
+                    ])
+                self.report('orders', len(chunk))
+
+
+@contextmanager
+def keep_timestamps(*models):
+    """Let bulk_create keep the created_at values set on seeded rows instead of stamping 'now'."""
+    fields = [model._meta.get_field('created_at') for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
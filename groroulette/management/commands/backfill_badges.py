@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from groroulette.badges.engine import BadgeEngine
+from groroulette.models import BadgeProgress, Spin
+
+
+class Command(BaseCommand):
+    help = 'Replay completed spins, oldest first, into badge progress counters and award any badges earned'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Spins replayed per transaction')
+        parser.add_argument('--reset', action='store_true', help='Recount every completed spin from zero')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            self.stdout.write('Resetting badge progress...')
+            BadgeProgress.objects.all().delete()
+            Spin.objects.filter(badges_recorded=True).update(badges_recorded=False)
+
+        engine = BadgeEngine()
+        pending = Spin.objects.filter(status='completed', badges_recorded=False).order_by('completed_at', 'created_at', 'id')
+        replayed = awarded = 0
+        while True:
+            batch = list(pending.only('id', 'user_id', 'budget', 'max_items_to_select')[:options['batch_size']])
+            if not batch:
+                break
+            awarded += len(engine.record_batch(batch))
+            replayed += len(batch)
+            self.stdout.write(f'Replayed {replayed} spins')
+
+        self.stdout.write(self.style.SUCCESS(f'Replayed {replayed} spins, awarded {awarded} badges'))
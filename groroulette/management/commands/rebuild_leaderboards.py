@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from groroulette.badges.leaderboard import rebuild_scores
+
+
+class Command(BaseCommand):
+    help = 'Recompute every leaderboard score from awarded badges and reload the leaderboards'
+
+    def handle(self, *args, **options):
+        rows = rebuild_scores()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} leaderboard scores'))
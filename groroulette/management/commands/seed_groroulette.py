@@ -1,6 +1,9 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
-from groroulette.models import UserPreference, Spin, SpinItem, Basket, Badge, UserBadge
+from django.contrib.auth.hashers import make_password
+from groroulette.models import UserPreference, Spin, SpinItem, Badge, UserBadge
+from groroulette.management.bulk_seed import BulkSeeder
+from orders.models import Basket
 from marketplace.models import Product, Category
 from decimal import Decimal
 import random
@@ -15,8 +18,17 @@ class Command(BaseCommand):
         parser.add_argument('--users', type=int, default=5, help='Number of test users to create')
         parser.add_argument('--spins', type=int, default=10, help='Number of spins to create per user')
         parser.add_argument('--clear', action='store_true', help='Clear existing data first')
+        # Bulk mode: a large, deterministic data set for load testing (see groroulette/management/bulk_seed.py)
+        parser.add_argument('--bulk', action='store_true', help='Seed with chunked bulk inserts at load-test scale')
+        parser.add_argument('--products', type=int, default=5000, help='Bulk mode: products to create')
+        parser.add_argument('--items-per-spin', type=int, default=10, help='Bulk mode: average items per spin')
+        parser.add_argument('--seed', type=int, default=42, help='Bulk mode: random seed')
+        parser.add_argument('--chunk-size', type=int, default=5000, help='Bulk mode: rows per bulk insert')
 
     def handle(self, *args, **options):
+        if options['bulk']:
+            return self.handle_bulk(options)
+
         if options['clear']:
             self.stdout.write('Clearing existing data...')
             SpinItem.objects.all().delete()
@@ -56,7 +68,7 @@ class Command(BaseCommand):
             user, created = User.objects.get_or_create(
                 username=username,
                 email=email,
-                defaults={'password': 'pbkdf2_sha256$260000$test123'}  # password: test123
+                defaults={'password': make_password('test1234'), 'role': 'buyer'}  # password: test1234
             )
             if created:
                 UserPreference.objects.get_or_create(
@@ -75,7 +87,7 @@ class Command(BaseCommand):
         users = User.objects.filter(is_superuser=False)
         products = list(Product.objects.all())
         for user in users:
-            user_pref = getattr(user, 'preferences', None)
+            user_pref = user.preferences.first()  # UserPreference.user is a ForeignKey, so this is a manager
             for s in range(spins_per_user):
                 budget = user_pref.max_budget_default if user_pref else Decimal('50000')
                 spin = Spin.objects.create(
@@ -107,4 +119,20 @@ class Command(BaseCommand):
                 spin.total_items_generated = len(selected_products)
                 spin.total_value = sum([item.price for item in spin.items.all()])
                 spin.save()
-                self.stdout.write(f'Created spin for user {user.username} with {len(selected_products)} items')
\ No newline at end of file
+                self.stdout.write(f'Created spin for user {user.username} with {len(selected_products)} items')
+
+    def handle_bulk(self, options):
+        if options['products'] < 1:
+            self.stderr.write('--products must be at least 1')
+            return
+        spin_items = options['users'] * options['spins'] * options['items_per_spin']
+        self.stdout.write(f"Bulk seeding about {spin_items:,} spin items (seed {options['seed']})...")
+        counts = BulkSeeder(self.stdout, seed=options['seed'], chunk_size=options['chunk_size']).run(
+            products=options['products'],
+            users=options['users'],
+            spins_per_user=options['spins'],
+            items_per_spin=options['items_per_spin'],
+        )
+        self.create_badges()
+        summary = ', '.join(f'{count:,} {label}' for label, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Bulk seeded {summary}'))
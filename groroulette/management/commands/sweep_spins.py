@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from groroulette.services import SpinArchiveService
+
+
+class Command(BaseCommand):
+    help = 'Fail stuck pending spins, mark stale spins as abandoned and move old abandoned spins to the archive table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None, help='Spins per UPDATE / archive transaction')
+        parser.add_argument('--skip-archive', action='store_true', help='Only mark stale spins as abandoned')
+
+    def handle(self, *args, **options):
+        service = SpinArchiveService(batch_size=options['batch_size'])
+        failed = service.fail_stale_pending()
+        self.stdout.write(f'Marked {failed} stuck pending spins as failed')
+        abandoned = service.mark_abandoned()
+        self.stdout.write(f'Marked {abandoned} spins as abandoned')
+        if not options['skip_archive']:
+            archived = service.archive()
+            self.stdout.write(f'Archived {archived} abandoned spins')
+        self.stdout.write(self.style.SUCCESS('Spin sweep complete'))
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.5 on 2026-10-17 23:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("groroulette", "0006_delete_basket"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="spin",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "Pending"),
+                    ("failed", "Failed"),
+                    ("generated", "Generated"),
+                    ("selecting", "Selecting"),
+                    ("completed", "Completed"),
+                    ("abandoned", "Abandoned"),
+                ],
+                default="generated",
+                max_length=20,
+            ),
+        ),
+    ]
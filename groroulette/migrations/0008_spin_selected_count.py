@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-17 23:27
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_selected_items(apps, schema_editor):
+    Spin = apps.get_model("groroulette", "Spin")
+    SpinItem = apps.get_model("groroulette", "SpinItem")
+    selected = (
+        SpinItem.objects.filter(spin=OuterRef("pk"), is_selected=True)
+        .values("spin")
+        .annotate(total=Count("pk"))
+        .values("total")
+    )
+    Spin.objects.update(selected_count=Coalesce(Subquery(selected), 0))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("groroulette", "0007_spin_pending_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="spin",
+            name="selected_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_selected_items, migrations.RunPython.noop),
+    ]
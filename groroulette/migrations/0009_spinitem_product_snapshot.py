@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-17 23:28
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def copy_product_details(apps, schema_editor):
+    SpinItem = apps.get_model("groroulette", "SpinItem")
+    Product = apps.get_model("marketplace", "Product")
+    product = Product.objects.filter(pk=OuterRef("product_id"))
+    SpinItem.objects.update(
+        category_name=Coalesce(Subquery(product.values("category__name")[:1]), models.Value("")),
+        product_image=Subquery(product.values("image")[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("groroulette", "0008_spin_selected_count"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="spinitem",
+            name="category_name",
+            field=models.CharField(blank=True, default="", max_length=100),
+        ),
+        migrations.AddField(
+            model_name="spinitem",
+            name="product_image",
+            field=models.ImageField(blank=True, null=True, upload_to="product_images/"),
+        ),
+        migrations.RunPython(copy_product_details, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.5 on 2026-10-17 23:29
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("groroulette", "0009_spinitem_product_snapshot"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="spin",
+            index=models.Index(
+                fields=["user", "-created_at", "-id"], name="spins_user_created_id_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.5 on 2026-10-17 23:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("groroulette", "0011_archived_spin"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="spin",
+            name="badges_recorded",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name="BadgeProgress",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("spins_completed", models.PositiveIntegerField(default=0)),
+                ("categories", models.JSONField(default=list)),
+                ("budget_streak", models.PositiveIntegerField(default=0)),
+                ("best_budget_streak", models.PositiveIntegerField(default=0)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="badge_progress",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "badge_progress",
+            },
+        ),
+    ]
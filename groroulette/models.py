@@ -1,5 +1,6 @@
 from django.db import models
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 import uuid
 from marketplace.models import Product
 
@@ -30,6 +31,8 @@ class UserPreference(models.Model):
 # The Spin model tracks the user, budget, preferences, and whether the spin is completed.
 class Spin(models.Model):
     STATUS_CHOICES = [
+        ('pending', 'Pending'),  # Spin accepted, items being generated by a worker (async mode)
+        ('failed', 'Failed'),  # Async generation failed
         ('generated', 'Generated'),  # Spin created, items generated
         ('selecting', 'Selecting'),  # User is selecting items
         ('completed', 'Completed'),  # User completed selection
@@ -43,16 +46,22 @@ class Spin(models.Model):
     total_items_generated = models.IntegerField(default=0)
     total_value = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     max_items_to_select = models.PositiveIntegerField(default=5)
+    selected_count = models.PositiveIntegerField(default=0)  # items with is_selected=True, see SpinSelectionService
     preferences = models.ForeignKey(UserPreference, on_delete=models.SET_NULL, null=True, blank=True)
     preferences_snapshot = models.JSONField(default=dict)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='generated')
     selection_started_at = models.DateTimeField(null=True, blank=True)
     completed_at = models.DateTimeField(null=True, blank=True)
+    badges_recorded = models.BooleanField(default=False)  # counted in BadgeProgress, see groroulette/badges
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         db_table = 'spins'
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of a user's spin history (see groroulette/common/pagination.py)
+            models.Index(fields=['user', '-created_at', '-id'], name='spins_user_created_id_idx'),
+        ]
 
     def __str__(self):
         return f"Spin {self.id} - {self.user.username} - {self.budget} {self.currency}"
@@ -69,6 +78,9 @@ class SpinItem(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     spin = models.ForeignKey(Spin, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE) # Reference to product in marketplace app
+    # Copied from the product when the item is created, so listing spins never joins products or categories
+    category_name = models.CharField(max_length=100, blank=True, default='')
+    product_image = models.ImageField(upload_to='product_images/', blank=True, null=True)
     name = models.CharField(max_length=255)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     price_unit = models.CharField(max_length=50, blank=True, null=True)
@@ -90,6 +102,24 @@ class SpinItem(models.Model):
 
 
 
+# Archived Spin Model
+# Compact archive tier for abandoned spins. SpinArchiveService moves spins that were abandoned
+# past the retention window here: one row per spin, with the spin and all of its items
+# serialized into `payload`, so the live spins/spin_items tables only hold recent spins.
+class ArchivedSpin(models.Model):
+    id = models.UUIDField(primary_key=True, editable=False)  # the original Spin id
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='archived_spins')
+    status = models.CharField(max_length=20)
+    created_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+
+    class Meta:
+        db_table = 'spins_archive'
+        ordering = ['-created_at']
+
+
+
 # Badge Model
 # Represents a badge that can be awarded to users based on their spins or achievements.
 # This model allows for gamification of the user experience, rewarding users for participation.
@@ -126,4 +156,35 @@ class UserBadge(models.Model):
 
     class Meta:
         unique_together = ['user', 'badge', 'spin']
-        db_table = 'user_badges'
\ No newline at end of file
+        db_table = 'user_badges'
+
+
+# Badge Progress Model
+# Running per-user counters the badge rules are evaluated against (see groroulette/badges).
+# They are advanced once per completed spin, so awarding badges never scans a user's history.
+class BadgeProgress(models.Model):
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='badge_progress')
+    spins_completed = models.PositiveIntegerField(default=0)
+    categories = models.JSONField(default=list)  # distinct category names selected so far
+    budget_streak = models.PositiveIntegerField(default=0)  # consecutive completed spins that used the budget well
+    best_budget_streak = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'badge_progress'
+
+
+# Leaderboard Score Model
+# Materialized badge point totals, one row per (board, user), e.g. board 'global',
+# 'week:2026-W07' or 'buyer:household'. Rows are advanced by groroulette/badges/leaderboard.py
+# whenever badges are awarded, so boards are never computed with a GROUP BY over user_badges.
+class LeaderboardScore(models.Model):
+    board = models.CharField(max_length=40)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='leaderboard_scores')
+    points = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'leaderboard_scores'
+        unique_together = ['board', 'user']
+        indexes = [models.Index(fields=['board', '-points'], name='leaderboard_board_points_idx')]
@@ -0,0 +1,77 @@
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .common.conf import gro_setting
+from .models import UserPreference
+
+
+# Preference Accessor
+# One place to load a user's UserPreference, in two layers:
+#
+#   request_preferences(request)  memoized on the request, so a view, its serializers and the
+#                                 services they call share one object
+#   load_preferences(user)        Django cache entry shared by every request and worker
+#
+# Cache keys carry a per-user version that the UserPreference receivers in groroulette/signals.py
+# bump on every save or delete, both straight away and again on commit. A reader that loaded the
+# old row just before a save can only store it under the version that is already dead. Bumps only
+# reach processes sharing the cache (DJANGO_CACHE_REDIS_URL); elsewhere PREFERENCE_CACHE_TTL bounds
+# how stale a copy gets. Both are for reads: anything that writes the row, or runs in a Celery
+# worker, loads it from the database.
+def _version_key(user_id):
+    return f'groroulette:pref:{user_id}:version'
+
+
+def _version(user_id):
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # A fresh stamp, so an evicted version never brings back entries written under an old one
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _entry_key(user_id, version):
+    return f'groroulette:pref:{user_id}:{version}'
+
+
+def load_preferences(user, create=True):
+    """The user's UserPreference, created if missing (or None when create=False)."""
+    version = _version(user.pk)
+    key = _entry_key(user.pk, version)
+    user_pref = cache.get(key)
+    if user_pref is None:
+        if create:
+            user_pref, created = UserPreference.objects.get_or_create(user=user)
+            if created:  # our own insert bumped the version; the row we hold is the newest
+                key = _entry_key(user.pk, _version(user.pk))
+        else:
+            user_pref = UserPreference.objects.filter(user=user).first()
+            if user_pref is None:
+                return None
+        cache.set(key, user_pref, gro_setting('PREFERENCE_CACHE_TTL'))
+    return user_pref
+
+
+def request_preferences(request, create=True):
+    """load_preferences(request.user), at most once per request."""
+    request = getattr(request, '_request', request)  # memoize on the HttpRequest behind a DRF Request
+    user_pref = getattr(request, '_groroulette_preferences', None)
+    if user_pref is None:
+        user_pref = load_preferences(request.user, create=create)
+        request._groroulette_preferences = user_pref
+    return user_pref
+
+
+def invalidate_preferences(user_id):
+    def bump():
+        try:
+            cache.incr(_version_key(user_id))
+        except ValueError:  # no version stored; the next reader starts a fresh one
+            pass
+
+    bump()
+    transaction.on_commit(bump)
@@ -0,0 +1,27 @@
+from rest_framework.filters import BaseFilterBackend
+
+from groroulette.preferences import request_preferences
+from .masks import PreferenceMask
+
+
+# Preference Filter
+# Product list filter backend that applies the requesting user's GroRoulette dietary
+# restrictions, allergies and excluded brands when the client asks for it:
+#   GET /api/marketplace/products/?match_preferences=true
+# The matching is done by the database against Product.preference_keys, so the result never
+# depends on which products this process's candidate index has loaded.
+class PreferenceFilter(BaseFilterBackend):
+    query_param = 'match_preferences'
+
+    def filter_queryset(self, request, queryset, view):
+        if request.query_params.get(self.query_param, '').lower() not in ('1', 'true', 'yes'):
+            return queryset
+        if not request.user or not request.user.is_authenticated:
+            return queryset
+
+        user_pref = request_preferences(request, create=False)
+        preferences = PreferenceMask.from_preference(user_pref)
+        if not preferences:
+            return queryset
+
+        return preferences.filter(queryset)
@@ -0,0 +1,234 @@
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from itertools import repeat
+
+import numpy as np
+
+from marketplace.models import Product
+from groroulette.common.conf import gro_setting
+from groroulette.spins.optimizer import to_kobo
+from .masks import brand_code, tag_mask, to_words, words_needed
+
+
+# Field order of the rows returned by CandidateIndex.lookup()
+ROW_FIELDS = ('product_id', 'price', 'stock', 'popularity', 'rating', 'category_id')
+
+
+# Category Columns
+# The products of one category kept as parallel arrays sorted by price, so "everything this
+# budget can afford" is a bisect followed by a slice. Tag masks and brand codes are NumPy
+# arrays in the same order so preference filtering runs over a whole slice at once.
+class CategoryColumns:
+    __slots__ = ('category_id', 'prices', 'ids', 'stock', 'popularity', 'rating', 'tags', 'brands')
+
+    def __init__(self, category_id, width):
+        self.category_id = category_id
+        self.prices = []
+        self.ids = []
+        self.stock = []
+        self.popularity = []
+        self.rating = []
+        self.tags = np.zeros((0, width), dtype=np.uint64)
+        self.brands = np.zeros(0, dtype=np.int64)
+
+    def columns(self):
+        return (self.prices, self.ids, self.stock, self.popularity, self.rating)
+
+    def insert(self, product_id, price, stock, popularity, rating, tags, brand):
+        index = bisect_right(self.prices, price)
+        self.prices.insert(index, price)
+        self.ids.insert(index, product_id)
+        self.stock.insert(index, stock)
+        self.popularity.insert(index, popularity)
+        self.rating.insert(index, rating)
+        self.tags = np.insert(self.tags, index, to_words([tags], self.tags.shape[1]), axis=0)
+        self.brands = np.insert(self.brands, index, brand)
+
+    def position(self, product_id, price):
+        index = bisect_left(self.prices, price)
+        while self.ids[index] != product_id:
+            index += 1
+        return index
+
+    def remove(self, product_id, price):
+        index = self.position(product_id, price)
+        for column in self.columns():
+            del column[index]
+        self.tags = np.delete(self.tags, index, axis=0)
+        self.brands = np.delete(self.brands, index)
+
+    def widen(self, width):
+        extra = width - self.tags.shape[1]
+        if extra > 0:
+            self.tags = np.pad(self.tags, ((0, 0), (0, extra)))
+
+    def affordable(self, budget, mask=None):
+        end = bisect_right(self.prices, budget)
+        if mask is None:
+            return zip(
+                self.ids[:end], self.prices[:end], self.stock[:end], self.popularity[:end], self.rating[:end],
+                repeat(self.category_id, end),
+            )
+        keep = np.flatnonzero(mask.matches(self.tags[:end], self.brands[:end])).tolist()
+        return (
+            (self.ids[i], self.prices[i], self.stock[i], self.popularity[i], self.rating[i], self.category_id)
+            for i in keep
+        )
+
+
+# Candidate Index
+# In-process copy of the columns spin generation needs: (product_id, price_in_kobo, stock,
+# popularity, average rating, tag mask, brand code) per category. It is loaded lazily from
+# the database on first use, then kept current by the Product and ProductRating receivers in
+# groroulette/signals.py. Every change bumps `version`.
+#
+# Each process holds its own copy and only hears about saves made in that process, so the index
+# reloads itself once it is older than GROROULETTE['CANDIDATE_INDEX_TTL'] seconds. Writes that
+# skip signals (QuerySet.update, raw SQL) should call clear() to force a reload.
+class CandidateIndex:
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._categories = None
+        self._products = {}  # product_id -> (category_id, price)
+        self._width = 1
+        self._loaded_at = 0
+        self.version = 0
+
+    def clear(self):
+        with self._lock:
+            self._categories = None
+            self._products = {}
+            self.version += 1
+
+    def rebuild(self):
+        staged = {}
+        products = {}
+        rows = Product.objects.values_list(
+            'id', 'category_id', 'price', 'stock', 'popularity', 'rating_sum', 'rating_count', 'dietary_tags', 'brand'
+        )
+        for row in rows.iterator(chunk_size=2000):
+            product_id, category_id, price, stock, popularity, rating_sum, rating_count, tags, brand = row
+            price = to_kobo(price)
+            rating = rating_sum / rating_count if rating_count else 0.0
+            staged.setdefault(category_id, []).append(
+                (price, product_id, stock, popularity, rating, tag_mask(tags), brand_code(brand))
+            )
+            products[product_id] = (category_id, price)
+
+        width = words_needed()
+        categories = {}
+        for category_id, entries in staged.items():
+            entries.sort(key=lambda entry: entry[0])
+            columns = categories[category_id] = CategoryColumns(category_id, width)
+            prices, ids, stock, popularity, rating, tags, brands = zip(*entries)
+            columns.prices, columns.ids = list(prices), list(ids)
+            columns.stock, columns.popularity, columns.rating = list(stock), list(popularity), list(rating)
+            columns.tags = to_words(tags, width)
+            columns.brands = np.array(brands, dtype=np.int64)
+
+        with self._lock:
+            self._categories = categories
+            self._products = products
+            self._width = width
+            self._loaded_at = time.monotonic()
+            self.version += 1
+
+    def _ensure_loaded(self):
+        ttl = gro_setting('CANDIDATE_INDEX_TTL')
+        if self._categories is None or (ttl and time.monotonic() - self._loaded_at > ttl):
+            self.rebuild()
+
+    def _ensure_width(self):
+        # New tags can push the vocabulary past the words each mask row was built with
+        width = words_needed()
+        if width > self._width:
+            for columns in self._categories.values():
+                columns.widen(width)
+            self._width = width
+
+    def upsert(self, product_id, category_id, price, stock, popularity, dietary_tags=(), brand=''):
+        """
+        Returns False when only popularity changed, True when the product is new or its price,
+        stock, category, tags or brand moved (or nothing is loaded to compare against).
+        """
+        with self._lock:
+            if self._categories is None:
+                return True  # nothing loaded yet; the first lookup reads the current rows
+            tags = tag_mask(dietary_tags)
+            brand = brand_code(brand)
+            self._ensure_width()
+            changed = self._differs(product_id, category_id, price, stock, tags, brand)
+            rating = self._discard(product_id)
+            columns = self._categories.get(category_id)
+            if columns is None:
+                columns = self._categories[category_id] = CategoryColumns(category_id, self._width)
+            columns.insert(product_id, price, stock, popularity, rating, tags, brand)
+            self._products[product_id] = (category_id, price)
+            self.version += 1
+            return changed
+
+    def _differs(self, product_id, category_id, price, stock, tags, brand):
+        previous = self._products.get(product_id)
+        if previous != (category_id, price):
+            return True
+        columns = self._categories[category_id]
+        index = columns.position(product_id, price)
+        return (
+            columns.stock[index] != stock
+            or columns.brands[index] != brand
+            or (columns.tags[index] != to_words([tags], self._width)[0]).any()
+        )
+
+    def set_rating(self, product_id, rating):
+        with self._lock:
+            if self._categories is None or product_id not in self._products:
+                return
+            category_id, price = self._products[product_id]
+            columns = self._categories[category_id]
+            columns.rating[columns.position(product_id, price)] = float(rating or 0)
+            self.version += 1
+
+    def remove(self, product_id):
+        with self._lock:
+            if self._categories is None:
+                return
+            self._discard(product_id)
+            self.version += 1
+
+    def _discard(self, product_id):
+        # Returns the rating that was stored, which a product save has no way of knowing
+        previous = self._products.pop(product_id, None)
+        if previous is None:
+            return 0.0
+        category_id, price = previous
+        columns = self._categories[category_id]
+        rating = columns.rating[columns.position(product_id, price)]
+        columns.remove(product_id, price)
+        return rating
+
+    def _columns(self, category_ids):
+        if category_ids:
+            keys = {int(pk) for pk in category_ids if str(pk).isdigit()}
+            return [self._categories[pk] for pk in keys if pk in self._categories]
+        return list(self._categories.values())
+
+    def lookup(self, budget, category_ids=None, exclude_ids=(), preferences=None):
+        """
+        Rows laid out as ROW_FIELDS, priced at or under `budget` kobo, restricted to
+        `category_ids` when given, passing the `preferences` PreferenceMask when given and
+        never including `exclude_ids`.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            self._ensure_width()
+            mask = preferences.compile(self._width) if preferences else None
+            rows = [row for column in self._columns(category_ids) for row in column.affordable(budget, mask)]
+        if exclude_ids:
+            exclude_ids = set(exclude_ids)
+            rows = [row for row in rows if row[0] not in exclude_ids]
+        return rows
+
+
+candidate_index = CandidateIndex()
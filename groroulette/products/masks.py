@@ -0,0 +1,180 @@
+import re
+import threading
+
+import numpy as np
+from django.db.models import Q
+
+
+# Product Masks
+# Dietary tags are compiled into bitmasks so that preference filtering is a bitwise AND over an
+# array instead of a JSON lookup per product. Every distinct tag gets a bit in a process-wide
+# vocabulary; a product's tags become a row of uint64 words, so the candidate index can hold
+# the masks for a whole category as one (products x words) array. Brands are dictionary
+# encoded the same way, as one integer code per product.
+#
+# Tags are normalised before lookup, so "Gluten-Free", "gluten free" and "gluten_free" are the
+# same bit, and a few tags imply others (a vegan product satisfies a vegetarian restriction).
+WORD_BITS = 64
+
+IMPLIED_TAGS = {
+    'vegan': ('vegetarian', 'dairy_free', 'plant_based'),
+    'plant_based': ('vegetarian',),
+    'lactose_free': ('dairy_free',),
+}
+
+
+def normalize(value):
+    return re.sub(r'[\s\-]+', '_', str(value).strip().lower())
+
+
+class Vocabulary:
+    """Grow-only mapping of normalised names to small integers, starting at `first`."""
+
+    def __init__(self, first=0):
+        self._lock = threading.Lock()
+        self._codes = {}
+        self._first = first
+
+    def __len__(self):
+        return len(self._codes)
+
+    def code(self, value, create=True):
+        key = normalize(value)
+        code = self._codes.get(key)
+        if code is None and create and key:
+            with self._lock:
+                code = self._codes.setdefault(key, self._first + len(self._codes))
+        return code
+
+
+tag_vocabulary = Vocabulary()
+brand_vocabulary = Vocabulary(first=1)  # 0 means "no brand" and is never excluded
+
+
+def tag_mask(tags):
+    """Bitmask (a Python int) for a product's dietary tags, including implied tags."""
+    mask = 0
+    for tag in tags or ():
+        key = normalize(tag)
+        for name in (key,) + IMPLIED_TAGS.get(key, ()):
+            code = tag_vocabulary.code(name)
+            if code is not None:
+                mask |= 1 << code
+    return mask
+
+
+def preference_keys(tags, brand):
+    """Product.preference_keys: the normalised tags (with implied tags) and brand of a product as
+    '|tag:vegan|tag:vegetarian|brand:dangote|', so the database can match a PreferenceMask with
+    plain substring lookups."""
+    keys = set()
+    for tag in tags or ():
+        key = normalize(tag)
+        if key:
+            keys.update(f'tag:{name}' for name in (key,) + IMPLIED_TAGS.get(key, ()))
+    if normalize(brand or ''):
+        keys.add(f'brand:{normalize(brand)}')
+    return '|' + ''.join(f'{key.replace("|", "_")}|' for key in sorted(keys)) if keys else ''
+
+
+def brand_code(brand):
+    return brand_vocabulary.code(brand or '') or 0
+
+
+def words_needed():
+    return max(1, -(-len(tag_vocabulary) // WORD_BITS))
+
+
+def to_words(masks, width):
+    """Split Python int masks into a (len(masks), width) uint64 array."""
+    low = (1 << WORD_BITS) - 1
+    return np.array(
+        [[(mask >> (WORD_BITS * word)) & low for word in range(width)] for mask in masks],
+        dtype=np.uint64,
+    ).reshape(len(masks), width)
+
+
+# Preference Mask
+# The exclusion half of a UserPreference, compiled against the vocabularies:
+#   dietary_restrictions  every one of these tags is required
+#   allergies             any of these tags excludes the product
+#   excluded_brands       products of these brands are excluded
+# A restriction no product has ever been tagged with cannot be satisfied, so it matches nothing.
+# compile() checks the mask against the candidate index for spins; filter() checks it against
+# Product.preference_keys for querysets, so it never depends on what one process has loaded.
+class PreferenceMask:
+
+    def __init__(self, dietary_restrictions=(), allergies=(), excluded_brands=()):
+        self.dietary_restrictions = _normalized(dietary_restrictions)
+        self.allergies = _normalized(allergies)
+        self.excluded_brands = _normalized(excluded_brands)
+
+    @classmethod
+    def from_preference(cls, user_pref):
+        if user_pref is None:
+            return cls()
+        return cls(user_pref.dietary_restrictions, user_pref.allergies, user_pref.excluded_brands)
+
+    def __bool__(self):
+        return bool(self.dietary_restrictions or self.allergies or self.excluded_brands)
+
+    def filter(self, queryset):
+        """`queryset` (of Product) narrowed to the products this mask keeps, in the database."""
+        condition = Q()
+        for tag in self.dietary_restrictions:
+            condition &= Q(preference_keys__contains=_key('tag', tag))
+        for tag in self.allergies:
+            condition &= ~Q(preference_keys__contains=_key('tag', tag))
+        for brand in self.excluded_brands:
+            condition &= ~Q(preference_keys__contains=_key('brand', brand))
+        return queryset.filter(condition)
+
+    def compile(self, width):
+        required, forbidden, satisfiable = 0, 0, True
+        for tag in self.dietary_restrictions:
+            code = tag_vocabulary.code(tag, create=False)
+            if code is None:
+                satisfiable = False
+            else:
+                required |= 1 << code
+        for tag in self.allergies:
+            code = tag_vocabulary.code(tag, create=False)
+            if code is not None:
+                forbidden |= 1 << code
+        brands = [brand_vocabulary.code(brand, create=False) for brand in self.excluded_brands]
+        return CompiledMask(
+            to_words([required], width)[0],
+            to_words([forbidden], width)[0],
+            np.array([code for code in brands if code is not None], dtype=np.int64),
+            satisfiable,
+        )
+
+
+def _key(kind, value):
+    return f'|{kind}:{value.replace("|", "_")}|'
+
+
+def _normalized(values):
+    return sorted({normalize(value) for value in values or () if str(value).strip()})
+
+
+class CompiledMask:
+
+    def __init__(self, required, forbidden, brands, satisfiable):
+        self.required = required
+        self.forbidden = forbidden
+        self.brands = brands
+        self.satisfiable = satisfiable
+
+    def matches(self, tags, brands):
+        """Boolean array: which rows of a (n x words) tag array and n brand codes pass."""
+        if not self.satisfiable:
+            return np.zeros(len(brands), dtype=bool)
+        keep = np.ones(len(brands), dtype=bool)
+        if self.required.any():
+            keep &= ((tags & self.required) == self.required).all(axis=1)
+        if self.forbidden.any():
+            keep &= ~(tags & self.forbidden).any(axis=1)
+        if self.brands.size:
+            keep &= ~np.isin(brands, self.brands)
+        return keep
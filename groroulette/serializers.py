@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from .models import UserPreference, Spin, SpinItem, Badge, UserBadge
 from orders.models import Basket, BasketItem
+from .common.conf import gro_setting
 
 # User Preference Serializer
 # This serializer handles the user preferences for spins.
@@ -20,15 +21,20 @@ class UserPreferenceSerializer(serializers.ModelSerializer):
 # Spin Item Serializer
 # This serializer handles the individual items within a spin.
 # It allows users to view and manage the products selected in their spins.
+# Category and image come from the copies stored on the item, so serializing never touches the product.
 class SpinItemSerializer(serializers.ModelSerializer):
     category = serializers.SerializerMethodField()
 
     class Meta:
         model = SpinItem
-        fields = ['id', 'product', 'name', 'price', 'price_unit', 'unit_price', 'quantity', 'position_in_spin', 'is_selected', 'category']
+        fields = [
+            'id', 'product', 'name', 'price', 'price_unit', 'unit_price', 'quantity', 'position_in_spin',
+            'is_selected', 'category', 'product_image'
+        ]
+        read_only_fields = ['product_image']
 
     def get_category(self, obj):
-        return obj.product.category.name if obj.product and obj.product.category else None
+        return obj.category_name or None
 
 
 
@@ -52,6 +58,14 @@ class SpinItemSelectSerializer(serializers.ModelSerializer):
 
 
 
+# Spin Item Bulk Select Serializer
+# Input for POST /spins/<spin_id>/items/select/: the items to change and whether to select or deselect them.
+class SpinItemBulkSelectSerializer(serializers.Serializer):
+    item_ids = serializers.ListField(child=serializers.UUIDField(), allow_empty=False, max_length=500)
+    selected = serializers.BooleanField()
+
+
+
 # Spin Serializer
 # This serializer handles the spin data for the roulette feature.
 # It allows users to view and manage their spins, including budget, preferences, and selected items.
@@ -63,16 +77,66 @@ class SpinSerializer(serializers.ModelSerializer):
         model = Spin
         fields = [
             'id', 'preferences', 'preferences_snapshot', 'budget', 'currency',
-            'total_items_generated', 'total_value', 'max_items_to_select', 'status',
+            'total_items_generated', 'total_value', 'max_items_to_select', 'selected_count', 'status',
             'selection_started_at', 'completed_at', 'created_at', 'user', 'items'
         ]
 
 
+# Spin Summary Serializer
+# The light form of a spin used by the history summary view: totals, status and item counts,
+# with a link to the full spin instead of the nested items and preferences.
+class SpinSummarySerializer(serializers.ModelSerializer):
+    item_count = serializers.IntegerField(read_only=True)
+    selected_item_count = serializers.IntegerField(read_only=True)
+    detail_url = serializers.HyperlinkedIdentityField(view_name='spin-detail', read_only=True)
+
+    class Meta:
+        model = Spin
+        fields = [
+            'id', 'budget', 'currency', 'total_value', 'status', 'item_count', 'selected_item_count',
+            'created_at', 'completed_at', 'detail_url'
+        ]
+
+
 # Create Spin Serializer
 # This serializer is used to create a new spin with a budget and currency.
+# "mode": "async" returns 202 straight away and generates the spin on a Celery worker.
 class CreateSpinSerializer(serializers.Serializer):
     budget = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=1000)
     currency = serializers.CharField(max_length=3, default='NGN')
+    mode = serializers.ChoiceField(choices=['sync', 'async'], required=False)
+
+
+# Create Spin Batch Serializer
+# Input for POST /spins/batch/: either one budget repeated `count` times or a list of budgets,
+# one per spin. distinct_products keeps a product from appearing in more than one spin.
+class CreateSpinBatchSerializer(serializers.Serializer):
+    budget = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=1000, required=False)
+    count = serializers.IntegerField(min_value=1, required=False)
+    budgets = serializers.ListField(
+        child=serializers.DecimalField(max_digits=10, decimal_places=2, min_value=1000),
+        allow_empty=False,
+        required=False,
+    )
+    currency = serializers.CharField(max_length=3, default='NGN')
+    max_items = serializers.IntegerField(min_value=1, default=10)
+    distinct_products = serializers.BooleanField(default=False)
+
+    def validate(self, attrs):
+        if 'budgets' not in attrs:
+            if 'budget' not in attrs or 'count' not in attrs:
+                raise serializers.ValidationError("Provide either 'budgets' or both 'budget' and 'count'.")
+            attrs['budgets'] = [attrs['budget']] * attrs['count']
+        limit = gro_setting('SPIN_BATCH_MAX_SPINS')
+        if len(attrs['budgets']) > limit:
+            raise serializers.ValidationError(f"At most {limit} spins can be generated in one batch.")
+        return attrs
+
+    def validate_max_items(self, value):
+        limit = gro_setting('MAX_ITEMS_PER_SPIN')
+        if value > limit:
+            raise serializers.ValidationError(f"At most {limit} items can be put in one spin.")
+        return value
 
 
 
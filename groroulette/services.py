@@ -1,103 +1,251 @@
-from itertools import product
-from .models import Spin, SpinItem, Badge, UserBadge, Product, UserPreference
+from decimal import Decimal
+from .models import Spin, SpinItem, ArchivedSpin, UserBadge, Product, UserPreference
 from orders.models import Basket, Order, OrderItem, BasketItem
+from marketplace.models import Favorite
+from django.db import transaction
+from django.db.models import F, Q
+from datetime import timedelta
 from django.utils import timezone
+from .badges.engine import BadgeEngine
+from .common.conf import gro_setting
+from .preferences import load_preferences
+from .products.index import candidate_index
+from .products.masks import PreferenceMask
+from .spins.optimizer import Candidate, get_optimizer, to_kobo
+from .spins.pool import candidate_pool
+from .spins.scoring import SpinScorer
+
+
+# Copy of the user's preferences stored on a spin at creation time
+def preferences_snapshot(user_pref):
+    return {
+        "dietary_restrictions": user_pref.dietary_restrictions,
+        "allergies": user_pref.allergies,
+        "preferred_categories": user_pref.preferred_categories,
+        "excluded_brands": user_pref.excluded_brands,
+        "max_budget_default": str(user_pref.max_budget_default),
+    }
 
 
 # Budget Optimizer Service
 # Handles logic for generating a spin based on user budget, preferences, and other constraints.
 class BudgetOptimizerService:
    
-    def generate_spin(self, user, budget, currency='NGN', max_items=10, retailer_ids=None):
-        user_pref, created = UserPreference.objects.get_or_create(user=user) 
-
-        products = Product.objects.filter(price__lte=budget)
+    def generate_spin(self, user, budget, currency='NGN', max_items=10, retailer_ids=None, user_pref=None):
+        user_pref = user_pref or load_preferences(user)  # views pass the one they already loaded
 
         if not budget:
             budget = user_pref.max_budget_default or 0    # Use budget from request if provided, else fallback to user_pref
-        # To Filter spins by preferred categories if set
-        if user_pref.preferred_categories:
-            products = products.filter(category__pk__in=user_pref.preferred_categories)
-        products = products.order_by('-price')  # Start with most expensive
 
-        selected_items = []
-        total = 0
+        selected_items = self.select_spin_items(user, user_pref, budget, max_items)
+        total = sum((product.price * quantity for product, quantity in selected_items), Decimal('0'))
 
-        # A simple greedy algorithm to select items until budget or max_items is reached
-        for product in products:
-            if len(selected_items) >= max_items:
-                break
-            max_quantity = int((budget - total) // product.price)
-            if max_quantity > 0:
-                quantity = min(max_quantity, 10)  # flexible: You can set a sensible max per item
-                selected_items.append((product, quantity))
-                total += product.price * quantity
+        # One transaction, one INSERT for the spin and one for all of its items
+        with transaction.atomic():
+            spin = Spin.objects.create(
+                user=user,
+                budget=budget,
+                currency=currency,
+                total_items_generated=len(selected_items),
+                total_value=total,
+                max_items_to_select=max_items,
+                preferences=user_pref,
+                preferences_snapshot=preferences_snapshot(user_pref),  # preferences as they were at spin time
+                status='generated',
+                created_at=timezone.now()
+            )
+            SpinItem.objects.bulk_create([
+                self._build_spin_item(spin, product, quantity, position=idx + 1)
+                for idx, (product, quantity) in enumerate(selected_items)
+            ])
+        return spin
 
-   
 
-        spin = Spin.objects.create(
+    # Choose the products and quantities for a spin, as a list of (product, quantity)
+    def select_spin_items(self, user, user_pref, budget, max_items):
+        # Candidates come from the in-process price index (through the candidate pool cache), restricted to preferred categories if set
+        # and filtered by dietary restrictions, allergies and excluded brands, then ranked by SpinScorer.
+        # The optimizer works on (id, price in kobo, score); full product rows are only loaded for the winners
+        budget_kobo = to_kobo(budget)
+        candidates = self._ranked_candidates(user, user_pref, budget_kobo)
+        picks = get_optimizer().solve(
+            candidates, budget_kobo, max_items, gro_setting('MAX_QUANTITY_PER_ITEM')
+        )
+        chosen = Product.objects.select_related('category').in_bulk([candidate.product_id for candidate, _ in picks])
+        return self._resolve(picks, chosen)
+
+    def _ranked_candidates(self, user, user_pref, budget_kobo):
+        rows = candidate_pool.rows(
+            budget_kobo, user_pref.preferred_categories, preferences=PreferenceMask.from_preference(user_pref)
+        )
+        favorite_ids = Favorite.objects.filter(user=user).values_list('product_id', flat=True)
+        scores = SpinScorer().score(rows, user_pref.preferred_categories, favorite_ids)
+        return [Candidate(row[0], row[1], score) for row, score in zip(rows, scores.tolist())]
+
+    def _resolve(self, picks, chosen):
+        return [
+            (chosen[candidate.product_id], quantity)
+            for candidate, quantity in picks
+            if candidate.product_id in chosen  # the index can briefly trail deletes made by other processes
+        ]
+
+
+    # Batch spin generation
+    # Several spins for one user in one go (e.g. one per week for a household or company buyer).
+    # Preferences, favourites and the ranked candidate set are loaded once for the largest budget;
+    # each spin then runs the optimizer over the candidates its own budget can afford. With
+    # distinct_products, a product picked for one spin is not offered to the later ones.
+    # Every spin and item is written with one bulk INSERT each, inside a single transaction.
+    def generate_spin_batch(self, user, budgets, currency='NGN', max_items=10, distinct_products=False, user_pref=None):
+        user_pref = user_pref or load_preferences(user)
+        budgets = [budget or user_pref.max_budget_default or 0 for budget in budgets]
+
+        budgets_kobo = [to_kobo(budget) for budget in budgets]
+        candidates = self._ranked_candidates(user, user_pref, max(budgets_kobo, default=0))
+        optimizer = get_optimizer()
+        max_quantity = gro_setting('MAX_QUANTITY_PER_ITEM')
+
+        used = set()
+        batch_picks = []
+        for budget_kobo in budgets_kobo:
+            available = [
+                candidate for candidate in candidates
+                if candidate.price <= budget_kobo and candidate.product_id not in used
+            ]
+            picks = optimizer.solve(available, budget_kobo, max_items, max_quantity)
+            if distinct_products:
+                used.update(candidate.product_id for candidate, _ in picks)
+            batch_picks.append(picks)
+
+        chosen = Product.objects.select_related('category').in_bulk({candidate.product_id for picks in batch_picks for candidate, _ in picks})
+        snapshot = preferences_snapshot(user_pref)
+        now = timezone.now()
+        spins, items = [], []
+        for budget, picks in zip(budgets, batch_picks):
+            selected_items = self._resolve(picks, chosen)
+            spin = Spin(
+                user=user,
+                budget=budget,
+                currency=currency,
+                total_items_generated=len(selected_items),
+                total_value=sum((product.price * quantity for product, quantity in selected_items), Decimal('0')),
+                max_items_to_select=max_items,
+                preferences=user_pref,
+                preferences_snapshot=snapshot,
+                status='generated',
+                created_at=now,
+            )
+            spins.append(spin)
+            items.extend(
+                self._build_spin_item(spin, product, quantity, position=idx + 1)
+                for idx, (product, quantity) in enumerate(selected_items)
+            )
+
+        with transaction.atomic():
+            Spin.objects.bulk_create(spins)
+            SpinItem.objects.bulk_create(items)
+        return spins
+
+
+    # Async spin generation
+    # The request only records a 'pending' spin; groroulette.tasks.generate_spin_task fills it in on a worker.
+    def create_pending_spin(self, user, budget, currency='NGN', max_items=10):
+        return Spin.objects.create(
             user=user,
             budget=budget,
             currency=currency,
-            total_items_generated=len(selected_items),
-            total_value=total,
             max_items_to_select=max_items,
-            status='generated',
-            created_at=timezone.now()
+            status='pending',
         )
-       
-        for idx, (product, quantity) in enumerate(selected_items):
-            SpinItem.objects.create(
-                spin=spin,
-                product=product,
-                name=product.name,
-                price=product.price,
-                price_unit=product.price_unit,
-                unit_price=product.price,
-                quantity=quantity,
-                position_in_spin=idx + 1,
-                is_selected=False
-            )
+
+    def fill_pending_spin(self, spin_id):
+        with transaction.atomic():
+            # Locking the row makes a retried or duplicated task a no-op
+            spin = Spin.objects.select_for_update().select_related('user').filter(id=spin_id, status='pending').first()
+            if spin is None:
+                return None
+            # Read from the database: a Celery worker may not share the web workers' cache, so it
+            # would never see their invalidations
+            user_pref = UserPreference.objects.get_or_create(user=spin.user)[0]
+            selected_items = self.select_spin_items(spin.user, user_pref, spin.budget, spin.max_items_to_select)
+
+            SpinItem.objects.bulk_create([
+                self._build_spin_item(spin, product, quantity, position=idx + 1)
+                for idx, (product, quantity) in enumerate(selected_items)
+            ])
+            spin.total_items_generated = len(selected_items)
+            spin.total_value = sum((product.price * quantity for product, quantity in selected_items), Decimal('0'))
+            spin.preferences = user_pref
+            spin.preferences_snapshot = preferences_snapshot(user_pref)
+            spin.status = 'generated'
+            spin.save(update_fields=[
+                'total_items_generated', 'total_value', 'preferences', 'preferences_snapshot', 'status'
+            ])
         return spin
     
 
     # Recalculate spin items based on remaining budget
     def recalculate_spin(self, spin):
         user_pref = spin.preferences
-        budget = spin.budget
-        used_value = sum(item.unit_price * item.quantity for item in spin.items.all())
-        remaining_budget = budget - used_value
-
-        # To select new products to fill the remaining budget
-        products = Product.objects.filter(
-            price__lte=remaining_budget,
-            category__pk__in=user_pref.preferred_categories
-        ).exclude(id__in=[item.product.id for item in spin.items.all()])
-
-        products = products.order_by('-price')
-
-        for product in products:
-            if remaining_budget < product.price:
-                continue
-            max_quantity = int(remaining_budget // product.price)
-            if max_quantity > 0:
-                SpinItem.objects.create(
-                    spin=spin,
-                    product=product,
-                    name=product.name,
-                    price=product.price,
-                    price_unit=product.price_unit,
-                    unit_price=product.price,
-                    quantity=max_quantity,
-                    position_in_spin=spin.items.count() + 1,
-                    is_selected=False
-                )
-                remaining_budget -= product.price * max_quantity
-
-        # Update spin total value and items count
-        spin.total_value = sum(item.unit_price * item.quantity for item in spin.items.all())
-        spin.total_items_generated = spin.items.count()
-        spin.save()
+        with transaction.atomic():
+            items = list(spin.items.all())
+            used_value = sum(item.unit_price * item.quantity for item in items)
+            remaining_budget = spin.budget - used_value
+
+            # To select new products to fill the remaining budget
+            preferred_categories = user_pref.preferred_categories if user_pref else []
+            rows = candidate_index.lookup(
+                to_kobo(remaining_budget),
+                preferred_categories,
+                exclude_ids={item.product_id for item in items},
+                preferences=PreferenceMask.from_preference(user_pref),
+            )
+            rows.sort(key=lambda row: row[1], reverse=True)  # most expensive first
+
+            remaining_kobo = to_kobo(remaining_budget)
+            additions = []
+            for product_id, price, *_ in rows:
+                if price <= 0 or remaining_kobo < price:
+                    continue
+                max_quantity = remaining_kobo // price
+                additions.append((product_id, max_quantity))
+                remaining_kobo -= price * max_quantity
+
+            products = Product.objects.select_related('category').in_bulk([product_id for product_id, _ in additions])
+            position = max((item.position_in_spin for item in items), default=0)
+            new_items = []
+            for product_id, max_quantity in additions:
+                product = products.get(product_id)
+                if product is None:
+                    continue
+                position += 1
+                new_items.append(self._build_spin_item(spin, product, max_quantity, position))
+            SpinItem.objects.bulk_create(new_items)
+            items.extend(new_items)
+
+            # Update spin total value and items count
+            spin.total_value = sum(item.unit_price * item.quantity for item in items)
+            spin.total_items_generated = len(items)
+            spin.save(update_fields=['total_value', 'total_items_generated'])
+
+
+    # bulk_create skips SpinItem.save(), so total_price is filled in here.
+    # Expects product.category to be loaded (select_related) so building items costs no queries
+    def _build_spin_item(self, spin, product, quantity, position):
+        return SpinItem(
+            spin=spin,
+            product=product,
+            name=product.name,
+            category_name=product.category.name if product.category_id else '',
+            product_image=product.image.name or None,
+            price=product.price,
+            price_unit=product.price_unit,
+            unit_price=product.price,
+            quantity=quantity,
+            total_price=product.price * quantity,
+            position_in_spin=position,
+            is_selected=False
+        )
 
 
     # Add selected items from a spin to the user's basket/cart
@@ -149,21 +297,172 @@ class BudgetOptimizerService:
     
  
 
+# Selection Errors
+# Raised by SpinSelectionService; the views answer both with a 400.
+#   SelectionLimitExceeded   the items would take the spin past max_items_to_select
+#   SelectionClosed          the spin has not reached its selection phase
+class SelectionLimitExceeded(Exception):
+    pass
+
+
+class SelectionClosed(Exception):
+    pass
+
+
+# Spin Selection Service
+# Selecting and deselecting spin items while keeping Spin.selected_count current.
+# The max_items_to_select check and the counter change are one conditional UPDATE on the spin
+# row, so two concurrent clicks cannot both take the last free slot; the item rows are then
+# flipped with UPDATEs that only match items in the opposite state, so repeating a request
+# never counts an item twice. Items can only be changed once the selection phase has started;
+# the spin's status is read under a row lock, so it cannot change until the items have.
+class SpinSelectionService:
+    selectable_statuses = ('selecting', 'completed')
+
+    def set_selected(self, spin, item_ids, selected):
+        """Select or deselect `item_ids` of `spin` as one unit. Returns the number of items changed."""
+        items = SpinItem.objects.filter(spin=spin, id__in=item_ids)
+        with transaction.atomic():
+            spin_status = Spin.objects.select_for_update().filter(id=spin.id).values_list('status', flat=True).first()
+            if spin_status not in self.selectable_statuses:
+                raise SelectionClosed('Selection phase has not started')
+            if selected:
+                changed = self._select(spin, items)
+            else:
+                changed = items.filter(is_selected=True).update(is_selected=False, selected_at=None)
+                if changed:
+                    Spin.objects.filter(id=spin.id).update(selected_count=F('selected_count') - changed)
+        spin.refresh_from_db(fields=['selected_count'])
+        return changed
+
+    def _select(self, spin, items):
+        wanted = items.filter(is_selected=False).count()
+        if not wanted:
+            return 0
+        reserved = Spin.objects.filter(
+            id=spin.id, selected_count__lte=F('max_items_to_select') - wanted
+        ).update(selected_count=F('selected_count') + wanted)
+        if not reserved:
+            raise SelectionLimitExceeded(f'Maximum {spin.max_items_to_select} items can be selected')
+
+        changed = items.filter(is_selected=False).update(is_selected=True, selected_at=timezone.now())
+        if changed < wanted:
+            # Another request selected some of these items in the meantime; return their slots
+            Spin.objects.filter(id=spin.id).update(selected_count=F('selected_count') - (wanted - changed))
+        return changed
+
+
+# Spin Archive Service
+# Housekeeping for spins that never reach 'completed'. Run it from the sweep_spins management
+# command or the sweep_spins_task Celery beat task.
+#
+#   mark_abandoned   'generated'/'selecting' spins idle for GROROULETTE['SPIN_ABANDON_AFTER_HOURS']
+#                    become 'abandoned'
+#   archive          'abandoned' spins older than GROROULETTE['SPIN_ARCHIVE_AFTER_DAYS'] move to
+#                    ArchivedSpin, one JSON payload per spin, and leave spins/spin_items
+#
+# Both work in batches of GROROULETTE['SPIN_SWEEP_BATCH_SIZE'] spins, each in its own short
+# transaction, so neither holds locks on the live tables for long.
+class SpinArchiveService:
+
+    def __init__(self, batch_size=None):
+        self.batch_size = batch_size or gro_setting('SPIN_SWEEP_BATCH_SIZE')
+
+    def stale_spins(self, now=None):
+        cutoff = (now or timezone.now()) - timedelta(hours=gro_setting('SPIN_ABANDON_AFTER_HOURS'))
+        return Spin.objects.filter(
+            Q(status='generated', created_at__lt=cutoff)
+            | Q(status='selecting', selection_started_at__lt=cutoff)
+            | Q(status='selecting', selection_started_at__isnull=True, created_at__lt=cutoff)
+        )
+
+    def stale_pending_spins(self, now=None):
+        # Async spins whose generation task never ran (lost message, dead worker)
+        cutoff = (now or timezone.now()) - timedelta(minutes=gro_setting('SPIN_PENDING_TIMEOUT_MINUTES'))
+        return Spin.objects.filter(status='pending', created_at__lt=cutoff)
+
+    def archivable_spins(self, now=None):
+        cutoff = (now or timezone.now()) - timedelta(days=gro_setting('SPIN_ARCHIVE_AFTER_DAYS'))
+        # Spins that earned a badge stay live; UserBadge.spin would cascade
+        return Spin.objects.filter(status='abandoned', created_at__lt=cutoff).exclude(
+            id__in=UserBadge.objects.filter(spin__isnull=False).values('spin_id')
+        )
+
+    def fail_stale_pending(self, now=None):
+        """Move spins stuck in 'pending' to 'failed', so pollers reach an end state; a late task then finds nothing to do."""
+        return self.stale_pending_spins(now).update(status='failed')
+
+    def mark_abandoned(self, now=None):
+        stale = self.stale_spins(now)
+        total = 0
+        while True:
+            ids = list(stale.values_list('id', flat=True)[:self.batch_size])
+            if not ids:
+                return total
+            # Re-checking the condition skips spins a user resumed since the ids were read
+            total += stale.filter(id__in=ids).update(status='abandoned')
+            if len(ids) < self.batch_size:
+                return total
+
+    def archive(self, now=None):
+        total = 0
+        while True:
+            moved = self._archive_batch(now)
+            total += moved
+            if moved < self.batch_size:
+                return total
+
+    def _archive_batch(self, now):
+        with transaction.atomic():
+            ids = list(self.archivable_spins(now).values_list('id', flat=True)[:self.batch_size])
+            if not ids:
+                return 0
+            # Re-check and lock: a spin resumed or badged since the ids were read stays live, items and all
+            spins = list(self.archivable_spins(now).filter(id__in=ids).select_for_update().prefetch_related('items'))
+            archived_ids = [spin.id for spin in spins]
+            # No ignore_conflicts: a spin whose archive row cannot be written must not be deleted
+            ArchivedSpin.objects.bulk_create([self._archived(spin) for spin in spins])
+            SpinItem.objects.filter(spin_id__in=archived_ids).delete()
+            Spin.objects.filter(id__in=archived_ids).delete()
+        return len(spins)
+
+    def _archived(self, spin):
+        return ArchivedSpin(
+            id=spin.id,
+            user_id=spin.user_id,
+            status=spin.status,
+            created_at=spin.created_at,
+            payload={
+                'budget': spin.budget,
+                'currency': spin.currency,
+                'total_value': spin.total_value,
+                'total_items_generated': spin.total_items_generated,
+                'max_items_to_select': spin.max_items_to_select,
+                'selected_count': spin.selected_count,
+                'preferences_snapshot': spin.preferences_snapshot,
+                'selection_started_at': spin.selection_started_at,
+                'items': [
+                    {
+                        'product_id': item.product_id,
+                        'name': item.name,
+                        'category_name': item.category_name,
+                        'unit_price': item.unit_price,
+                        'quantity': item.quantity,
+                        'position_in_spin': item.position_in_spin,
+                        'is_selected': item.is_selected,
+                    }
+                    for item in spin.items.all()
+                ],
+            },
+        )
+
+
 # Badge Service
 # Handles logic for awarding badges based on user actions and achievements.
+# The rules live in groroulette/badges/rules.py and are applied by BadgeEngine.
 class BadgeService:
     """
     Handles logic for awarding badges based on user actions and achievements.
     """
     def check_badges_for_spin(self, spin):
-        badges_earned = []
-        # Example logic: award "Smart Shopper" badge if all items are selected
-        if spin.items.filter(is_selected=True).count() == spin.max_items_to_select:
-            badge, created = Badge.objects.get_or_create(
-                name="Smart Shopper",
-                defaults={"description": "Collected all items from a spin!"}
-            )
-            UserBadge.objects.get_or_create(user=spin.user, badge=badge, spin=spin)
-            badges_earned.append(badge.name)
-        # Add more badge logic as needed
-        return badges_earned
\ No newline at end of file
+        return BadgeEngine().record_completion(spin)
@@ -0,0 +1,67 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from marketplace.models import Product, ProductRating
+from .badges.leaderboard import record_awards
+from .models import UserBadge, UserPreference
+from .preferences import invalidate_preferences
+from .products.index import candidate_index
+from .spins.pool import candidate_pool
+from .spins.optimizer import to_kobo
+
+
+# Keep the in-process candidate index in step with the product table, and move the candidate
+# pool cache to a new catalog version when a change affects which products a spin can pick.
+# Updates are applied on commit so a rolled back save never reaches the index.
+@receiver(post_save, sender=Product)
+def index_saved_product(sender, instance, **kwargs):
+    row = (
+        instance.pk, instance.category_id, to_kobo(instance.price), instance.stock, instance.popularity,
+        list(instance.dietary_tags or []), instance.brand,
+    )
+
+    def update():
+        if candidate_index.upsert(*row):
+            candidate_pool.invalidate()
+
+    transaction.on_commit(update)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_deleted_product(sender, instance, **kwargs):
+    product_id = instance.pk
+
+    def update():
+        candidate_index.remove(product_id)
+        candidate_pool.invalidate()
+
+    transaction.on_commit(update)
+
+
+@receiver(post_save, sender=ProductRating)
+@receiver(post_delete, sender=ProductRating)
+def reindex_product_rating(sender, instance, **kwargs):
+    product_id = instance.product_id
+
+    def update():
+        totals = Product.objects.filter(pk=product_id).values_list('rating_sum', 'rating_count').first()
+        if totals:
+            rating_sum, rating_count = totals
+            candidate_index.set_rating(product_id, rating_sum / rating_count if rating_count else None)
+
+    transaction.on_commit(update)
+
+
+# Badges created one at a time (admin, seeding) count towards the leaderboards too;
+# BadgeEngine awards in bulk and calls record_awards itself.
+@receiver(post_save, sender=UserBadge)
+def score_created_badge(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        record_awards([instance])
+
+
+# Cached preferences (groroulette/preferences.py) are dropped whenever the row changes
+@receiver(post_save, sender=UserPreference)
+@receiver(post_delete, sender=UserPreference)
+def invalidate_cached_preferences(sender, instance, **kwargs):
+    invalidate_preferences(instance.user_id)
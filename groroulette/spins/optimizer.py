@@ -0,0 +1,217 @@
+import math
+import time
+from decimal import Decimal, ROUND_DOWN
+from operator import itemgetter
+from typing import NamedTuple
+
+from groroulette.common.conf import gro_setting
+
+
+# Spin Optimizers
+# An optimizer receives the candidate products for a spin and decides which products go
+# into the spin and in what quantity. All amounts are integer minor units (kobo), so the
+# solvers never touch Decimal or float arithmetic.
+
+KOBO_PER_NAIRA = 100
+
+
+def to_kobo(amount):
+    """Convert a naira amount (Decimal, str or int) to whole kobo, rounding down."""
+    return int((Decimal(amount) * KOBO_PER_NAIRA).to_integral_value(rounding=ROUND_DOWN))
+
+
+def from_kobo(amount):
+    return Decimal(amount) / KOBO_PER_NAIRA
+
+
+class Candidate(NamedTuple):
+    product_id: int
+    price: int          # kobo
+    score: float = 0.0  # higher is better; ties are broken by price
+
+
+# Best first: highest score, then most expensive
+priority = itemgetter(2, 1)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def item_limit(max_items, items):
+    """max_items clamped to MAX_ITEMS_PER_SPIN and to the number of candidates: the knapsack
+    table holds a row per item count, so callers must not be able to size it."""
+    return min(max_items, gro_setting('MAX_ITEMS_PER_SPIN'), len(items))
+
+
+# Greedy Optimizer
+# The original GroRoulette algorithm: walk products from best to worst (most expensive first
+# when nothing is scored) and take as many of each as the remaining budget allows.
+class GreedyOptimizer:
+    name = 'greedy'
+
+    def solve(self, candidates, budget, max_items, max_quantity):
+        ordered = sorted((c for c in candidates if c.price > 0), key=priority, reverse=True)
+        return self.solve_ordered(ordered, budget, item_limit(max_items, ordered), max_quantity)
+
+    def solve_ordered(self, ordered, budget, max_items, max_quantity):
+        """Greedy pass over candidates that are already sorted best first and priced above zero."""
+        if not ordered:
+            return []
+        cheapest = min(c.price for c in ordered)
+
+        picks = []
+        remaining = budget
+        for candidate in ordered:
+            if len(picks) >= max_items or remaining < cheapest:
+                break
+            quantity = min(remaining // candidate.price, max_quantity)
+            if quantity > 0:
+                picks.append((candidate, quantity))
+                remaining -= candidate.price * quantity
+        return picks
+
+
+# Knapsack Optimizer
+# Bounded knapsack that maximises the amount of budget spent, subject to at most max_items
+# distinct products and at most max_quantity units of each. Among the fillings in the table
+# that spend the most, the one with the highest total candidate score wins.
+#
+# The table is kept as one Python int per item count, used as a bitset over spend: bit c of
+# reach[k] is set when some k products can be bought for exactly c units. Adding a product
+# is a handful of shift/or operations, which keeps the inner loop in C.
+# When the budget is finer than max_cells, prices are rounded up to a coarser unit so every
+# answer stays affordable; the greedy answer is kept if it spends more, or as much for a higher score.
+class KnapsackOptimizer:
+    name = 'knapsack'
+
+    def __init__(self, time_budget_ms=None, max_cells=None, pool_size=None, fallback=None):
+        if time_budget_ms is None:
+            time_budget_ms = gro_setting('OPTIMIZER_TIME_BUDGET_MS')
+        self.time_budget = time_budget_ms / 1000
+        self.max_cells = max_cells or gro_setting('OPTIMIZER_MAX_CELLS')
+        self.pool_size = pool_size or gro_setting('OPTIMIZER_POOL_SIZE')
+        self.fallback = fallback or GreedyOptimizer()
+
+    def solve(self, candidates, budget, max_items, max_quantity):
+        deadline = time.perf_counter() + self.time_budget
+        items = sorted((c for c in candidates if 0 < c.price <= budget), key=priority, reverse=True)
+        max_items = item_limit(max_items, items)
+        greedy_picks = self.fallback.solve_ordered(items, budget, max_items, max_quantity)
+        if not items or max_items <= 0 or max_quantity <= 0:
+            return greedy_picks
+
+        try:
+            if time.perf_counter() > deadline:
+                raise DeadlineExceeded()
+            unit = self._unit(items, budget)
+            pool = self._pool(items, unit, max_items)
+            picks = self._solve_table(pool, unit, budget // unit, max_items, max_quantity, deadline)
+        except DeadlineExceeded:
+            return greedy_picks
+
+        if (spend(picks), score(picks)) < (spend(greedy_picks), score(greedy_picks)):
+            return greedy_picks
+        return picks
+
+    def _unit(self, items, budget):
+        unit = 0
+        for item in items:
+            unit = math.gcd(unit, item.price)
+            if unit == 1:
+                break
+        return max(unit, math.ceil(budget / self.max_cells))
+
+    def _pool(self, items, unit, max_items):
+        # Items arrive best first. Products that round to the same weight are interchangeable
+        # for the table, so only the best max_items of each weight can ever be used.
+        per_weight = {}
+        survivors = []
+        for item in items:
+            weight = -(-item.price // unit)
+            if per_weight.get(weight, 0) < max_items:
+                per_weight[weight] = per_weight.get(weight, 0) + 1
+                survivors.append(item)
+        if len(survivors) <= self.pool_size:
+            return survivors
+
+        # Too many left: keep the best half outright and spread the rest evenly across the
+        # price range so the table still has small items to fill the last gaps with.
+        best = survivors[:self.pool_size // 2]
+        rest = sorted(survivors[self.pool_size // 2:], key=itemgetter(1))
+        slots = self.pool_size - len(best)
+        step = len(rest) / slots
+        return sorted(best + [rest[int(i * step)] for i in range(slots)], key=priority, reverse=True)
+
+    def _solve_table(self, pool, unit, capacity, max_items, max_quantity, deadline):
+        mask = (1 << (capacity + 1)) - 1
+        reach = [1] + [0] * max_items
+        history = []
+        weights = []
+
+        for item in pool:
+            if time.perf_counter() > deadline:
+                raise DeadlineExceeded()
+            weight = -(-item.price // unit)
+            limit = min(max_quantity, capacity // weight)
+            history.append(reach[:])
+            weights.append((weight, limit))
+            for k in range(max_items, 0, -1):
+                shifted = reach[k - 1]
+                if not shifted:
+                    continue
+                added = 0
+                for _ in range(limit):
+                    shifted = (shifted << weight) & mask
+                    if not shifted:
+                        break
+                    added |= shifted
+                reach[k] |= added
+            if any(row >> capacity for row in reach):
+                break  # the whole budget is spent; every product not yet added ranks lower
+
+        best_c = max(row.bit_length() - 1 for row in reach)
+        fillings = [
+            self._reconstruct(pool, history, weights, k, best_c)
+            for k, row in enumerate(reach) if (row >> best_c) & 1
+        ]
+        picks = max(fillings, key=score)  # the first, fewest products, on a tie
+        picks.sort(key=lambda pick: pick[0].price, reverse=True)
+        return picks
+
+    def _reconstruct(self, pool, history, weights, k, c):
+        # Walk back from the last (worst) product, leaving each out whenever the rest can still
+        # make up k products for c units, so the filling leans on the best products it can.
+        picks = []
+        for index in range(len(history) - 1, -1, -1):
+            if k == 0:
+                break
+            before = history[index]
+            if (before[k] >> c) & 1:
+                continue
+            weight, limit = weights[index]
+            for quantity in range(1, limit + 1):
+                rest = c - quantity * weight
+                if rest >= 0 and (before[k - 1] >> rest) & 1:
+                    picks.append((pool[index], quantity))
+                    k, c = k - 1, rest
+                    break
+        return picks
+
+
+def spend(picks):
+    return sum(candidate.price * quantity for candidate, quantity in picks)
+
+
+def score(picks):
+    return sum(candidate.score for candidate, _ in picks)
+
+
+OPTIMIZERS = {
+    GreedyOptimizer.name: GreedyOptimizer,
+    KnapsackOptimizer.name: KnapsackOptimizer,
+}
+
+
+def get_optimizer(name=None):
+    return OPTIMIZERS[name or gro_setting('OPTIMIZER')]()
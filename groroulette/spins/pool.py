@@ -0,0 +1,85 @@
+import hashlib
+import json
+import threading
+
+from groroulette.common.cache import build_cache
+from groroulette.common.conf import gro_setting
+from groroulette.products.index import candidate_index
+from groroulette.products.masks import PreferenceMask
+from .optimizer import to_kobo
+
+
+# Candidate Pool
+# Caches the candidate index rows a spin starts from, keyed by
+#
+#   (catalog version, budget bucket, preference fingerprint)
+#
+# Budgets are rounded up to the next GROROULETTE['CANDIDATE_CACHE_BUCKET'] naira, so users with
+# similar budgets and the same preferred categories, dietary restrictions, allergies and excluded
+# brands share one entry; rows above the actual budget are dropped after the lookup.
+#
+# The catalog version is bumped by the Product receivers in groroulette/signals.py whenever a
+# product's price, stock, category, tags or brand change, or a product is created or deleted.
+# Ratings and popularity are not part of the key and catch up when entries expire
+# (GROROULETTE['CANDIDATE_CACHE_TTL']).
+class CandidatePool:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cache = None
+        self._built = False
+
+    @property
+    def cache(self):
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    self._cache = build_cache()
+                    self._built = True
+        return self._cache
+
+    def clear(self):
+        """Drop the backend so the next lookup rebuilds it from the current settings."""
+        with self._lock:
+            self._cache = None
+            self._built = False
+
+    def invalidate(self):
+        cache = self.cache
+        if cache is not None:
+            cache.bump_version()
+
+    def stats(self):
+        cache = self.cache
+        return cache.stats() if cache is not None else {'backend': None}
+
+    def rows(self, budget_kobo, preferred_categories=(), preferences=None):
+        """candidate_index.lookup(budget_kobo, preferred_categories, preferences=preferences), cached."""
+        cache = self.cache
+        if cache is None:
+            return candidate_index.lookup(budget_kobo, preferred_categories, preferences=preferences)
+
+        bucket = to_kobo(gro_setting('CANDIDATE_CACHE_BUCKET'))
+        ceiling = -(-budget_kobo // bucket) * bucket
+        key = f'{cache.version()}:{ceiling}:{fingerprint(preferred_categories, preferences)}'
+        rows = cache.get(key)
+        if rows is None:
+            rows = candidate_index.lookup(ceiling, preferred_categories, preferences=preferences)
+            cache.set(key, rows)
+        if ceiling == budget_kobo:
+            return list(rows)
+        return [row for row in rows if row[1] <= budget_kobo]
+
+
+def fingerprint(preferred_categories, preferences=None):
+    preferences = preferences or PreferenceMask()
+    payload = json.dumps([
+        sorted({int(pk) for pk in preferred_categories or () if str(pk).isdigit()}),
+        preferences.dietary_restrictions,
+        preferences.allergies,
+        preferences.excluded_brands,
+    ])
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+
+candidate_pool = CandidatePool()
@@ -0,0 +1,54 @@
+import numpy as np
+
+from groroulette.common.conf import gro_setting
+
+
+# Spin Scorer
+# Ranks spin candidates on more than price. Each candidate row from the candidate index is
+# turned into five features in [0, 1], computed for the whole candidate set at once:
+#
+#   popularity  log-scaled Product.popularity relative to the most popular candidate
+#   rating      average rating out of 5 (unrated products count as 0)
+#   value       rating-adjusted quality per naira, relative to the best value candidate
+#   stock       stock on hand relative to GROROULETTE['SCORE_STOCK_TARGET'], capped at 1
+#   preference  half for being in a preferred category, half for being a favourite
+#
+# The score is the weighted sum of the features using GROROULETTE['SCORE_WEIGHTS'].
+# Setting every weight to 0 gives the original price-only ordering.
+FEATURES = ('popularity', 'rating', 'value', 'stock', 'preference')
+
+
+class SpinScorer:
+
+    def __init__(self, weights=None, stock_target=None):
+        weights = weights if weights is not None else gro_setting('SCORE_WEIGHTS')
+        self.weights = np.array([float(weights.get(name, 0)) for name in FEATURES])
+        self.stock_target = stock_target or gro_setting('SCORE_STOCK_TARGET')
+
+    def features(self, rows, preferred_categories=(), favorite_ids=()):
+        """Feature matrix of shape (len(rows), len(FEATURES)) for candidate index rows."""
+        data = np.asarray(rows, dtype=np.float64).reshape(-1, 6)
+        product_id, price, stock, popularity, rating, category_id = data.T
+
+        popularity = np.log1p(np.clip(popularity, 0, None))
+        quality = (1 + rating) / np.maximum(price, 1)
+
+        matrix = np.empty((len(data), len(FEATURES)))
+        matrix[:, 0] = popularity / max(popularity.max(initial=0), 1e-9)
+        matrix[:, 1] = rating / 5
+        matrix[:, 2] = quality / max(quality.max(initial=0), 1e-12)
+        matrix[:, 3] = np.minimum(stock / self.stock_target, 1)
+        matrix[:, 4] = (
+            0.5 * np.isin(category_id, _ids(preferred_categories))
+            + 0.5 * np.isin(product_id, _ids(favorite_ids))
+        )
+        return matrix
+
+    def score(self, rows, preferred_categories=(), favorite_ids=()):
+        if not rows:
+            return np.empty(0)
+        return self.features(rows, preferred_categories, favorite_ids) @ self.weights
+
+
+def _ids(values):
+    return np.array([int(value) for value in values if str(value).isdigit()], dtype=np.float64)
@@ -0,0 +1,42 @@
+import logging
+
+from celery import shared_task
+
+from .models import Spin
+from .services import BudgetOptimizerService, SpinArchiveService
+
+logger = logging.getLogger(__name__)
+
+
+# Generate Spin Task
+# Fills in a spin created by SpinListCreateView in async mode. The spin moves from 'pending'
+# to 'generated', or to 'failed' if the optimizer raises, so pollers always reach an end state.
+@shared_task(ignore_result=True)
+def generate_spin_task(spin_id):
+    try:
+        BudgetOptimizerService().fill_pending_spin(spin_id)
+    except Exception:
+        Spin.objects.filter(id=spin_id, status='pending').update(status='failed')
+        raise
+
+
+def enqueue_spin_generation(spin_id):
+    """Queue generate_spin_task, or generate the spin in this process if the broker cannot take it."""
+    try:
+        generate_spin_task.delay(spin_id)
+    except Exception:
+        logger.exception('Could not queue generation of spin %s; generating it inline', spin_id)
+        try:
+            generate_spin_task(spin_id)  # a direct call runs here and leaves the spin 'generated' or 'failed'
+        except Exception:
+            logger.exception('Inline generation of spin %s failed', spin_id)
+
+
+# Sweep Spins Task
+# Scheduled by CELERY_BEAT_SCHEDULE in settings.py; the same work as `manage.py sweep_spins`.
+@shared_task(ignore_result=True)
+def sweep_spins_task():
+    service = SpinArchiveService()
+    service.fail_stale_pending()
+    service.mark_abandoned()
+    service.archive()
@@ -1,3 +1,908 @@
-from django.test import TestCase
+import base64
+import time
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.db.models import Count, Q
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from marketplace.models import Category, Product, ProductRating
+from profiles.models import BuyerProfile
+from yardgro_backend.celery import app as celery_app
+from .models import ArchivedSpin, Badge, BadgeProgress, LeaderboardScore, Spin, SpinItem, UserBadge, UserPreference
+from .badges.engine import BadgeEngine
+from .badges.leaderboard import GLOBAL_BOARD, LocalLeaderboards, RedisLeaderboards, SortedBoard, leaderboards, weekly_board
+from .badges.rules import BADGE_RULES
+from .common.conf import gro_setting
+from .products.index import candidate_index
+from .products.masks import PreferenceMask, tag_mask, to_words, words_needed
+from .preferences import load_preferences
+from .services import BudgetOptimizerService, SelectionLimitExceeded, SpinArchiveService, SpinSelectionService
+from .common.cache import LocalLRUCache
+from .spins.pool import candidate_pool
+from .tasks import generate_spin_task
+from .views import SpinResultView
+from .spins.optimizer import Candidate, GreedyOptimizer, KnapsackOptimizer, spend, to_kobo
+from .spins.scoring import FEATURES, SpinScorer
+
+User = get_user_model()
+
+
+class OptimizerTests(TestCase):
+    def test_to_kobo_rounds_down(self):
+        self.assertEqual(to_kobo(Decimal('1500.50')), 150050)
+        self.assertEqual(to_kobo('0.019'), 1)
+
+    def test_knapsack_spends_budget_greedy_leaves_unspent(self):
+        candidates = [Candidate(1, 6000), Candidate(2, 5000), Candidate(3, 5000)]
+        greedy = GreedyOptimizer().solve(candidates, 10000, max_items=10, max_quantity=1)
+        knapsack = KnapsackOptimizer(time_budget_ms=1000).solve(candidates, 10000, max_items=10, max_quantity=1)
+        self.assertEqual(spend(greedy), 6000)
+        self.assertEqual(spend(knapsack), 10000)
+        self.assertEqual(sorted(c.product_id for c, _ in knapsack), [2, 3])
+
+    def test_knapsack_breaks_spend_ties_by_score(self):
+        # Three of product 2 or one each of products 1 and 2 both spend exactly 3000
+        candidates = [Candidate(1, 2000, 0.9), Candidate(2, 1000, 0.1)]
+        picks = KnapsackOptimizer(time_budget_ms=1000).solve(candidates, 3000, max_items=2, max_quantity=3)
+        self.assertEqual(spend(picks), 3000)
+        self.assertEqual([(c.product_id, quantity) for c, quantity in picks], [(1, 1), (2, 1)])
+
+    def test_knapsack_respects_item_and_quantity_caps(self):
+        candidates = [Candidate(pk, 700 + pk) for pk in range(1, 30)]
+        picks = KnapsackOptimizer(time_budget_ms=1000).solve(candidates, 50000, max_items=3, max_quantity=4)
+        self.assertLessEqual(len(picks), 3)
+        self.assertTrue(all(1 <= quantity <= 4 for _, quantity in picks))
+        self.assertEqual(len({c.product_id for c, _ in picks}), len(picks))
+        self.assertLessEqual(spend(picks), 50000)
+
+    def test_knapsack_coarse_resolution_stays_within_budget(self):
+        candidates = [Candidate(pk, 100003 * pk + 7) for pk in range(1, 40)]
+        picks = KnapsackOptimizer(time_budget_ms=1000, max_cells=500).solve(
+            candidates, 5000000, max_items=10, max_quantity=10
+        )
+        self.assertLessEqual(spend(picks), 5000000)
+        self.assertGreaterEqual(
+            spend(picks), spend(GreedyOptimizer().solve(candidates, 5000000, 10, 10))
+        )
+
+    def test_knapsack_falls_back_to_greedy_at_deadline(self):
+        candidates = [Candidate(1, 6000), Candidate(2, 5000), Candidate(3, 5000)]
+        picks = KnapsackOptimizer(time_budget_ms=0).solve(candidates, 10000, max_items=10, max_quantity=1)
+        self.assertEqual(spend(picks), 6000)
+
+
+class CandidateIndexTests(TestCase):
+    def setUp(self):
+        candidate_index.clear()
+        candidate_pool.clear()
+        self.grains = Category.objects.create(name='Grains & Staples')
+        self.oils = Category.objects.create(name='Oils')
+        self.rice = Product.objects.create(category=self.grains, name='Rice', description='', price=Decimal('1500'))
+        self.beans = Product.objects.create(category=self.grains, name='Beans', description='', price=Decimal('900'))
+        self.oil = Product.objects.create(category=self.oils, name='Palm Oil', description='', price=Decimal('3000'))
+
+    def test_lookup_is_bounded_by_budget_and_category(self):
+        def ids(rows):
+            return sorted(row[0] for row in rows)
+
+        self.assertEqual(ids(candidate_index.lookup(150000)), sorted([self.rice.id, self.beans.id]))
+        self.assertEqual(ids(candidate_index.lookup(300000, [self.oils.id])), [self.oil.id])
+        self.assertEqual(
+            ids(candidate_index.lookup(300000, exclude_ids=[self.rice.id])), sorted([self.beans.id, self.oil.id])
+        )
+
+    def test_product_signals_update_index_on_commit(self):
+        candidate_index.lookup(0)  # load
+        version = candidate_index.version
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rice.price = Decimal('500')
+            self.rice.save()
+            self.beans.delete()
+        rows = candidate_index.lookup(100000, [self.grains.id])
+        self.assertEqual(rows, [(self.rice.id, 50000, 0, 0, 0.0, self.grains.id)])
+        self.assertGreater(candidate_index.version, version)
+
+    def test_rating_signals_update_index(self):
+        candidate_index.lookup(0)
+        with self.captureOnCommitCallbacks(execute=True):
+            rater = User.objects.create_user(username='rater', password='testtest1234', role='buyer')
+            ProductRating.objects.create(product=self.oil, user=rater, rating=4)
+        rows = candidate_index.lookup(300000, [self.oils.id])
+        self.assertEqual(rows[0][4], 4.0)
+
+
+class SpinScorerTests(TestCase):
+    # (product_id, price, stock, popularity, rating, category_id)
+    rows = [
+        (1, 150000, 50, 100, 4.5, 1),
+        (2, 150000, 0, 0, 0.0, 1),
+        (3, 900000, 5, 10, 3.0, 2),
+    ]
+
+    def test_features_are_normalised(self):
+        matrix = SpinScorer().features(self.rows, preferred_categories=[2], favorite_ids=[2])
+        self.assertEqual(matrix.shape, (3, len(FEATURES)))
+        self.assertTrue(((matrix >= 0) & (matrix <= 1)).all())
+        self.assertEqual(list(matrix[:, FEATURES.index('preference')]), [0.0, 0.5, 0.5])
+
+    def test_weights_drive_ranking(self):
+        scores = SpinScorer(weights={'popularity': 1}).score(self.rows)
+        self.assertEqual(list(scores.argsort()[::-1]), [0, 2, 1])
+        scores = SpinScorer(weights={'preference': 1}).score(self.rows, favorite_ids=[2])
+        self.assertEqual(scores.argmax(), 1)
+        self.assertFalse(SpinScorer(weights={}).score(self.rows).any())
+        self.assertEqual(len(SpinScorer().score([])), 0)
+
+
+class PreferenceMaskTests(TestCase):
+    def matches(self, preferences, tags, brand_codes=(0,)):
+        width = words_needed()
+        return preferences.compile(width).matches(to_words([tag_mask(tags)], width), list(brand_codes)).tolist()
+
+    def test_restrictions_allergies_and_implied_tags(self):
+        tag_mask(['Vegan', 'Nuts', 'Gluten-Free'])  # make sure the vocabulary knows these
+        self.assertEqual(self.matches(PreferenceMask(['gluten_free']), ['Gluten Free', 'Local']), [True])
+        self.assertEqual(self.matches(PreferenceMask(['vegetarian']), ['Vegan']), [True])
+        self.assertEqual(self.matches(PreferenceMask(['vegetarian']), ['Local']), [False])
+        self.assertEqual(self.matches(PreferenceMask(allergies=['nuts']), ['Nuts', 'Snack']), [False])
+        self.assertEqual(self.matches(PreferenceMask(allergies=['shellfish']), ['Nuts']), [True])
+        self.assertEqual(self.matches(PreferenceMask(['never_seen_tag']), ['Vegan']), [False])
+        self.assertFalse(PreferenceMask())
+
+
+class PreferenceFilteringTests(TestCase):
+    def setUp(self):
+        candidate_index.clear()
+        candidate_pool.clear()
+        self.user = User.objects.create_user(username='picky', password='testtest1234', role='buyer')
+        self.pref = UserPreference.objects.create(
+            user=self.user, dietary_restrictions=['vegetarian'], allergies=['nuts'], excluded_brands=['BrandA']
+        )
+        category = Category.objects.create(name='Bakery, Nuts & Snacks')
+
+        def product(name, tags, brand=''):
+            return Product.objects.create(
+                category=category, name=name, description='', price=Decimal('1000'), dietary_tags=tags, brand=brand
+            )
+
+        self.ok = product('Plantain Chips', ['Vegan', 'Snack'])
+        self.nuts = product('Groundnuts', ['Vegan', 'Nuts'])
+        self.meat = product('Suya', ['High-Protein'])
+        self.brand = product('Branded Chips', ['Vegan'], brand='branda')
+
+    def test_spin_candidates_respect_preferences(self):
+        rows = candidate_index.lookup(1000000, preferences=PreferenceMask.from_preference(self.pref))
+        self.assertEqual([row[0] for row in rows], [self.ok.id])
+        spin = BudgetOptimizerService().generate_spin(self.user, Decimal('5000'))
+        self.assertEqual(set(spin.items.values_list('product_id', flat=True)), {self.ok.id})
+
+    def test_product_list_can_match_preferences(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get(reverse('product-list-create'), {'match_preferences': 'true'})
+        self.assertEqual([product['id'] for product in response.json()['results']], [self.ok.id])
+        response = client.get(reverse('product-list-create'))
+        self.assertEqual(len(response.json()['results']), 4)
+
+    def test_product_list_does_not_depend_on_the_candidate_index(self):
+        candidate_index.lookup(0)
+        # Saved after the index loaded, with the on_commit update never run: another process's write
+        category = self.ok.category
+        fresh = Product.objects.create(
+            category=category, name='Fresh Chips', description='', price=Decimal('1000'), dietary_tags=['vegan']
+        )
+        peanuts = Product.objects.create(
+            category=category, name='Peanuts', description='', price=Decimal('1000'), dietary_tags=['Vegan']
+        )
+        peanuts.dietary_tags = ['Vegan', 'nuts']
+        peanuts.save(update_fields=['dietary_tags'])
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get(reverse('product-list-create'), {'match_preferences': 'true'})
+        self.assertEqual({product['id'] for product in response.json()['results']}, {self.ok.id, fresh.id})
+
+
+class GenerateSpinTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        candidate_index.clear()
+        candidate_pool.clear()
+        self.user = User.objects.create_user(username='spinner', password='testtest1234', role='buyer')
+        category = Category.objects.create(name='Grains & Staples')
+        for pk, price in enumerate(['6000.00', '5000.00', '5000.00'], start=1):
+            Product.objects.create(category=category, name=f'Product {pk}', description='', price=Decimal(price))
+
+    @override_settings(GROROULETTE={'OPTIMIZER': 'knapsack', 'MAX_QUANTITY_PER_ITEM': 1})
+    def test_generate_spin_uses_budget_fully(self):
+        spin = BudgetOptimizerService().generate_spin(self.user, Decimal('10000'), max_items=10)
+        self.assertEqual(spin.total_value, Decimal('10000.00'))
+        self.assertEqual(spin.items.count(), 2)
+        self.assertEqual(list(spin.items.values_list('position_in_spin', flat=True)), [1, 2])
+
+
+@override_settings(GROROULETTE={'OPTIMIZER': 'knapsack', 'MAX_QUANTITY_PER_ITEM': 1})
+class SpinWriteQueryTests(TestCase):
+    def setUp(self):
+        candidate_index.clear()
+        candidate_pool.clear()
+        self.user = User.objects.create_user(username='bulk', password='testtest1234', role='buyer')
+        UserPreference.objects.create(user=self.user)
+        category = Category.objects.create(name='Grains & Staples')
+        for pk in range(1, 13):
+            Product.objects.create(category=category, name=f'Product {pk}', description='', price=Decimal(1000 * pk))
+        candidate_index.lookup(0)  # warm the index so only write queries are counted
+
+    def test_generate_spin_query_count_is_constant(self):
+        user_pref = UserPreference.objects.get(user=self.user)
+        # favourites, winning products, savepoint, spin insert, item bulk insert, release
+        with self.assertNumQueries(6):
+            small = BudgetOptimizerService().generate_spin(self.user, Decimal('3000'), max_items=10, user_pref=user_pref)
+        with self.assertNumQueries(6):
+            large = BudgetOptimizerService().generate_spin(self.user, Decimal('1000000'), max_items=10, user_pref=user_pref)
+        self.assertEqual(small.total_value, Decimal('3000'))
+        self.assertEqual(large.items.count(), 10)
+        self.assertEqual(
+            list(large.items.values_list('position_in_spin', flat=True)), list(range(1, 11))
+        )
+        self.assertTrue(all(item.total_price == item.unit_price for item in large.items.all()))
+
+    def test_recalculate_spin_fills_freed_budget_in_bulk(self):
+        spin = BudgetOptimizerService().generate_spin(self.user, Decimal('12000'), max_items=10)
+        item = spin.items.first()
+        item.quantity = 0
+        item.save()
+
+        with self.assertNumQueries(6):
+            BudgetOptimizerService().recalculate_spin(spin)
+
+        spin.refresh_from_db()
+        items = list(spin.items.all())
+        self.assertEqual(spin.total_items_generated, len(items))
+        self.assertEqual(spin.total_value, sum(i.total_price for i in items))
+        self.assertEqual([i.position_in_spin for i in items], list(range(1, len(items) + 1)))
+        self.assertLessEqual(spin.total_value, spin.budget)
+
+
+class AsyncSpinTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        candidate_index.clear()
+        candidate_pool.clear()
+        # Run tasks inline against an in-memory broker; no worker or redis needed
+        previous = {key: celery_app.conf[key] for key in ('CELERY_TASK_ALWAYS_EAGER', 'CELERY_BROKER_URL')}
+        celery_app.conf.update(CELERY_TASK_ALWAYS_EAGER=True, CELERY_BROKER_URL='memory://')
+        self.addCleanup(celery_app.conf.update, **previous)
+
+        self.user = User.objects.create_user(username='async', password='testtest1234', role='buyer')
+        category = Category.objects.create(name='Oils')
+        Product.objects.create(category=category, name='Palm Oil', description='', price=Decimal('2500'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_async_spin_is_pending_then_generated(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            response = self.client.post(reverse('spin-list-create'), {'budget': '5000', 'mode': 'async'}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['status'], 'pending')
+        result_url = response.json()['result_url']
+
+        pending = self.client.get(result_url)
+        self.assertEqual(pending.status_code, 202)
+
+        for callback in callbacks:
+            callback()  # the commit hook enqueues the task, which runs eagerly here
+        result = self.client.get(result_url, {'wait': 1})
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(result.json()['status'], 'generated')
+        self.assertEqual(result.json()['total_value'], '5000.00')
+        self.assertEqual(result.json()['preferences_snapshot']['allergies'], [])
+
+    def test_long_poll_is_capped(self):
+        spin = Spin.objects.create(user=self.user, budget=Decimal('5000'), status='pending')
+        clock = [0.0]
+
+        def sleep(seconds):
+            clock[0] += seconds
+
+        with mock.patch('groroulette.views.time.monotonic', side_effect=lambda: clock[0]), \
+                mock.patch('groroulette.views.time.sleep', side_effect=sleep):
+            response = self.client.get(reverse('spin-result', kwargs={'spin_id': spin.id}), {'wait': 60})
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertLessEqual(clock[0], gro_setting('SPIN_RESULT_MAX_WAIT') + SpinResultView.poll_interval)
+
+    def test_unreachable_broker_falls_back_to_inline_generation(self):
+        with mock.patch.object(generate_spin_task, 'delay', side_effect=OSError('broker down')):
+            with self.assertLogs('groroulette.tasks', 'ERROR'), self.captureOnCommitCallbacks(execute=True):
+                response = self.client.post(reverse('spin-list-create'), {'budget': '5000', 'mode': 'async'}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(Spin.objects.get(id=response.json()['id']).status, 'generated')
+
+    def test_sweep_fails_spins_left_pending(self):
+        spin = BudgetOptimizerService().create_pending_spin(self.user, Decimal('5000'))
+        Spin.objects.filter(id=spin.id).update(created_at=timezone.now() - timedelta(hours=1))
+        fresh = BudgetOptimizerService().create_pending_spin(self.user, Decimal('5000'))
+        self.assertEqual(SpinArchiveService().fail_stale_pending(), 1)
+        self.assertEqual(dict(Spin.objects.values_list('id', 'status')), {spin.id: 'failed', fresh.id: 'pending'})
+
+    def test_sync_mode_is_still_the_default(self):
+        response = self.client.post(reverse('spin-list-create'), {'budget': '5000'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['status'], 'generated')
+
+
+@override_settings(GROROULETTE={'OPTIMIZER': 'knapsack', 'MAX_QUANTITY_PER_ITEM': 1})
+class SpinBatchTests(TestCase):
+    def setUp(self):
+        candidate_index.clear()
+        candidate_pool.clear()
+        self.user = User.objects.create_user(username='household', password='testtest1234', role='buyer')
+        UserPreference.objects.create(user=self.user)
+        category = Category.objects.create(name='Grains & Staples')
+        for pk in range(1, 9):
+            Product.objects.create(category=category, name=f'Product {pk}', description='', price=Decimal(1000 * pk))
+        candidate_index.lookup(0)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_batch_is_written_with_constant_queries(self):
+        # preference, favourites, winning products, savepoint, spin bulk insert, item bulk insert, release
+        with self.assertNumQueries(7):
+            spins = BudgetOptimizerService().generate_spin_batch(self.user, [Decimal('5000')] * 4)
+        self.assertEqual(len(spins), 4)
+        self.assertTrue(all(spin.total_value == Decimal('5000') for spin in spins))
+
+    def test_distinct_products_are_not_repeated(self):
+        response = self.client.post(
+            reverse('spin-batch-create'),
+            {'budget': '6000', 'count': 3, 'distinct_products': True},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 201)
+        product_ids = [item['product'] for spin in response.json() for item in spin['items']]
+        self.assertEqual(len(response.json()), 3)
+        self.assertEqual(len(product_ids), len(set(product_ids)))
+
+    @override_settings(GROROULETTE={'SPIN_BATCH_MAX_SPINS': 2})
+    def test_batch_size_is_capped(self):
+        response = self.client.post(reverse('spin-batch-create'), {'budgets': ['5000'] * 3}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_max_items_is_capped(self):
+        response = self.client.post(
+            reverse('spin-batch-create'), {'budget': '5000', 'count': 1, 'max_items': 10 ** 8}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('max_items', response.json())
+
+    def test_optimizer_clamps_max_items(self):
+        spins = BudgetOptimizerService().generate_spin_batch(self.user, [Decimal('36000')], max_items=10 ** 8)
+        self.assertEqual(spins[0].total_value, Decimal('36000'))
+
+
+class CandidatePoolTests(TestCase):
+    def setUp(self):
+        candidate_index.clear()
+        candidate_pool.clear()
+        self.category = Category.objects.create(name='Tubers')
+        self.yam = Product.objects.create(category=self.category, name='Yam', description='', price=Decimal('3000'))
+        Product.objects.create(category=self.category, name='Cassava', description='', price=Decimal('4500'))
+        candidate_index.lookup(0)
+
+    def test_lru_evicts_least_recently_used(self):
+        cache = LocalLRUCache(max_entries=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.stats()['hits'], 2)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_similar_budgets_share_an_entry(self):
+        self.assertEqual([row[0] for row in candidate_pool.rows(to_kobo(4000))], [self.yam.pk])
+        self.assertEqual(len(candidate_pool.rows(to_kobo(5000))), 2)
+        stats = candidate_pool.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_price_change_invalidates_but_popularity_does_not(self):
+        candidate_pool.rows(to_kobo(5000))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.yam.popularity = 50
+            self.yam.save()
+        candidate_pool.rows(to_kobo(5000))
+        self.assertEqual(candidate_pool.stats()['hits'], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.yam.price = Decimal('6000')
+            self.yam.save()
+        self.assertEqual(len(candidate_pool.rows(to_kobo(5000))), 1)
+        self.assertEqual(candidate_pool.stats()['misses'], 2)
+
+
+class SpinSelectionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='picker', password='testtest1234', role='buyer')
+        category = Category.objects.create(name='Spices')
+        self.spin = Spin.objects.create(user=self.user, budget=Decimal('5000'), max_items_to_select=2, status='selecting')
+        self.items = [
+            SpinItem.objects.create(
+                spin=self.spin, product=Product.objects.create(category=category, name=name, description='', price=Decimal('500')),
+                name=name, price=Decimal('500'), unit_price=Decimal('500'), position_in_spin=idx,
+            )
+            for idx, name in enumerate(['Curry', 'Thyme', 'Nutmeg'], start=1)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_counter_enforces_limit_and_ignores_repeats(self):
+        service = SpinSelectionService()
+        self.assertEqual(service.set_selected(self.spin, [self.items[0].id], True), 1)
+        self.assertEqual(service.set_selected(self.spin, [self.items[0].id], True), 0)
+        service.set_selected(self.spin, [self.items[1].id], True)
+        with self.assertRaises(SelectionLimitExceeded):
+            service.set_selected(self.spin, [self.items[2].id], True)
+        self.assertEqual(self.spin.selected_count, 2)
+
+        service.set_selected(self.spin, [self.items[0].id], False)
+        self.assertEqual(self.spin.selected_count, 1)
+        self.assertEqual(self.spin.items.filter(is_selected=True).count(), 1)
+
+    def test_bulk_select_is_all_or_nothing(self):
+        url = reverse('spin-item-bulk-select', kwargs={'spin_id': self.spin.id})
+        all_ids = [str(item.id) for item in self.items]
+        response = self.client.post(url, {'item_ids': all_ids, 'selected': True}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.spin.items.filter(is_selected=True).exists())
+
+        response = self.client.post(url, {'item_ids': all_ids[:2], 'selected': True}, format='json')
+        self.assertEqual(response.json(), {'changed': 2, 'selected_count': 2, 'max_items_to_select': 2})
+        response = self.client.post(url, {'item_ids': all_ids, 'selected': False}, format='json')
+        self.assertEqual(response.json()['selected_count'], 0)
+
+    def test_bulk_select_needs_the_selection_phase(self):
+        Spin.objects.filter(id=self.spin.id).update(status='generated')
+        url = reverse('spin-item-bulk-select', kwargs={'spin_id': self.spin.id})
+        response = self.client.post(url, {'item_ids': [str(self.items[0].id)], 'selected': True}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.spin.items.filter(is_selected=True).exists())
+
+    def test_single_select_needs_the_selection_phase(self):
+        Spin.objects.filter(id=self.spin.id).update(status='generated')
+        url = reverse('spin-item-select', kwargs={'spin_id': self.spin.id, 'item_id': self.items[0].id})
+        response = self.client.put(url)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(self.spin.items.filter(is_selected=True).exists())
+
+
+@override_settings(GROROULETTE={'OPTIMIZER': 'knapsack', 'MAX_QUANTITY_PER_ITEM': 1})
+class SpinEndpointQueryTests(TestCase):
+    # Each endpoint is locked to a fixed number of queries, however many spins and items it returns
+    ENDPOINT_QUERIES = {
+        'spin-list-create': 2,  # spins joined with preferences, items
+        'spin-history': 2,
+        'spin-detail': 2,
+        'spin-item-list': 1,
+    }
+
+    def setUp(self):
+        candidate_index.clear()
+        candidate_pool.clear()
+        self.user = User.objects.create_user(username='history', password='testtest1234', role='buyer')
+        UserPreference.objects.create(user=self.user)
+        category = Category.objects.create(name='Beverages')
+        for pk in range(1, 9):
+            Product.objects.create(category=category, name=f'Drink {pk}', description='', price=Decimal(500 * pk))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def spin(self):
+        return BudgetOptimizerService().generate_spin(self.user, Decimal('10000'), max_items=5)
+
+    def url(self, name, spin):
+        if name == 'spin-detail':
+            return reverse(name, kwargs={'pk': spin.id})
+        if name == 'spin-item-list':
+            return reverse(name, kwargs={'spin_id': spin.id})
+        return reverse(name)
+
+    def test_endpoint_query_counts_are_fixed(self):
+        for spins in (1, 5):
+            while Spin.objects.count() < spins:
+                spin = self.spin()
+            for name, queries in self.ENDPOINT_QUERIES.items():
+                with self.subTest(endpoint=name, spins=spins), self.assertNumQueries(queries):
+                    response = self.client.get(self.url(name, spin))
+                self.assertEqual(response.status_code, 200)
+
+    def test_items_carry_category_and_image(self):
+        item = self.spin().items.first()
+        self.assertEqual(item.category_name, 'Beverages')
+        response = self.client.get(reverse('spin-item-list', kwargs={'spin_id': item.spin_id}))
+        self.assertEqual(response.json()[0]['category'], 'Beverages')
+        self.assertIsNone(response.json()[0]['product_image'])
+
+
+class SpinHistoryPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='regular', password='testtest1234', role='buyer')
+        category = Category.objects.create(name='Dairy')
+        product = Product.objects.create(category=category, name='Milk', description='', price=Decimal('800'))
+        self.spins = [Spin.objects.create(user=self.user, budget=Decimal('5000')) for _ in range(5)]
+        for spin in self.spins[:2]:
+            for position in (1, 2):
+                SpinItem.objects.create(
+                    spin=spin, product=product, name='Milk', price=Decimal('800'), unit_price=Decimal('800'),
+                    position_in_spin=position, is_selected=position == 1,
+                )
+        # Ties on created_at are broken by id, so no spin is skipped or repeated
+        Spin.objects.filter(id__in=[spin.id for spin in self.spins[:3]]).update(created_at=timezone.now())
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_cursor_walks_every_spin_once(self):
+        seen = []
+        url = reverse('spin-history') + '?page_size=2'
+        while url:
+            page = self.client.get(url).json()
+            self.assertLessEqual(len(page['results']), 2)
+            seen.extend(spin['id'] for spin in page['results'])
+            url = page['next']
+        self.assertEqual(sorted(seen), sorted(str(spin.id) for spin in self.spins))
+
+    def test_summary_is_one_query_without_items(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('spin-history'), {'view': 'summary'})
+        by_id = {spin['id']: spin for spin in response.json()['results']}
+        first = by_id[str(self.spins[0].id)]
+        self.assertEqual((first['item_count'], first['selected_item_count']), (2, 1))
+        self.assertNotIn('items', first)
+        self.assertTrue(first['detail_url'].endswith(reverse('spin-detail', kwargs={'pk': self.spins[0].id})))
+
+    def test_bad_cursor_is_rejected(self):
+        response = self.client.get(reverse('spin-history'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_cursor_with_a_bad_id_is_rejected(self):
+        cursor = base64.urlsafe_b64encode(f'{self.spins[0].created_at.isoformat()}|notauuid'.encode()).decode()
+        response = self.client.get(reverse('spin-history'), {'cursor': cursor})
+        self.assertEqual(response.status_code, 404)
+
+
+class SpinSweepTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='idle', password='testtest1234', role='buyer')
+        category = Category.objects.create(name='Snacks')
+        product = Product.objects.create(category=category, name='Chin Chin', description='', price=Decimal('700'))
+        now = timezone.now()
+
+        def spin(status, age, **extra):
+            spin = Spin.objects.create(user=self.user, budget=Decimal('5000'), status=status, **extra)
+            Spin.objects.filter(id=spin.id).update(created_at=now - age)
+            SpinItem.objects.create(
+                spin=spin, product=product, name='Chin Chin', price=Decimal('700'), unit_price=Decimal('700'),
+                position_in_spin=1,
+            )
+            return spin
+
+        self.fresh = spin('generated', timedelta(hours=1))
+        self.stale = spin('generated', timedelta(days=3))
+        self.resumed = spin('selecting', timedelta(days=3), selection_started_at=now)
+        self.old = spin('generated', timedelta(days=40))
+        self.done = spin('completed', timedelta(days=40))
+
+    def test_stale_spins_are_abandoned_in_batches(self):
+        self.assertEqual(SpinArchiveService(batch_size=1).mark_abandoned(), 2)
+        statuses = dict(Spin.objects.values_list('id', 'status'))
+        self.assertEqual(statuses[self.stale.id], 'abandoned')
+        self.assertEqual(statuses[self.old.id], 'abandoned')
+        self.assertEqual(statuses[self.fresh.id], 'generated')
+        self.assertEqual(statuses[self.resumed.id], 'selecting')
+
+    def test_sweep_command_archives_old_abandoned_spins(self):
+        call_command('sweep_spins', batch_size=1, stdout=StringIO())
+        self.assertFalse(Spin.objects.filter(id=self.old.id).exists())
+        self.assertFalse(SpinItem.objects.filter(spin_id=self.old.id).exists())
+        self.assertTrue(Spin.objects.filter(id=self.stale.id, status='abandoned').exists())
+        self.assertTrue(Spin.objects.filter(id=self.done.id).exists())
+
+        archived = ArchivedSpin.objects.get()
+        self.assertEqual(archived.id, self.old.id)
+        self.assertEqual(archived.payload['items'][0]['name'], 'Chin Chin')
+        self.assertEqual(archived.payload['budget'], '5000.00')
+
+    def test_archive_keeps_spins_it_cannot_archive(self):
+        Spin.objects.filter(id=self.old.id).update(status='abandoned')
+        ArchivedSpin.objects.create(id=self.old.id, user_id=self.user.id, status='abandoned', created_at=timezone.now(), payload={})
+        with self.assertRaises(IntegrityError):
+            SpinArchiveService().archive()
+        self.assertTrue(SpinItem.objects.filter(spin_id=self.old.id).exists())
+
+        ArchivedSpin.objects.all().delete()
+        badge = Badge.objects.create(name='smart_shopper', title='Smart Shopper', description='')
+        UserBadge.objects.create(user=self.user, badge=badge, name=badge.title, spin=self.old)
+        self.assertEqual(SpinArchiveService().archive(), 0)
+        self.assertTrue(SpinItem.objects.filter(spin_id=self.old.id).exists())
+
+
+class BadgeEngineTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='collector', password='testtest1234', role='buyer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.products = [
+            Product.objects.create(category=Category.objects.create(name=f'Aisle {pk}'), name=f'Item {pk}', description='', price=Decimal('1000'))
+            for pk in range(6)
+        ]
+
+    def completed_spin(self, products, selected=True):
+        spin = Spin.objects.create(
+            user=self.user, budget=Decimal('1000') * len(products), max_items_to_select=len(products), status='selecting'
+        )
+        SpinItem.objects.bulk_create(
+            BudgetOptimizerService()._build_spin_item(spin, product, 1, position)
+            for position, product in enumerate(Product.objects.select_related('category').filter(id__in=[p.id for p in products]), start=1)
+        )
+        if selected:
+            spin.items.update(is_selected=True)
+        return spin
+
+    def test_completion_awards_from_counters_once(self):
+        spin = self.completed_spin(self.products[:2])
+        response = self.client.put(reverse('spin-complete', kwargs={'spin_id': spin.id}))
+        self.assertEqual(response.json()['badges_earned'], ['smart_shopper'])
+        response = self.client.put(reverse('spin-complete', kwargs={'spin_id': spin.id}))
+        self.assertEqual(response.json()['badges_earned'], [])
+
+        progress = BadgeProgress.objects.get(user=self.user)
+        self.assertEqual((progress.spins_completed, progress.budget_streak), (1, 1))
+        self.assertEqual(progress.categories, ['Aisle 0', 'Aisle 1'])
+
+    def test_awards_already_stored_are_not_scored(self):
+        spin = self.completed_spin(self.products[:2])
+        rule = BADGE_RULES['smart_shopper']
+        badge = Badge.objects.create(name=rule.name, title=rule.title, description='', points=rule.points)
+        # Stored by another worker after this one read the held badges
+        UserBadge.objects.bulk_create([UserBadge(user=self.user, badge=badge, name=badge.title, spin=spin)])
+        engine = BadgeEngine()
+        self.assertEqual(engine._award([(rule, engine._outcomes([spin])[0])]), [])
+        self.assertFalse(LeaderboardScore.objects.exists())
+
+    def test_backfill_replays_history_in_batches(self):
+        for start in range(0, 6, 2):
+            self.completed_spin(self.products[start:start + 2])
+        self.completed_spin(self.products[:1], selected=False)
+        Spin.objects.update(status='completed', completed_at=timezone.now())
+
+        call_command('backfill_badges', batch_size=2, stdout=StringIO())
+        progress = BadgeProgress.objects.get(user=self.user)
+        self.assertEqual(progress.spins_completed, 4)
+        self.assertEqual(progress.best_budget_streak, 3)
+        self.assertEqual(len(progress.categories), 6)
+        self.assertEqual(
+            set(UserBadge.objects.filter(user=self.user).values_list('badge__name', flat=True)),
+            {'smart_shopper', 'budget_master', 'variety_explorer'},
+        )
+
+        call_command('backfill_badges', reset=True, stdout=StringIO())
+        self.assertEqual(BadgeProgress.objects.get(user=self.user).spins_completed, 4)
+        self.assertEqual(UserBadge.objects.filter(user=self.user).count(), 3)
+
+
+class FakeSortedSets:
+    # The few sorted set commands RedisLeaderboards uses, ordered like Redis: by score, then member
+    def __init__(self):
+        self.sets = {}
+
+    def exists(self, key):
+        return key in self.sets
+
+    def set(self, key, value):
+        self.sets[key] = value
+
+    def zadd(self, key, mapping, lt=False):
+        scores = self.sets.setdefault(key, {})
+        for member, score in mapping.items():
+            if not lt or member not in scores or score < scores[member]:
+                scores[member] = score
+
+    def _ordered(self, key):
+        return sorted(self.sets.get(key, {}).items(), key=lambda item: (item[1], item[0]))
+
+    def zrange(self, key, start, stop, withscores=False):
+        return [(member.encode(), score) for member, score in self._ordered(key)[start:stop + 1]]
+
+    def zrank(self, key, member):
+        members = [name for name, _ in self._ordered(key)]
+        return members.index(member) if member in members else None
+
+    def zscore(self, key, member):
+        return self.sets.get(key, {}).get(member)
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client, self.results = client, []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        def command(*args):
+            self.results.append(getattr(self.client, name)(*args))
+            return self
+        return command
+
+    def execute(self):
+        return self.results
+
+
+class LeaderboardTests(TestCase):
+    def setUp(self):
+        leaderboards.reset()
+        self.badges = [
+            Badge.objects.create(name=name, title=name, description='', points=points)
+            for name, points in (('smart_shopper', 10), ('budget_master', 15), ('loyal_customer', 20))
+        ]
+        self.users = [
+            User.objects.create_user(username=f'player{pk}', password='testtest1234', role='buyer') for pk in range(3)
+        ]
+        BuyerProfile.objects.create(user=self.users[0], buyer_type='household')
+        BuyerProfile.objects.create(user=self.users[2], buyer_type='household')
+        self.client = APIClient()
+        self.client.force_authenticate(self.users[0])
+
+    def award(self, user, badge):
+        with self.captureOnCommitCallbacks(execute=True):
+            UserBadge.objects.create(user=user, badge=badge, name=badge.title)
+
+    def test_sorted_board_ranks(self):
+        board = SortedBoard([(1, 10), (2, 30)])
+        board.update(3, 20)
+        board.update(1, 35)
+        board.update(1, 25)  # an older total
+        self.assertEqual(board.top(2), [(1, 35), (2, 30)])
+        self.assertEqual(board.rank(3), (3, 20))
+        self.assertIsNone(board.rank(4))
+
+    def test_scores_are_maintained_incrementally(self):
+        self.award(self.users[0], self.badges[0])
+        self.assertEqual(leaderboards.rank(GLOBAL_BOARD, self.users[0].id), (1, 10))  # board loaded from the table
+        self.award(self.users[1], self.badges[2])
+        self.award(self.users[2], self.badges[1])
+        self.award(self.users[0], self.badges[1])  # advances the loaded board in place
+
+        self.assertEqual(leaderboards.top(GLOBAL_BOARD, 3), [(self.users[0].id, 25), (self.users[1].id, 20), (self.users[2].id, 15)])
+        self.assertEqual(
+            LeaderboardScore.objects.get(board=weekly_board(), user=self.users[0]).points, 25
+        )
+
+        leaderboards.top('buyer:household', 1)  # first use loads the board from the table
+        with self.assertNumQueries(1):  # usernames of the top users; ranks come from the board
+            response = self.client.get(reverse('leaderboard', kwargs={'board': 'buyer-type'}))
+        self.assertEqual(response.json()['board'], 'buyer:household')
+        self.assertEqual([row['username'] for row in response.json()['results']], ['player0', 'player2'])
+        self.assertEqual(response.json()['me'], {'rank': 1, 'points': 25})
+
+    def test_local_boards_reload_awards_from_other_processes(self):
+        self.award(self.users[0], self.badges[0])
+        self.assertEqual(leaderboards.rank(GLOBAL_BOARD, self.users[0].id), (1, 10))
+        LeaderboardScore.objects.create(board=GLOBAL_BOARD, user=self.users[1], points=50)  # awarded elsewhere
+        self.assertEqual(leaderboards.rank(GLOBAL_BOARD, self.users[0].id), (1, 10))
+        later = time.monotonic() + gro_setting('LEADERBOARD_TTL') + 1
+        with mock.patch('groroulette.badges.leaderboard.time.monotonic', return_value=later):
+            self.assertEqual(leaderboards.rank(GLOBAL_BOARD, self.users[0].id), (2, 10))
+
+    def test_backends_break_ties_by_lowest_user_id(self):
+        for user in reversed(self.users):
+            LeaderboardScore.objects.create(board=GLOBAL_BOARD, user=user, points=10)
+        expected = [(user.id, 10) for user in self.users]
+        redis_boards = RedisLeaderboards(None, client=FakeSortedSets())
+        for backend in (LocalLeaderboards(), redis_boards):
+            self.assertEqual(backend.top(GLOBAL_BOARD, 3), expected)
+            self.assertEqual(backend.rank(GLOBAL_BOARD, self.users[1].id), (2, 10))
+        redis_boards.update(GLOBAL_BOARD, self.users[2].id, 15)
+        self.assertEqual(redis_boards.top(GLOBAL_BOARD, 1), [(self.users[2].id, 15)])
+
+    def test_award_published_after_the_board_loaded_counts_once(self):
+        for backend in (LocalLeaderboards(), RedisLeaderboards(None, client=FakeSortedSets())):
+            LeaderboardScore.objects.all().delete()
+            with mock.patch.object(leaderboards, '_backend', backend):
+                with self.captureOnCommitCallbacks() as published:
+                    UserBadge.objects.create(user=self.users[0], badge=self.badges[0], name=self.badges[0].title)
+                # The board is loaded between the commit and the publish, and already counts the award
+                self.assertEqual(leaderboards.rank(GLOBAL_BOARD, self.users[0].id), (1, 10))
+                for callback in published:
+                    callback()
+                self.assertEqual(leaderboards.rank(GLOBAL_BOARD, self.users[0].id), (1, 10))
+            UserBadge.objects.all().delete()
+
+    def test_rebuild_matches_incremental_totals(self):
+        self.award(self.users[0], self.badges[0])
+        self.award(self.users[1], self.badges[2])
+        before = sorted(LeaderboardScore.objects.values_list('board', 'user_id', 'points'))
+        call_command('rebuild_leaderboards', stdout=StringIO())
+        self.assertEqual(sorted(LeaderboardScore.objects.values_list('board', 'user_id', 'points')), before)
+
+
+class PreferenceCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        candidate_index.clear()
+        candidate_pool.clear()
+        self.user = User.objects.create_user(username='cached', password='testtest1234', role='buyer')
+        Product.objects.create(category=Category.objects.create(name='Fruit'), name='Mango', description='', price=Decimal('1500'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_preferences_are_cached_until_saved(self):
+        with self.assertNumQueries(4):  # get_or_create: select, savepoint, insert, release
+            created = load_preferences(self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(load_preferences(self.user).pk, created.pk)
+
+        created.allergies = ['nuts']
+        created.save()
+        with self.assertNumQueries(1):
+            self.assertEqual(load_preferences(self.user).allergies, ['nuts'])
+
+    def test_writes_start_from_the_stored_row(self):
+        load_preferences(self.user)  # cached copy, then changed behind its back (another worker, say)
+        UserPreference.objects.filter(user=self.user).update(allergies=['nuts'])
+        response = self.client.patch(reverse('user-preferences'), {'dietary_restrictions': ['vegan']}, format='json')
+        self.assertEqual(response.status_code, 200)
+        stored = UserPreference.objects.get(user=self.user)
+        self.assertEqual((stored.allergies, stored.dietary_restrictions), (['nuts'], ['vegan']))
+
+    def test_spin_creation_reads_preferences_once(self):
+        self.client.put(reverse('user-preferences'), {'dietary_restrictions': ['vegan']}, format='json')
+        user_pref = load_preferences(self.user)  # the save invalidated the cache; this refills it
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('spin-list-create'), {'budget': '3000'}, format='json')
+        self.assertFalse([query for query in queries if 'FROM "user_preferences"' in query['sql']])
+        self.assertEqual(response.status_code, 201)
+        spin = Spin.objects.get(id=response.json()['id'])
+        self.assertEqual(spin.preferences_id, user_pref.pk)
+        self.assertEqual(spin.preferences_snapshot['dietary_restrictions'], ['vegan'])
+
+
+class BulkSeedTests(TestCase):
+    def seed(self, seed):
+        call_command(
+            'seed_groroulette', bulk=True, products=40, users=6, spins=3, items_per_spin=5, seed=seed, stdout=StringIO()
+        )
+
+    def test_bulk_seed_is_consistent_and_deterministic(self):
+        self.seed(7)
+        self.assertEqual(Product.objects.count(), 40)
+        self.assertEqual(User.objects.filter(username__startswith='seed').count(), 6)
+        self.assertEqual(UserPreference.objects.count(), 6)
+        for spin in Spin.objects.annotate(selected=Count('items', filter=Q(items__is_selected=True))):
+            self.assertEqual(spin.selected_count, spin.selected)
+            self.assertLessEqual(spin.selected_count, spin.max_items_to_select)
+        self.assertTrue(User.objects.get(username='seed1').check_password('test1234'))
+        first = sorted(Spin.objects.values_list('id', flat=True))
+
+        Spin.objects.all().delete()
+        Product.objects.all().delete()
+        User.objects.all().delete()
+        self.seed(7)
+        self.assertEqual(sorted(Spin.objects.values_list('id', flat=True)), first)
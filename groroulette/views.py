@@ -1,9 +1,10 @@
 from django.shortcuts import render
+from django.contrib.auth import get_user_model
 from rest_framework import generics, permissions, status
 from .models import UserPreference, Spin, SpinItem, Badge, UserBadge
 from orders.models import Basket, BasketItem
 from .serializers import (
-    SpinItemUpdateSerializer, UserPreferenceSerializer, SpinSerializer, CreateSpinSerializer,SpinItemSerializer,
+    SpinItemUpdateSerializer, UserPreferenceSerializer, SpinSerializer, CreateSpinSerializer, CreateSpinBatchSerializer, SpinSummarySerializer, SpinItemSerializer, SpinItemBulkSelectSerializer,
     BasketSerializer, BadgeSerializer, UserBadgeSerializer
 )
 from rest_framework_simplejwt.authentication import JWTAuthentication
@@ -15,8 +16,28 @@ from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
+from django.db import transaction
+from django.db.models import Count, Prefetch, Q
+from django.urls import reverse
+import time
+
+from .common.conf import gro_setting
+from .common.pagination import KeysetPagination
+from .badges.leaderboard import GLOBAL_BOARD, buyer_board, leaderboards, weekly_board
+from .spins.pool import candidate_pool
+from .services import (  # budget optimizer and badge service for handling budget-related logic
+    BudgetOptimizerService, BadgeService, SpinSelectionService, SelectionClosed, SelectionLimitExceeded
+)
+from .preferences import request_preferences
+from .tasks import enqueue_spin_generation
+
 
-from .services import BudgetOptimizerService, BadgeService # budget optimizer and badge service for handling budget-related logic
+# Spins of one user with everything SpinSerializer reads loaded up front:
+# preferences joined in, items in one prefetch (category and image are stored on the items)
+def spins_with_items(user):
+    return Spin.objects.filter(user=user).select_related('preferences').prefetch_related(
+        Prefetch('items', queryset=SpinItem.objects.order_by('position_in_spin'))
+    )
 
 
 # User Preference View
@@ -30,8 +51,11 @@ class UserPreferenceView(generics.RetrieveUpdateAPIView):
     authentication_classes = [JWTAuthentication]
 
     def get_object(self):
-        user_pref, created = UserPreference.objects.get_or_create(user=self.request.user)
-        return user_pref
+        if self.request.method == 'GET':
+            return request_preferences(self.request)
+        # Writes start from the stored row: save() writes every column, so a stale cached copy
+        # would put back whatever another request or worker changed meanwhile
+        return UserPreference.objects.get_or_create(user=self.request.user)[0]
 
 
 # Spin List/Create View
@@ -45,6 +69,9 @@ class SpinListCreateView(generics.ListCreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     authentication_classes = [JWTAuthentication]
 
+    def get_queryset(self):
+        return spins_with_items(self.request.user)
+
     def get_serializer_class(self):
         # Use CreateSpinSerializer for POST, SpinSerializer for GET
         if self.request.method == 'POST':
@@ -58,33 +85,119 @@ class SpinListCreateView(generics.ListCreateAPIView):
         # Use optimizer service to generate spin
         # This service will handle the logic of creating a spin based on user preferences and budget
         optimizer = BudgetOptimizerService()
+
+        # Async mode: record a pending spin, hand the work to a worker once the row is committed,
+        # and let the client poll the result endpoint
+        if serializer.validated_data.get('mode', gro_setting('SPIN_GENERATION_MODE')) == 'async':
+            spin = optimizer.create_pending_spin(
+                user=request.user,
+                budget=serializer.validated_data['budget'],
+                currency=serializer.validated_data.get('currency', 'NGN'),
+                max_items=serializer.validated_data.get('max_items', 10),
+            )
+            transaction.on_commit(lambda: enqueue_spin_generation(str(spin.id)))
+            spin.refresh_from_db(fields=['status'])  # already 'generated' or 'failed' if the broker was down
+            return Response(
+                {
+                    'id': spin.id,
+                    'status': spin.status,
+                    'result_url': reverse('spin-result', kwargs={'spin_id': spin.id}),
+                },
+                status=status.HTTP_202_ACCEPTED
+            )
+
+        # The spin records the user's preferences and a snapshot of them as it is created
         spin = optimizer.generate_spin(
             user=request.user,
             budget=serializer.validated_data['budget'],
             currency=serializer.validated_data.get('currency', 'NGN'),
             max_items=serializer.validated_data.get('max_items', 10),
-            retailer_ids=serializer.validated_data.get('retailer_ids', [])
+            retailer_ids=serializer.validated_data.get('retailer_ids', []),
+            user_pref=request_preferences(request),
         )
 
-        # Copy preferences snapshot on spin creation
-        # This ensures that the spin has a record of the user's preferences at the time of creation
-        user_pref = UserPreference.objects.get(user=request.user)
-        spin.preferences = user_pref
-        spin.preferences_snapshot = {
-            "dietary_restrictions": user_pref.dietary_restrictions,
-            "allergies": user_pref.allergies,
-            "preferred_categories": user_pref.preferred_categories,
-            "excluded_brands": user_pref.excluded_brands,
-            "max_budget_default": str(user_pref.max_budget_default),
-        }
-        spin.save()
-
         return Response(
             SpinSerializer(spin).data,
             status=status.HTTP_201_CREATED
         )
 
 
+# Spin Batch Create View
+# Generates several spins in one request, e.g. one per week for household and company buyers.
+# The candidate set is loaded once and every spin and item is written in a single transaction.
+@method_decorator(csrf_exempt, name='dispatch')
+class SpinBatchCreateView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    authentication_classes = [JWTAuthentication]
+
+    def post(self, request):
+        serializer = CreateSpinBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        spins = BudgetOptimizerService().generate_spin_batch(
+            user=request.user,
+            budgets=serializer.validated_data['budgets'],
+            currency=serializer.validated_data['currency'],
+            max_items=serializer.validated_data['max_items'],
+            distinct_products=serializer.validated_data['distinct_products'],
+            user_pref=request_preferences(request),
+        )
+        return Response(
+            SpinSerializer(spins, many=True).data,
+            status=status.HTTP_201_CREATED
+        )
+
+
+# Candidate Cache Stats View
+# Hit/miss counters of the spin candidate pool cache, for sizing it. Staff only.
+class CandidateCacheStatsView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+    authentication_classes = [JWTAuthentication]
+
+    def get(self, request):
+        stats = candidate_pool.stats()
+        lookups = stats.get('hits', 0) + stats.get('misses', 0)
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else None
+        return Response(stats)
+
+
+# Spin Result View
+# Polling endpoint for spins created in async mode. It answers 202 while the spin is still pending
+# and the full spin once a worker has generated it (or marked it failed).
+# Clients can long-poll with ?wait=<seconds>; the request is held until the spin leaves 'pending'
+# or the wait runs out. The wait is capped by GROROULETTE['SPIN_RESULT_MAX_WAIT'] (2 seconds by
+# default) because a held request ties up a web worker; past it the client gets the 202 and
+# polls again after Retry-After.
+@method_decorator(csrf_exempt, name='dispatch')
+class SpinResultView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    authentication_classes = [JWTAuthentication]
+    poll_interval = 0.25
+
+    def get(self, request, spin_id):
+        spins = Spin.objects.filter(id=spin_id, user=request.user)
+        spin_status = spins.values_list('status', flat=True).first()
+        if spin_status is None:
+            return Response({"error": "Spin not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            wait = max(0, min(float(request.query_params.get('wait', 0)), gro_setting('SPIN_RESULT_MAX_WAIT')))
+        except ValueError:
+            wait = 0
+        deadline = time.monotonic() + wait
+        while spin_status == 'pending' and time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            spin_status = spins.values_list('status', flat=True).first()
+
+        if spin_status == 'pending':
+            return Response(
+                {'id': spin_id, 'status': spin_status},
+                status=status.HTTP_202_ACCEPTED,
+                headers={'Retry-After': '1'}
+            )
+        return Response(SpinSerializer(spins.get()).data)
+
+
 # Spin Detail View
 # This view allows users to retrieve and update the details of a specific spin.
 # It uses the SpinSerializer to handle the data.
@@ -97,21 +210,39 @@ class SpinDetailView(generics.RetrieveUpdateAPIView):
     authentication_classes = [JWTAuthentication]
     
     def get_queryset(self):
-        return Spin.objects.filter(user=self.request.user)
+        return spins_with_items(self.request.user)
 
 
 
 # Spin History View
 # This view allows users to view their spin history.
-# It lists all spins associated with the authenticated user.
+# It lists the spins of the authenticated user, newest first, a page at a time (?cursor=, ?page_size=).
+# ?view=summary returns only totals, status and item counts per spin; full items are then
+# fetched per spin from its detail_url.
 @method_decorator(csrf_exempt, name='dispatch')
 class SpinHistoryView(generics.ListAPIView):
     serializer_class = SpinSerializer
+    pagination_class = KeysetPagination
     permission_classes = [permissions.IsAuthenticated]
     authentication_classes = [JWTAuthentication]
 
+    def is_summary(self):
+        return self.request.query_params.get('view') == 'summary'
+
+    def get_serializer_class(self):
+        return SpinSummarySerializer if self.is_summary() else SpinSerializer
+
     def get_queryset(self):
-        return Spin.objects.filter(user=self.request.user)
+        if self.is_summary():
+            return (
+                Spin.objects.filter(user=self.request.user)
+                .only('id', 'budget', 'currency', 'total_value', 'status', 'created_at', 'completed_at')
+                .annotate(
+                    item_count=Count('items'),
+                    selected_item_count=Count('items', filter=Q(items__is_selected=True)),
+                )
+            )
+        return spins_with_items(self.request.user)
     
 
 # Start Item Selection View
@@ -156,31 +287,15 @@ def select_spin_item(request, spin_id, item_id):
     spin = get_object_or_404(Spin, id=spin_id, user=request.user)
     item = get_object_or_404(SpinItem, id=item_id, spin=spin)
     
-    if spin.status not in ['selecting', 'completed']: 
-        return Response(
-            {'error': 'Selection phase has not started'},
-            status=status.HTTP_400_BAD_REQUEST
-        )
-    
     selected = request.data.get('selected', False)
     
-    if selected:
-        # Check if max items limit reached
-        selected_count = spin.items.filter(is_selected=True).count()
-        if selected_count >= spin.max_items_to_select:
-            return Response(
-                {'error': f'Maximum {spin.max_items_to_select} items can be selected'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-        
-        item.is_selected = True
-        item.selected_at = timezone.now()
-    else:
-        item.is_selected = False
-        item.selected_at = None
-    
-    item.save()
+    # The status check, the max items check and the selected_count update all happen in the service
+    try:
+        SpinSelectionService().set_selected(spin, [item.id], bool(selected))
+    except (SelectionClosed, SelectionLimitExceeded) as exc:
+        return Response({'error': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
     
+    item.refresh_from_db()
     return Response(SpinItemSerializer(item).data)
 
 
@@ -198,11 +313,9 @@ def complete_spin(request, spin_id):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    selected_items = spin.items.filter(is_selected=True)
-    
     spin.status = 'completed'
     spin.completed_at = timezone.now()
-    spin.save()
+    spin.save(update_fields=['status', 'completed_at'])
     
     # Check for badges
     # This service checks if the user has earned any badges based on their spin selections
@@ -211,7 +324,7 @@ def complete_spin(request, spin_id):
     
     return Response({
         'message': 'Spin completed successfully',
-        'selected_items_count': selected_items.count(),
+        'selected_items_count': spin.selected_count,
         'max_items_allowed': spin.max_items_to_select,
         'badges_earned': badges_earned
     })
@@ -256,13 +369,41 @@ class SpinItemUpdateView(generics.UpdateAPIView):
 class SpinItemSelectView(APIView):
     def put(self, request, spin_id, item_id):
         try:
-            item = SpinItem.objects.get(spin_id=spin_id, id=item_id)
-            item.is_selected = True
-            item.save()
+            item = SpinItem.objects.select_related('spin').get(spin_id=spin_id, id=item_id)
+            SpinSelectionService().set_selected(item.spin, [item.id], True)
             return Response({"selected": True}, status=status.HTTP_200_OK)
         except SpinItem.DoesNotExist:
             return Response({"error": "SpinItem not found"}, status=status.HTTP_404_NOT_FOUND)
-        
+        except (SelectionClosed, SelectionLimitExceeded) as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+# Spin Item Bulk Select View
+# Selects or deselects a list of items of one spin in a single request and transaction.
+# Selecting is all or nothing: if the items would take the spin past max_items_to_select,
+# none of them are selected.
+@method_decorator(csrf_exempt, name='dispatch')
+class SpinItemBulkSelectView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    authentication_classes = [JWTAuthentication]
+
+    def post(self, request, spin_id):
+        spin = get_object_or_404(Spin, id=spin_id, user=request.user)
+        serializer = SpinItemBulkSelectSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        try:
+            changed = SpinSelectionService().set_selected(
+                spin, serializer.validated_data['item_ids'], serializer.validated_data['selected']
+            )
+        except (SelectionClosed, SelectionLimitExceeded) as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({
+            "changed": changed,
+            "selected_count": spin.selected_count,
+            "max_items_to_select": spin.max_items_to_select,
+        })
+
 
 
 # Selected Spin Item List View
@@ -347,4 +488,47 @@ class UserBadgeListView(generics.ListAPIView):
     authentication_classes = [JWTAuthentication]
 
     def get_queryset(self):
-        return UserBadge.objects.filter(user=self.request.user)
\ No newline at end of file
+        return UserBadge.objects.filter(user=self.request.user)
+
+
+# Leaderboard View
+# Badge points boards: /leaderboard/global/, /leaderboard/weekly/ (current ISO week) and
+# /leaderboard/buyer-type/ (the caller's BuyerProfile.buyer_type, or ?buyer_type=).
+# Returns the top ?limit= users and the caller's own rank, both read from the materialized
+# boards in groroulette/badges/leaderboard.py.
+@method_decorator(csrf_exempt, name='dispatch')
+class LeaderboardView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    authentication_classes = [JWTAuthentication]
+
+    def get(self, request, board):
+        if board == 'global':
+            name = GLOBAL_BOARD
+        elif board == 'weekly':
+            name = weekly_board()
+        elif board == 'buyer-type':
+            profile = getattr(request.user, 'buyerprofile', None)
+            buyer_type = request.query_params.get('buyer_type') or getattr(profile, 'buyer_type', None)
+            if not buyer_type:
+                return Response({"error": "buyer_type is required"}, status=status.HTTP_400_BAD_REQUEST)
+            name = buyer_board(buyer_type)
+        else:
+            return Response({"error": "Unknown leaderboard"}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 10)), gro_setting('LEADERBOARD_MAX_LIMIT')))
+        except ValueError:
+            limit = 10
+        top = leaderboards.top(name, limit)
+        usernames = dict(
+            get_user_model().objects.filter(id__in=[user_id for user_id, _ in top]).values_list('id', 'username')
+        )
+        mine = leaderboards.rank(name, request.user.id)
+        return Response({
+            'board': name,
+            'results': [
+                {'rank': rank, 'user_id': user_id, 'username': usernames.get(user_id), 'points': points}
+                for rank, (user_id, points) in enumerate(top, start=1)
+            ],
+            'me': {'rank': mine[0], 'points': mine[1]} if mine else {'rank': None, 'points': 0},
+        })
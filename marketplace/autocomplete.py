@@ -0,0 +1,317 @@
+import heapq
+import logging
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Sum
+
+from .models import Category, Product
+
+MAX_SUGGESTIONS = 20   # most suggestions one lookup may return
+SCAN_LIMIT = 256       # prefixes matching more index entries than this get a precomputed top list
+END = '\U0010ffff'     # sorts after every character, so [prefix, prefix + END) is the prefix range
+
+logger = logging.getLogger(__name__)
+
+
+def normalize(text):
+    """Lower case, accents stripped, anything but letters and digits turned into single spaces."""
+    text = unicodedata.normalize('NFKD', text or '').lower()
+    text = ''.join(char if char.isalnum() else ' ' for char in text if not unicodedata.combining(char))
+    return ' '.join(text.split())
+
+
+def index_keys(name):
+    """The keys a name is found under: the whole name and the rest of it from every later word."""
+    words = normalize(name).split()
+    return {' '.join(words[start:]) for start in range(len(words))}
+
+
+class Suggestion(NamedTuple):
+    type: str
+    id: int
+    name: str
+    weight: int
+
+
+def rank(suggestion):
+    """Sort key of a suggestion, best last: heaviest, then lowest id (then a product before a category)."""
+    return suggestion.weight, -suggestion.id, suggestion.type
+
+
+# Autocomplete Index
+# In-process prefix index over normalized product and category names for type-ahead. Every name
+# is stored under each of its word suffixes ("brown rice" and "rice"), in one sorted list of
+# (key, type, id), so the names matching a prefix are the contiguous slice found with two
+# bisects. Suggestions are the heaviest names in that slice: product popularity, or for a
+# category the popularity of all its products.
+#
+# A prefix matching more than SCAN_LIMIT entries keeps its top MAX_SUGGESTIONS precomputed,
+# merged from the top lists of its one-character-longer prefixes, so no lookup looks at more
+# than SCAN_LIMIT entries plus a few dozen short lists. A change moves the one name it touched
+# within the top lists along its keys; a list is only merged again when that name drops out of
+# it or sinks, since what should take its place is not in the list.
+#
+# The index loads on the first lookup, is updated in place by the Product and Category receivers
+# in marketplace/signals.py after each commit, and reloads once older than
+# settings.PRODUCT_AUTOCOMPLETE_TTL seconds to pick up other processes' writes. That reload runs
+# on a background thread while lookups keep being answered from the current index; updates that
+# arrive while it reads the tables are applied to both, then replayed onto the new index.
+class AutocompleteIndex:
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._rebuild_lock = threading.Lock()   # one load at a time; taken before _lock, never inside it
+        self._entries = None        # sorted [(key, type, id)]
+        self._items = {}            # (type, id) -> Suggestion
+        self._keys = {}             # (type, id) -> set of keys
+        self._product_categories = {}   # product id -> (category id, popularity)
+        self._top = {}              # prefix -> [Suggestion], heaviest first, for large prefix slices
+        self._loaded_at = 0
+        self._pending = None        # [(method, args)] of updates made while a rebuild reads the tables
+        self._refreshing = False
+
+    def clear(self):
+        with self._lock:
+            self._entries = None
+            self._items, self._keys, self._product_categories, self._top = {}, {}, {}, {}
+
+    def rebuild(self):
+        with self._rebuild_lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        with self._lock:
+            self._pending = []
+        try:
+            fresh = AutocompleteIndex()
+            fresh._load()
+            with self._lock:
+                for method, args in self._pending:
+                    getattr(fresh, method)(*args)
+                self._entries, self._items, self._keys = fresh._entries, fresh._items, fresh._keys
+                self._product_categories, self._top = fresh._product_categories, fresh._top
+                self._loaded_at = time.monotonic()
+        finally:
+            with self._lock:
+                self._pending = None
+
+    def _load(self):
+        products = Product.objects.values_list('id', 'name', 'popularity', 'category_id')
+        category_weights = dict(
+            Product.objects.order_by().values('category_id').annotate(total=Sum('popularity'))
+            .values_list('category_id', 'total')
+        )
+        self._entries = []
+        for product_id, name, popularity, category_id in products.iterator(chunk_size=2000):
+            self._put(Suggestion('product', product_id, name, popularity), sort=False)
+            self._product_categories[product_id] = (category_id, popularity)
+        for category_id, name in Category.objects.values_list('id', 'name'):
+            self._put(Suggestion('category', category_id, name, category_weights.get(category_id) or 0), sort=False)
+        self._entries.sort()
+        self._build_top('', 0, len(self._entries))
+        self._loaded_at = time.monotonic()
+
+    def _ensure_loaded(self):
+        if self._entries is None:
+            with self._rebuild_lock:  # nothing to serve yet, so the first lookup waits for the load
+                if self._entries is None:
+                    self._rebuild()
+            return
+        ttl = getattr(settings, 'PRODUCT_AUTOCOMPLETE_TTL', 300)
+        with self._lock:
+            if not ttl or self._refreshing or time.monotonic() - self._loaded_at <= ttl:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, name='autocomplete-rebuild', daemon=True).start()
+
+    def _refresh(self):
+        try:
+            self.rebuild()
+        except Exception:
+            logger.exception('Reloading the autocomplete index failed; the current one stays in use')
+            with self._lock:
+                self._loaded_at = time.monotonic()  # try again after another TTL, not on every lookup
+        finally:
+            self._refreshing = False
+            connection.close()  # this thread's own connection
+
+    # lookups
+
+    def suggest(self, query, limit=10):
+        prefix = normalize(query)
+        limit = max(1, min(limit, MAX_SUGGESTIONS))
+        if not prefix:
+            return []
+        self._ensure_loaded()
+        with self._lock:
+            if self._entries is None:
+                return []  # cleared meanwhile
+            top = self._top.get(prefix)
+            if top is not None:
+                return top[:limit]
+            return self._scan(*self._slice(prefix), limit)
+
+    def _slice(self, prefix, low=0, high=None):
+        high = len(self._entries) if high is None else high
+        low = bisect_left(self._entries, (prefix,), low, high)
+        return low, bisect_left(self._entries, (prefix + END,), low, high)
+
+    def _scan(self, low, high, limit=MAX_SUGGESTIONS):
+        matches = {(kind, pk) for _, kind, pk in self._entries[low:high]}  # a name can match through two words
+        return self._heaviest(matches, limit)
+
+    def _heaviest(self, items, limit=MAX_SUGGESTIONS):
+        return heapq.nlargest(limit, (self._items[item] for item in items), key=rank)
+
+    def _build_top(self, prefix, low, high, recurse=True):
+        """
+        Top list of the entries in [low, high), which all start with `prefix`, merged from the top
+        lists of the longer prefixes inside it and stored when the slice is over SCAN_LIMIT.
+        With recurse=False the longer prefixes' stored lists are trusted as they are.
+        """
+        if high - low <= SCAN_LIMIT:
+            self._top.pop(prefix, None)
+            return self._scan(low, high)
+        candidates = set()
+        position = low
+        while position < high:
+            key = self._entries[position][0]
+            if len(key) == len(prefix):  # the prefix is a whole key
+                candidates.add(self._entries[position][1:])
+                position += 1
+                continue
+            child = prefix + key[len(prefix)]
+            child_low, child_high = self._slice(child, position, high)
+            if recurse:
+                child_top = self._build_top(child, child_low, child_high)
+            else:
+                child_top = self._top.get(child) or self._scan(child_low, child_high)
+            candidates.update((item.type, item.id) for item in child_top)
+            position = child_high
+        top = self._heaviest(candidates)
+        if prefix:
+            self._top[prefix] = top
+        return top
+
+    # updates
+
+    def upsert_product(self, product_id, name, popularity, category_id):
+        with self._lock:
+            self._record('upsert_product', product_id, name, popularity, category_id)
+            if self._entries is None:
+                return  # nothing loaded yet; the first lookup reads the current rows
+            item = ('product', product_id)
+            touched = self._discard(item)
+            touched |= self._put(Suggestion('product', product_id, name, popularity))
+            self._refresh_top(item, touched)
+            previous_category, previous_popularity = self._product_categories.get(product_id, (None, 0))
+            self._product_categories[product_id] = (category_id, popularity)
+            if previous_category == category_id:
+                self._reweigh_category(category_id, popularity - previous_popularity)
+            else:
+                self._reweigh_category(previous_category, -previous_popularity)
+                self._reweigh_category(category_id, popularity)
+
+    def remove_product(self, product_id):
+        with self._lock:
+            self._record('remove_product', product_id)
+            if self._entries is None:
+                return
+            item = ('product', product_id)
+            self._refresh_top(item, self._discard(item))
+            category_id, popularity = self._product_categories.pop(product_id, (None, 0))
+            self._reweigh_category(category_id, -popularity)
+
+    def upsert_category(self, category_id, name):
+        with self._lock:
+            self._record('upsert_category', category_id, name)
+            if self._entries is None:
+                return
+            item = ('category', category_id)
+            previous = self._items.get(item)
+            touched = self._discard(item)
+            touched |= self._put(Suggestion('category', category_id, name, previous.weight if previous else 0))
+            self._refresh_top(item, touched)
+
+    def remove_category(self, category_id):
+        with self._lock:
+            self._record('remove_category', category_id)
+            if self._entries is not None:
+                item = ('category', category_id)
+                self._refresh_top(item, self._discard(item))
+
+    def _record(self, method, *args):
+        if self._pending is not None:  # a rebuild is reading the tables; it may read this change or not
+            self._pending.append((method, args))
+
+    def _put(self, suggestion, sort=True):
+        item = (suggestion.type, suggestion.id)
+        keys = index_keys(suggestion.name)
+        self._items[item] = suggestion
+        self._keys[item] = keys
+        for key in keys:
+            if sort:
+                insort(self._entries, (key, *item))
+            else:
+                self._entries.append((key, *item))
+        return set(keys)
+
+    def _discard(self, item):
+        keys = self._keys.pop(item, set())
+        self._items.pop(item, None)
+        for key in keys:
+            index = bisect_left(self._entries, (key, *item))
+            if index < len(self._entries) and self._entries[index] == (key, *item):
+                del self._entries[index]
+        return keys
+
+    def _reweigh_category(self, category_id, delta):
+        item = ('category', category_id)
+        category = self._items.get(item)
+        if category is None or not delta:
+            return
+        self._items[item] = category._replace(weight=category.weight + delta)
+        self._refresh_top(item, self._keys[item])
+
+    def _refresh_top(self, item, keys):
+        """Bring the top lists of every prefix of `keys` up to date after `item` changed, deepest prefix first."""
+        suggestion, current_keys = self._items.get(item), self._keys.get(item, ())
+        prefixes = {key[:length] for key in keys for length in range(1, len(key) + 1)}
+        for prefix in sorted(prefixes, key=len, reverse=True):
+            low, high = self._slice(prefix)
+            top = self._top.get(prefix)
+            if high - low <= SCAN_LIMIT:
+                self._top.pop(prefix, None)
+                continue
+            matches = suggestion if any(key.startswith(prefix) for key in current_keys) else None
+            if top is None or not self._move(top, item, matches):
+                self._build_top(prefix, low, high, recurse=False)
+
+    def _move(self, top, item, suggestion):
+        """
+        Put `item` where it now belongs in one top list (suggestion None: it no longer matches the
+        prefix). False when the list has to be merged again instead.
+        """
+        position = next((index for index, entry in enumerate(top) if (entry.type, entry.id) == item), None)
+        if position is not None:
+            if suggestion is None or rank(suggestion) < rank(top[position]):
+                return False  # it left or sank; the name that should take its place is not in the list
+            del top[position]
+        elif suggestion is None:
+            return True
+        elif len(top) >= MAX_SUGGESTIONS:
+            if rank(suggestion) <= rank(top[-1]):
+                return True
+            top.pop()
+        index = next((index for index, entry in enumerate(top) if rank(entry) < rank(suggestion)), len(top))
+        top.insert(index, suggestion)
+        return True
+
+
+autocomplete_index = AutocompleteIndex()
@@ -0,0 +1,88 @@
+import base64
+import binascii
+import heapq
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+
+from .models import Product, ProductTombstone
+from .pagination import cursor_value
+
+
+# Product Changes Feed
+# What changed in the catalog since a client last synced, for clients that keep a local copy:
+#
+#   upserted   products created or updated, by Product.updated_at (ratings and category renames
+#              touch it as well, see marketplace/ratings.py and marketplace/signals.py)
+#   deleted    products deleted, by ProductTombstone.deleted_at
+#
+# Both streams are read in (time, id) order from their indexes and merged, a page at a time.
+# The cursor holds the last (time, id) taken from each stream, so a client stores `next` and
+# sends it back as ?since= next time; without one the feed starts from the first product.
+#
+# updated_at is stamped when a row is written, not when its transaction commits, so the feed
+# stops settings.PRODUCT_CHANGES_LAG seconds short of now: a write that commits within that
+# long after stamping its row is never skipped by a cursor that has already moved past it.
+def product_changes(since=None, size=100):
+    """{'upserted': [id], 'deleted': [id], 'next': cursor, 'has_more': bool} for the changes after `since`."""
+    position = decode_changes_cursor(since)
+    until = timezone.now() - timedelta(seconds=getattr(settings, 'PRODUCT_CHANGES_LAG', 5))
+    upserts = _stream(Product.objects, 'updated_at', 'id', position['u'], until, size)
+    deletes = _stream(ProductTombstone.objects, 'deleted_at', 'product_id', position['d'], until, size)
+
+    changes = {'u': [], 'd': []}
+    merged = heapq.merge(
+        ((key, 'u') for key in upserts), ((key, 'd') for key in deletes), key=lambda change: change[0]
+    )
+    for key, stream in merged:
+        if len(changes['u']) + len(changes['d']) == size:
+            break
+        changes[stream].append(key)
+        position[stream] = key
+    taken = len(changes['u']) + len(changes['d'])
+    return {
+        'upserted': [pk for _, pk in changes['u']],
+        'deleted': [pk for _, pk in changes['d']],
+        'next': encode_changes_cursor(position),
+        'has_more': len(upserts) + len(deletes) > taken,
+    }
+
+
+def _stream(manager, time_field, id_field, after, until, size):
+    rows = manager.filter(**{f'{time_field}__lte': until})
+    if after is not None:
+        moment, pk = after
+        rows = rows.filter(
+            Q(**{f'{time_field}__gt': moment}) | Q(**{time_field: moment, f'{id_field}__gt': pk}),
+            **{f'{time_field}__gte': moment},
+        )
+    return list(rows.order_by(time_field, id_field).values_list(time_field, id_field)[:size + 1])
+
+
+def encode_changes_cursor(position):
+    cursor = json.dumps(position, default=cursor_value, separators=(',', ':'))
+    return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+
+def decode_changes_cursor(encoded):
+    if not encoded:
+        return {'u': None, 'd': None}
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+        position = {}
+        for stream in ('u', 'd'):
+            key = cursor[stream]
+            if key is not None:
+                moment = parse_datetime(key[0])
+                if moment is None:
+                    raise ValueError(key[0])
+                key = (moment, int(key[1]))
+            position[stream] = key
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError, KeyError, IndexError):
+        raise NotFound('Invalid cursor')
+    return position
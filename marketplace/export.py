@@ -0,0 +1,48 @@
+import zlib
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import Product
+from .serializers import ProductSerializer
+
+CHUNK_SIZE = 500         # products fetched per database round trip; peak memory is about one chunk
+BLOCK_SIZE = 64 * 1024   # bytes of NDJSON gathered before each write / yield
+
+
+# Catalog Export
+# The whole catalog as NDJSON, one ProductSerializer object per line (the product list shape:
+# category nested, rating aggregates, no individual ratings), in id order. Products are read with
+# .iterator(chunk_size) and serialized one at a time, so memory stays flat whatever the catalog
+# size; lines are gathered into blocks of about BLOCK_SIZE bytes so a streaming response or a
+# file is written in a few large pieces rather than a line at a time.
+#
+# Used by ProductExportView (streamed, ?compress=gzip for a gzip body) and by the export_catalog
+# command (to a file or stdout, --gzip).
+def catalog_blocks(chunk_size=CHUNK_SIZE, compress=False):
+    blocks = _ndjson_blocks(chunk_size)
+    return _gzip(blocks) if compress else blocks
+
+
+def _ndjson_blocks(chunk_size):
+    serializer = ProductSerializer(context={'expand': ()})  # bound once, reused for every row
+    encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    products = Product.objects.select_related('category').order_by('id')
+    block, size = [], 0
+    for product in products.iterator(chunk_size=chunk_size):
+        line = (encoder.encode(serializer.to_representation(product)) + '\n').encode()
+        block.append(line)
+        size += len(line)
+        if size >= BLOCK_SIZE:
+            yield b''.join(block)
+            block, size = [], 0
+    if block:
+        yield b''.join(block)
+
+
+def _gzip(blocks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # wbits 16+ writes the gzip framing
+    for block in blocks:
+        data = compressor.compress(block)
+        if data:
+            yield data
+    yield compressor.flush()
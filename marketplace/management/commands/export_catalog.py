@@ -0,0 +1,33 @@
+import sys
+
+from django.core.management.base import BaseCommand
+
+from marketplace.export import CHUNK_SIZE, catalog_blocks
+
+
+class Command(BaseCommand):
+    help = 'Write the whole product catalog as NDJSON, one product per line, to a file or stdout'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default='-', help='File to write (default: stdout); a .gz name implies --gzip')
+        parser.add_argument('--gzip', action='store_true', help='Gzip the output')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Products fetched per database round trip')
+
+    def handle(self, *args, **options):
+        output = options['output']
+        compress = options['gzip'] or output.endswith('.gz')
+        blocks = catalog_blocks(chunk_size=options['chunk_size'], compress=compress)
+        if output == '-':
+            written = self.write(sys.stdout.buffer, blocks)
+        else:
+            with open(output, 'wb') as stream:
+                written = self.write(stream, blocks)
+        self.stderr.write(self.style.SUCCESS(f'Exported the catalog: {written} bytes to {output}'))
+
+    def write(self, stream, blocks):
+        written = 0
+        for block in blocks:
+            stream.write(block)
+            written += len(block)
+        stream.flush()
+        return written
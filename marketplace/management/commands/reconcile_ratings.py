@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from marketplace.ratings import reconcile_rating_aggregates
+
+
+class Command(BaseCommand):
+    help = 'Recompute the rating count, sum and histogram stored on every product from its ratings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Products locked and checked per transaction')
+
+    def handle(self, *args, **options):
+        corrected = reconcile_rating_aggregates(batch_size=options['batch_size'], stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(f'Corrected the rating aggregates of {corrected} products'))
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-17 23:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("marketplace", "0005_product_popularity"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="brand",
+            field=models.CharField(blank=True, default="", max_length=100),
+        ),
+    ]
@@ -0,0 +1,76 @@
+# Generated by Django 5.2.5 on 2026-10-17 23:43
+
+import django.core.validators
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def count_ratings(apps, schema_editor):
+    Product = apps.get_model("marketplace", "Product")
+    ProductRating = apps.get_model("marketplace", "ProductRating")
+
+    def aggregate(expression):
+        rows = ProductRating.objects.filter(product_id=OuterRef("pk")).order_by().values("product_id")
+        return Coalesce(Subquery(rows.annotate(value=expression).values("value")[:1], output_field=IntegerField()), 0)
+
+    Product.objects.update(
+        rating_count=aggregate(Count("id")),
+        rating_sum=aggregate(Sum("rating")),
+        **{f"rating_{value}_count": aggregate(Count("id", filter=Q(rating=value))) for value in range(1, 6)},
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("marketplace", "0006_product_brand"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="rating_1_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_2_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_3_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_4_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_5_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="product",
+            name="rating_sum",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name="productrating",
+            name="rating",
+            field=models.PositiveSmallIntegerField(
+                validators=[
+                    django.core.validators.MinValueValidator(1),
+                    django.core.validators.MaxValueValidator(5),
+                ]
+            ),
+        ),
+        migrations.RunPython(count_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,53 @@
+from django.db import migrations
+
+# The full-text index tables are backend specific (FTS5 on SQLite, tsvector + GIN on PostgreSQL)
+# and not Django models. Their SQL is written out here as it stood for this migration, rather
+# than imported from marketplace/search.py, so later changes there cannot change what this
+# migration does. Other databases get no table and product search falls back to LIKE matching.
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS marketplace_product_fts USING fts5("
+    "name, category, description, tokenize='porter unicode61 remove_diacritics 2', prefix='2 3')",
+    "INSERT INTO marketplace_product_fts (rowid, name, category, description) "
+    "SELECT p.id, p.name, c.name, p.description FROM marketplace_product p "
+    "JOIN marketplace_category c ON c.id = p.category_id",
+]
+SQLITE_DROP = ["DROP TABLE IF EXISTS marketplace_product_fts"]
+
+POSTGRESQL_CREATE = [
+    "CREATE TABLE IF NOT EXISTS marketplace_product_search ("
+    "product_id bigint PRIMARY KEY REFERENCES marketplace_product (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+    "document tsvector NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS marketplace_product_search_document_idx "
+    "ON marketplace_product_search USING GIN (document)",
+    "INSERT INTO marketplace_product_search (product_id, document) "
+    "SELECT p.id, "
+    "setweight(to_tsvector('english', p.name), 'A') || "
+    "setweight(to_tsvector('english', c.name), 'B') || "
+    "setweight(to_tsvector('english', p.description), 'C') "
+    "FROM marketplace_product p JOIN marketplace_category c ON c.id = p.category_id "
+    "ON CONFLICT (product_id) DO NOTHING",
+]
+POSTGRESQL_DROP = ["DROP TABLE IF EXISTS marketplace_product_search"]
+
+CREATE = {"sqlite": SQLITE_CREATE, "postgresql": POSTGRESQL_CREATE}
+DROP = {"sqlite": SQLITE_DROP, "postgresql": POSTGRESQL_DROP}
+
+
+def create_search_index(apps, schema_editor):
+    for statement in CREATE.get(schema_editor.connection.vendor, ()):
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    for statement in DROP.get(schema_editor.connection.vendor, ()):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("marketplace", "0007_product_rating_aggregates"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18 00:13
+
+import time
+
+from django.db import migrations, models
+
+
+def create_versions(apps, schema_editor):
+    CollectionVersion = apps.get_model("marketplace", "CollectionVersion")
+    CollectionVersion.objects.bulk_create(
+        [CollectionVersion(collection=collection, stamp=time.time_ns()) for collection in ("categories", "products")]
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("marketplace", "0010_product_changes_feed"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CollectionVersion",
+            fields=[
+                (
+                    "collection",
+                    models.CharField(max_length=50, primary_key=True, serialize=False),
+                ),
+                ("stamp", models.BigIntegerField()),
+            ],
+        ),
+        migrations.RunPython(create_versions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.2.5 on 2026-10-18 00:28
+
+import re
+
+from django.db import migrations, models
+
+# Frozen copy of groroulette.products.masks.preference_keys as of this migration
+IMPLIED_TAGS = {
+    "vegan": ("vegetarian", "dairy_free", "plant_based"),
+    "plant_based": ("vegetarian",),
+    "lactose_free": ("dairy_free",),
+}
+
+
+def normalize(value):
+    return re.sub(r"[\s\-]+", "_", str(value).strip().lower())
+
+
+def preference_keys(tags, brand):
+    keys = set()
+    for tag in tags or ():
+        key = normalize(tag)
+        if key:
+            keys.update(f"tag:{name}" for name in (key,) + IMPLIED_TAGS.get(key, ()))
+    if normalize(brand or ""):
+        keys.add(f"brand:{normalize(brand)}")
+    return "|" + "".join(f'{key.replace("|", "_")}|' for key in sorted(keys)) if keys else ""
+
+
+def fill_preference_keys(apps, schema_editor):
+    Product = apps.get_model("marketplace", "Product")
+    batch = []
+    for product in Product.objects.only("id", "dietary_tags", "brand").iterator(chunk_size=1000):
+        product.preference_keys = preference_keys(product.dietary_tags, product.brand)
+        if product.preference_keys:
+            batch.append(product)
+        if len(batch) == 1000:
+            Product.objects.bulk_update(batch, ["preference_keys"])
+            batch = []
+    if batch:
+        Product.objects.bulk_update(batch, ["preference_keys"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("marketplace", "0011_collection_versions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="preference_keys",
+            field=models.TextField(blank=True, default="", editable=False),
+        ),
+        migrations.RunPython(fill_preference_keys, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,21 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
 from django.conf import settings
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.utils import timezone
+
+from groroulette.products.masks import preference_keys
 
 
 User = get_user_model()
 
+RATING_VALUES = range(1, 6)
+
+
+def rating_histogram_field(value):
+    """Name of the Product column counting ratings of `value` stars."""
+    return f'rating_{value}_count'
+
 
 # Category Model
 class Category(models.Model):
@@ -27,34 +38,104 @@ class Product(models.Model):
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     price_unit = models.CharField(max_length=50, blank=True, null=True)
+    brand = models.CharField(max_length=100, blank=True, default='')
     dietary_tags = models.JSONField(default=list, blank=True)  # TO_DO ... try CharField with choices
+    # dietary_tags and brand normalised for ?match_preferences= (see groroulette/products/masks.py);
+    # set by save(), so bulk writes must fill it in themselves
+    preference_keys = models.TextField(blank=True, default='', editable=False)
     stock = models.PositiveIntegerField(default=0)
     popularity = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Rating aggregates, kept in step with ProductRating by marketplace/ratings.py
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        # Keyset pagination of the catalog (marketplace/pagination.py) in each sort order it offers
+        indexes = [
+            models.Index(fields=['price', 'id'], name='products_price_id_idx'),
+            models.Index(fields=['created_at', 'id'], name='products_created_id_idx'),
+            models.Index(fields=['category', 'price', 'id'], name='products_category_price_id_idx'),
+            models.Index(fields=['updated_at', 'id'], name='products_updated_id_idx'),  # the changes feed
+        ]
+
+    def save(self, *args, **kwargs):
+        self.preference_keys = preference_keys(self.dietary_tags, self.brand)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'dietary_tags', 'brand'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'preference_keys'}
+        super().save(*args, **kwargs)
+
     @property
     def average_rating(self):
-        ratings = self.ratings.all()
-        if ratings.exists():
-            return round(sum(r.rating for r in ratings) / ratings.count(), 1)
+        if self.rating_count:
+            return round(self.rating_sum / self.rating_count, 1)
         return 0
 
+    @property
+    def rating_histogram(self):
+        return {value: getattr(self, rating_histogram_field(value)) for value in RATING_VALUES}
+
     def __str__(self):
         return self.name
 
 
+# Product Tombstone Model
+# One row per deleted product, written by the Product post_delete receiver, so the changes feed
+# (marketplace/changes.py) can tell clients which ids to drop.
+class ProductTombstone(models.Model):
+    product_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['deleted_at', 'product_id'], name='tombstones_deleted_id_idx')]
+
+    def __str__(self):
+        return f"product {self.product_id} deleted {self.deleted_at:%Y-%m-%d %H:%M}"
+
+
+# Collection Version Model
+# The version stamp of a marketplace collection, read by the conditional GETs in
+# marketplace/versions.py. Kept in the database so every web and Celery worker sees the same one.
+class CollectionVersion(models.Model):
+    collection = models.CharField(max_length=50, primary_key=True)
+    stamp = models.BigIntegerField()  # time.time_ns() of the last change
+
+    def __str__(self):
+        return f"{self.collection} @ {self.stamp}"
+
+
 # Product Rating Model
 class ProductRating(models.Model):
     product = models.ForeignKey(Product, related_name='ratings', on_delete=models.CASCADE)
     user = models.ForeignKey(User, related_name='product_ratings', on_delete=models.CASCADE)
-    rating = models.PositiveSmallIntegerField()  # values 1-5
+    rating = models.PositiveSmallIntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])  # values 1-5
     review = models.TextField(blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         unique_together = ('product', 'user')
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'rating' in field_names:
+            instance._stored_rating = instance.rating  # what the product aggregates currently count
+        return instance
+
+    def save(self, *args, **kwargs):
+        # The post_save receiver moves the product aggregates; doing it in the same transaction
+        # keeps them from drifting if either write fails
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.user} rated {self.product} ({self.rating})"
 
@@ -0,0 +1,76 @@
+import base64
+import binascii
+import json
+from functools import reduce
+from operator import and_, or_
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+
+from groroulette.common.pagination import KeysetPagination
+
+
+# Catalog Pagination
+# Keyset pages in whatever order the filters left the queryset: ?ordering= from OrderingFilter,
+# relevance from ProductSearchFilter, or the default id order. `id` is appended as a tie-breaker
+# (in the direction of the last key) so the order is total, and the cursor carries the ordering
+# and the last row's value for every key. The next page is "rows after that key":
+#
+#   price >= p AND (price > p OR (price = p AND id > i))
+#
+# where the leading bound lets the (price, id), (created_at, id) and (category_id, price, id)
+# indexes on Product answer it as a range scan, so page 500 costs the same as page 1.
+class CatalogPagination(KeysetPagination):
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        size = self.get_page_size(request)
+        self.ordering = [name for name in queryset.query.order_by if isinstance(name, str)] or ['id']
+        if not {'id', '-id', 'pk', '-pk'} & set(self.ordering):
+            self.ordering.append('-id' if self.ordering[-1].startswith('-') else 'id')
+        queryset = queryset.order_by(*self.ordering)
+
+        values = self.decode_cursor(request)
+        if values is not None:
+            queryset = queryset.filter(self.after(values))
+
+        rows = list(queryset[:size + 1])
+        self.has_next = len(rows) > size
+        rows = rows[:size]
+        self.last = rows[-1] if rows else None
+        return rows
+
+    def after(self, values):
+        keys = [(name.lstrip('-'), 'lt' if name.startswith('-') else 'gt', value) for name, value in zip(self.ordering, values)]
+        branches = [
+            reduce(and_, [Q(**{field: value}) for field, _, value in keys[:depth]], Q(**{f'{field}__{op}': value}))
+            for depth, (field, op, value) in enumerate(keys)
+        ]
+        field, op, value = keys[0]
+        return Q(**{f'{field}__{op}e': value}) & reduce(or_, branches)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            ordering, values = cursor['o'], cursor['v']
+        except (binascii.Error, UnicodeDecodeError, ValueError, TypeError, KeyError):
+            raise NotFound('Invalid cursor')
+        if ordering != self.ordering or len(values) != len(ordering):
+            raise NotFound('Invalid cursor for this ordering')
+        return values
+
+    def encode_cursor(self, row):
+        return encode_cursor(self.ordering, [getattr(row, name.lstrip('-')) for name in self.ordering])
+
+
+def encode_cursor(ordering, values):
+    cursor = json.dumps({'o': ordering, 'v': values}, default=cursor_value, separators=(',', ':'))
+    return base64.urlsafe_b64encode(cursor.encode()).decode()
+
+
+def cursor_value(value):
+    # Full isoformat for datetimes (DjangoJSONEncoder would cut them to milliseconds), str for Decimal
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
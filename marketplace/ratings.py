@@ -0,0 +1,77 @@
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.utils import timezone
+
+from .models import RATING_VALUES, Product, ProductRating, rating_histogram_field
+from .versions import bump_versions
+
+AGGREGATE_FIELDS = ['rating_count', 'rating_sum'] + [rating_histogram_field(value) for value in RATING_VALUES]
+
+
+# Rating Aggregates
+# Product.rating_count, rating_sum and rating_<n>_count summarise the product's ratings so
+# average_rating and the histogram never read the ratings table. The receivers in
+# marketplace/signals.py call apply_rating_change() for every rating saved or deleted; it is a
+# single UPDATE with F() expressions, so concurrent ratings of one product add up correctly.
+#
+# Writes that skip model signals (bulk_create, QuerySet.update, raw SQL) leave the aggregates
+# stale until reconcile_rating_aggregates() runs (reconcile_ratings command).
+def apply_rating_change(product_id, old=None, new=None):
+    """Move the aggregates of `product_id` from counting a rating of `old` stars to `new` (either may be None)."""
+    if old == new:
+        return
+    changes = {}
+    if old in RATING_VALUES:
+        changes[rating_histogram_field(old)] = F(rating_histogram_field(old)) - 1
+    if new in RATING_VALUES:
+        changes[rating_histogram_field(new)] = F(rating_histogram_field(new)) + 1
+    if old is None:
+        changes['rating_count'] = F('rating_count') + 1
+    elif new is None:
+        changes['rating_count'] = F('rating_count') - 1
+    changes['rating_sum'] = F('rating_sum') + (new or 0) - (old or 0)
+    Product.objects.filter(pk=product_id).update(**changes, updated_at=timezone.now())  # QuerySet.update skips auto_now
+
+
+def rating_aggregates(product_ids):
+    """{product_id: {field: value}} computed from the ratings table, for products with at least one rating."""
+    histogram = {
+        rating_histogram_field(value): Count('id', filter=Q(rating=value)) for value in RATING_VALUES
+    }
+    rows = (
+        ProductRating.objects.filter(product_id__in=product_ids)
+        .values('product_id')
+        .annotate(rating_count=Count('id'), rating_sum=Sum('rating'), **histogram)
+    )
+    return {row.pop('product_id'): row for row in rows}
+
+
+def reconcile_rating_aggregates(batch_size=500, stdout=None):
+    """Recompute the aggregates of every product from its ratings. Returns how many products were corrected.
+
+    Products are locked a batch at a time while their ratings are counted, so a rating saved
+    meanwhile either is counted here or moves the corrected values afterwards.
+    """
+    corrected = 0
+    empty = dict.fromkeys(AGGREGATE_FIELDS, 0)
+    ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+    for start in range(0, len(ids), batch_size):
+        batch = ids[start:start + batch_size]
+        with transaction.atomic():
+            products = list(Product.objects.select_for_update().filter(id__in=batch).only('id', 'updated_at', *AGGREGATE_FIELDS))
+            expected = rating_aggregates(batch)
+            stale = []
+            for product in products:
+                values = expected.get(product.id, empty)
+                if any(getattr(product, field) != values[field] for field in AGGREGATE_FIELDS):
+                    for field in AGGREGATE_FIELDS:
+                        setattr(product, field, values[field])
+                    product.updated_at = timezone.now()
+                    stale.append(product)
+            Product.objects.bulk_update(stale, AGGREGATE_FIELDS + ['updated_at'])
+        corrected += len(stale)
+        if stdout is not None:
+            stdout.write(f'checked {min(start + batch_size, len(ids))}/{len(ids)} products, corrected {corrected}')
+    if corrected:
+        bump_versions('products')  # bulk_update sends no signals
+    return corrected
@@ -0,0 +1,203 @@
+import math
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import IntegerField
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+
+from .models import Category, Product
+
+MAX_MATCHES = 1000        # best text matches re-ranked by popularity; the rest are dropped
+POPULARITY_WEIGHT = 0.1   # score = relevance * (1 + POPULARITY_WEIGHT * ln(1 + popularity))
+TERM = re.compile(r'\w+', re.UNICODE)
+
+PRODUCTS = Product._meta.db_table
+CATEGORIES = Category._meta.db_table
+
+
+def search_terms(query):
+    return [term.lower() for term in TERM.findall(query or '')][:16]
+
+
+# Full-text search backends
+# A full-text index over product name, category name and description, kept in a side table
+# keyed by product id:
+#
+#   sqlite      marketplace_product_fts, an FTS5 virtual table ranked with bm25()
+#   postgresql  marketplace_product_search, a weighted tsvector column with a GIN index,
+#               ranked with ts_rank_cd()
+#
+# Both match every term of the query as a prefix ("bro ric" finds "Brown Rice"), weight name
+# above category above description, and return the MAX_MATCHES best matches re-ranked by
+# product popularity. The tables are created by migration 0008, which carries its own copy of
+# the DDL below (so changing it here needs a new migration), and kept in step by the Product and
+# Category receivers in marketplace/signals.py; rebuild() (rebuild_search_index command) repairs
+# them after writes that skip signals.
+class SqliteSearchBackend:
+    table = 'marketplace_product_fts'
+
+    def create(self, cursor):
+        cursor.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5("
+            "name, category, description, tokenize='porter unicode61 remove_diacritics 2', prefix='2 3')"
+        )
+
+    def drop(self, cursor):
+        cursor.execute(f'DROP TABLE IF EXISTS {self.table}')
+
+    def index(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        placeholders = ', '.join(['%s'] * len(product_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid IN ({placeholders})', product_ids)
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, name, category, description) '
+                f'SELECT p.id, p.name, c.name, p.description FROM {PRODUCTS} p '
+                f'JOIN {CATEGORIES} c ON c.id = p.category_id WHERE p.id IN ({placeholders})',
+                product_ids,
+            )
+
+    def remove(self, product_ids):
+        product_ids = list(product_ids)
+        if product_ids:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"DELETE FROM {self.table} WHERE rowid IN ({', '.join(['%s'] * len(product_ids))})", product_ids
+                )
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, name, category, description) '
+                f'SELECT p.id, p.name, c.name, p.description FROM {PRODUCTS} p JOIN {CATEGORIES} c ON c.id = p.category_id'
+            )
+
+    def matches(self, terms):
+        """(product_id, relevance, popularity) of the best matches, most relevant first."""
+        query = ' '.join(f'"{term}"*' for term in terms)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT f.rowid, -bm25({self.table}, 10.0, 4.0, 1.0), p.popularity FROM {self.table} f '
+                f'JOIN {PRODUCTS} p ON p.id = f.rowid WHERE {self.table} MATCH %s ORDER BY f.rank LIMIT %s',
+                [query, MAX_MATCHES],
+            )
+            return cursor.fetchall()
+
+    def position(self, ids):
+        """Expression giving each product row its place in `ids` (one instr() per row, not a CASE per id)."""
+        ids = ','.join(map(str, ids))
+        return RawSQL(f"""instr(%s, ',' || "{PRODUCTS}"."id" || ',')""", [f',{ids},'], output_field=IntegerField())
+
+
+class PostgresSearchBackend:
+    table = 'marketplace_product_search'
+    document = (
+        "setweight(to_tsvector('english', p.name), 'A') || "
+        "setweight(to_tsvector('english', c.name), 'B') || "
+        "setweight(to_tsvector('english', p.description), 'C')"
+    )
+
+    def create(self, cursor):
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS {self.table} ('
+            f'product_id bigint PRIMARY KEY REFERENCES {PRODUCTS} (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, '
+            'document tsvector NOT NULL)'
+        )
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {self.table}_document_idx ON {self.table} USING GIN (document)')
+
+    def drop(self, cursor):
+        cursor.execute(f'DROP TABLE IF EXISTS {self.table}')
+
+    def _upsert(self, cursor, where='', params=()):
+        cursor.execute(
+            f'INSERT INTO {self.table} (product_id, document) '
+            f'SELECT p.id, {self.document} FROM {PRODUCTS} p JOIN {CATEGORIES} c ON c.id = p.category_id {where} '
+            'ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document',
+            params,
+        )
+
+    def index(self, product_ids):
+        product_ids = list(product_ids)
+        if product_ids:
+            with connection.cursor() as cursor:
+                self._upsert(cursor, 'WHERE p.id = ANY(%s)', [product_ids])
+
+    def remove(self, product_ids):
+        product_ids = list(product_ids)
+        if product_ids:
+            with connection.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {self.table} WHERE product_id = ANY(%s)', [product_ids])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            self._upsert(cursor)
+
+    def matches(self, terms):
+        query = ' & '.join(f"{term}:*" for term in terms)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT s.product_id, ts_rank_cd(s.document, q), p.popularity '
+                f"FROM {self.table} s JOIN {PRODUCTS} p ON p.id = s.product_id, to_tsquery('english', %s) q "
+                'WHERE s.document @@ q ORDER BY 2 DESC LIMIT %s',
+                [query, MAX_MATCHES],
+            )
+            return cursor.fetchall()
+
+    def position(self, ids):
+        return RawSQL(f'array_position(%s::bigint[], "{PRODUCTS}"."id")', [list(ids)], output_field=IntegerField())
+
+
+BACKENDS = {'sqlite': SqliteSearchBackend, 'postgresql': PostgresSearchBackend}
+
+
+def search_backend(vendor=None):
+    """The full-text backend for the database in use, or None to fall back to LIKE matching."""
+    if getattr(settings, 'PRODUCT_SEARCH_BACKEND', 'auto') == 'like':
+        return None
+    backend = BACKENDS.get(vendor or connection.vendor)
+    return backend() if backend else None
+
+
+def ranked_product_ids(query, backend=None):
+    """Ids of the products matching `query`, best first: text relevance scaled by popularity."""
+    terms = search_terms(query)
+    backend = backend or search_backend()
+    if not terms or backend is None:
+        return []
+    scored = [
+        (relevance * (1 + POPULARITY_WEIGHT * math.log1p(max(popularity, 0))), product_id)
+        for product_id, relevance, popularity in backend.matches(terms)
+    ]
+    scored.sort(key=lambda entry: (-entry[0], entry[1]))
+    return [product_id for _, product_id in scored]
+
+
+# Product Search Filter
+# Drop-in replacement for SearchFilter on the product list (?search=). With a full-text backend
+# the results come back in relevance order unless the client passed ?ordering=, so it has to
+# run after OrderingFilter; on any other database it behaves exactly like SearchFilter over the
+# view's search_fields.
+class ProductSearchFilter(SearchFilter):
+    ordering_param = 'ordering'
+
+    def filter_queryset(self, request, queryset, view):
+        backend = search_backend()
+        if backend is None:
+            return super().filter_queryset(request, queryset, view)
+        query = request.query_params.get(self.search_param, '')
+        if not search_terms(query):
+            return queryset
+
+        ids = ranked_product_ids(query, backend)
+        if not ids:
+            return queryset.none()
+        queryset = queryset.filter(id__in=ids)
+        if request.query_params.get(self.ordering_param):
+            return queryset
+        return queryset.annotate(search_rank=backend.position(ids)).order_by('search_rank')
@@ -1,10 +1,30 @@
 from rest_framework import serializers
-from .models import Category, Product, ProductRating, Favorite
+from .models import RATING_VALUES, Category, Product, ProductRating, Favorite, rating_histogram_field
+
+
+# Sparse Fieldsets
+# Lets a view trim what a serializer renders, from the context it builds (see SparseFieldsMixin
+# in views.py):
+#   context['fields']  only these fields (and the expanded ones) are rendered; write-only fields stay for input
+#   context['expand']  fields listed in Meta.expandable are left out unless expanded or named in 'fields'
+class SparseFieldsetMixin:
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fields = self.context.get('fields')
+        expand = set(self.context.get('expand') or ()) | set(fields or ())
+        for name in getattr(self.Meta, 'expandable', ()):
+            if name not in expand:
+                self.fields.pop(name, None)
+        if fields:
+            for name in list(self.fields):
+                if name not in expand and not self.fields[name].write_only:
+                    self.fields.pop(name)
 
 
 # Serializer for Category Models
 # This serializer handles the creation and validation of categories.
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name', 'description']
@@ -45,15 +65,26 @@ class ProductRatingSerializer(serializers.ModelSerializer):
 
 # Serializer for Product Models
 # This serializer handles the creation and validation of products.
-# It includes nested serializers for categories and product ratings.
-class ProductSerializer(serializers.ModelSerializer):
+# It includes a nested serializer for categories. Ratings are summarised from the aggregates
+# stored on Product; the raw ratings are expandable (?expand=ratings) and only nested on request.
+# `columns` names the Product columns each field reads, so views can load just those.
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
     category_id = serializers.PrimaryKeyRelatedField(
         queryset=Category.objects.all(), source='category', write_only=True
     )
     ratings = ProductRatingSerializer(many=True, read_only=True)
     average_rating = serializers.SerializerMethodField()
+    rating_histogram = serializers.SerializerMethodField()
     image = serializers.ImageField(required=False, allow_null=True)
+
+    columns = {
+        'category': ['category__id', 'category__name', 'category__description'],
+        'average_rating': ['rating_count', 'rating_sum'],
+        'rating_histogram': [rating_histogram_field(value) for value in RATING_VALUES],
+        'category_id': [],  # write-only
+        'ratings': [],
+    }
     
     class Meta:
         model = Product
@@ -62,6 +93,7 @@ class ProductSerializer(serializers.ModelSerializer):
             'name',
             'description',
             'price',
+            'brand',
             'stock',
             'image',
             'created_at',
@@ -69,14 +101,20 @@ class ProductSerializer(serializers.ModelSerializer):
             'category',
             'category_id',
             'average_rating',
+            'rating_count',
+            'rating_histogram',
             'ratings',
         ]
+        read_only_fields = ['rating_count']
+        expandable = ['ratings']
     
     def get_average_rating(self, obj):
-        ratings = obj.ratings.all()
-        if not ratings.exists():
+        if not obj.rating_count:
             return None
-        return round(sum(r.rating for r in ratings) / ratings.count(), 2)
+        return round(obj.rating_sum / obj.rating_count, 2)
+
+    def get_rating_histogram(self, obj):
+        return {str(value): count for value, count in obj.rating_histogram.items()}
 
 
 
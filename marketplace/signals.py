@@ -0,0 +1,120 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .autocomplete import autocomplete_index
+from .models import Category, Product, ProductRating, ProductTombstone
+from .ratings import apply_rating_change
+from .search import search_backend
+from .versions import bump_versions
+
+SEARCHED_FIELDS = {'name', 'description', 'category', 'category_id'}
+
+
+# Keep Product rating aggregates in step with ProductRating (see marketplace/ratings.py).
+# ProductRating.save() and Collector.delete() both run these inside their transaction.
+@receiver(pre_save, sender=ProductRating)
+def remember_stored_rating(sender, instance, raw=False, **kwargs):
+    # Instances loaded from the database already know (ProductRating.from_db); others are looked up
+    if not raw and instance.pk is not None and not hasattr(instance, '_stored_rating'):
+        instance._stored_rating = ProductRating.objects.filter(pk=instance.pk).values_list('rating', flat=True).first()
+
+
+@receiver(post_save, sender=ProductRating)
+def count_saved_rating(sender, instance, created, raw=False, **kwargs):
+    if raw:  # loaddata; run reconcile_ratings afterwards
+        return
+    apply_rating_change(instance.product_id, None if created else instance._stored_rating, instance.rating)
+    instance._stored_rating = instance.rating
+
+
+@receiver(post_delete, sender=ProductRating)
+def uncount_deleted_rating(sender, instance, **kwargs):
+    apply_rating_change(instance.product_id, getattr(instance, '_stored_rating', instance.rating), None)
+
+
+# Keep the full-text search index (marketplace/search.py) in step with products and category names.
+# The index is written on the same connection as the save, so it commits or rolls back with it.
+@receiver(post_save, sender=Product)
+def index_searched_product(sender, instance, raw=False, update_fields=None, **kwargs):
+    backend = search_backend()
+    if backend is None or raw or (update_fields is not None and not SEARCHED_FIELDS & set(update_fields)):
+        return
+    backend.index([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def unindex_searched_product(sender, instance, **kwargs):
+    backend = search_backend()
+    if backend is not None:
+        backend.remove([instance.pk])
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, created, raw=False, **kwargs):
+    backend = search_backend()
+    if backend is not None and not created and not raw:
+        backend.index(instance.products.values_list('id', flat=True))
+
+
+# Keep the in-process autocomplete index (marketplace/autocomplete.py) in step, once the change commits
+@receiver(post_save, sender=Product)
+def autocomplete_saved_product(sender, instance, **kwargs):
+    row = (instance.pk, instance.name, instance.popularity, instance.category_id)
+    transaction.on_commit(lambda: autocomplete_index.upsert_product(*row))
+
+
+@receiver(post_delete, sender=Product)
+def autocomplete_deleted_product(sender, instance, **kwargs):
+    product_id = instance.pk
+    transaction.on_commit(lambda: autocomplete_index.remove_product(product_id))
+
+
+@receiver(post_save, sender=Category)
+def autocomplete_saved_category(sender, instance, **kwargs):
+    row = (instance.pk, instance.name)
+    transaction.on_commit(lambda: autocomplete_index.upsert_category(*row))
+
+
+@receiver(post_delete, sender=Category)
+def autocomplete_deleted_category(sender, instance, **kwargs):
+    category_id = instance.pk
+    transaction.on_commit(lambda: autocomplete_index.remove_category(category_id))
+
+
+# Move the collection version stamps (marketplace/versions.py) that the conditional GETs are built on
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def bump_category_versions(sender, **kwargs):
+    bump_versions('categories', 'products')
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductRating)
+@receiver(post_delete, sender=ProductRating)
+def bump_product_versions(sender, **kwargs):
+    bump_versions('products')
+
+
+# Feed the product changes feed (marketplace/changes.py): a tombstone for every deleted product,
+# and a fresh updated_at on the products of a renamed category. Other category edits leave the
+# products alone; clients read category details from the category endpoints.
+@receiver(post_delete, sender=Product)
+def record_deleted_product(sender, instance, **kwargs):
+    ProductTombstone.objects.create(product_id=instance.pk)
+
+
+@receiver(pre_save, sender=Category)
+def remember_stored_category_name(sender, instance, raw=False, **kwargs):
+    if not raw and instance.pk is not None:
+        instance._stored_name = Category.objects.filter(pk=instance.pk).values_list('name', flat=True).first()
+
+
+@receiver(post_save, sender=Category)
+def touch_category_products(sender, instance, created, raw=False, **kwargs):
+    if created or raw or getattr(instance, '_stored_name', None) in (None, instance.name):
+        return
+    instance._stored_name = instance.name
+    instance.products.update(updated_at=timezone.now())
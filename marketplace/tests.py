@@ -1,3 +1,386 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import tempfile
+import time
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from .autocomplete import SCAN_LIMIT, autocomplete_index
+from .models import Category, Product, ProductRating
+from .versions import collection_version
+
+User = get_user_model()
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            category=Category.objects.create(name='Grains'), name='Rice', description='', price=Decimal('5000')
+        )
+        self.users = [User.objects.create_user(username=f'rater{n}', password='testtest1234') for n in range(3)]
+
+    def aggregates(self):
+        self.product.refresh_from_db()
+        return self.product.rating_count, self.product.rating_sum, self.product.rating_histogram
+
+    def test_create_update_and_delete_move_the_aggregates(self):
+        first = ProductRating.objects.create(product=self.product, user=self.users[0], rating=5)
+        ProductRating.objects.create(product=self.product, user=self.users[1], rating=3)
+        self.assertEqual(self.aggregates(), (2, 8, {1: 0, 2: 0, 3: 1, 4: 0, 5: 1}))
+        self.assertEqual(self.product.average_rating, 4.0)
+
+        first.rating = 1
+        first.save()
+        self.assertEqual(self.aggregates(), (2, 4, {1: 1, 2: 0, 3: 1, 4: 0, 5: 0}))
+
+        stale = ProductRating.objects.get(pk=first.pk)  # saved from an instance built without from_db
+        ProductRating(pk=stale.pk, product=self.product, user=self.users[0], rating=2, created_at=stale.created_at).save()
+        self.assertEqual(self.aggregates(), (2, 5, {1: 0, 2: 1, 3: 1, 4: 0, 5: 0}))
+
+        ProductRating.objects.filter(user=self.users[1]).delete()
+        self.assertEqual(self.aggregates(), (1, 2, {1: 0, 2: 1, 3: 0, 4: 0, 5: 0}))
+
+    def test_reconcile_fixes_ratings_written_in_bulk(self):
+        ProductRating.objects.bulk_create([
+            ProductRating(product=self.product, user=user, rating=rating) for user, rating in zip(self.users, [4, 4, 2])
+        ])
+        self.assertEqual(self.aggregates()[0], 0)
+
+        call_command('reconcile_ratings', stdout=StringIO())
+        self.assertEqual(self.aggregates(), (3, 10, {1: 0, 2: 1, 3: 0, 4: 2, 5: 0}))
+
+    def test_product_list_summarises_ratings_without_nesting_them(self):
+        for user in self.users:
+            ProductRating.objects.create(product=self.product, user=user, rating=4)
+        Product.objects.create(category=self.product.category, name='Beans', description='', price=Decimal('3000'))
+        client = APIClient()
+
+        with self.assertNumQueries(2):  # the collection version stamp, then the products
+            products = client.get(reverse('product-list-create')).json()['results']
+        rice = products[0]
+        self.assertNotIn('ratings', rice)
+        self.assertEqual((rice['average_rating'], rice['rating_count']), (4.0, 3))
+        self.assertEqual(rice['rating_histogram']['4'], 3)
+
+        with self.assertNumQueries(3):
+            products = client.get(reverse('product-list-create'), {'include': 'ratings'}).json()['results']
+        self.assertEqual(len(products[0]['ratings']), 3)
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.grains = Category.objects.create(name='Grains')
+        self.rice = Product.objects.create(category=self.grains, name='Brown Rice', description='Whole grain', price=Decimal('5000'))
+        self.flour = Product.objects.create(
+            category=self.grains, name='Rice Flour', description='Milled rice', price=Decimal('3000'), popularity=500
+        )
+        self.cake = Product.objects.create(
+            category=Category.objects.create(name='Bakery'), name='Sponge Cake', description='Made with rice flour',
+            price=Decimal('2500'), popularity=1000,
+        )
+        self.client = APIClient()
+
+    def search(self, query, **params):
+        response = self.client.get(reverse('product-list-create'), {'search': query, **params})
+        return [product['name'] for product in response.json()['results']]
+
+    def test_results_are_ranked_by_relevance_and_popularity(self):
+        self.assertEqual(self.search('rice'), ['Rice Flour', 'Brown Rice', 'Sponge Cake'])
+        self.assertEqual(self.search('bro ric'), ['Brown Rice'])
+        self.assertEqual(self.search('rice', ordering='price'), ['Sponge Cake', 'Rice Flour', 'Brown Rice'])
+        self.assertEqual(self.search('quinoa'), [])
+
+    def test_index_follows_product_and_category_changes(self):
+        self.rice.name = 'Jasmine Rice'
+        self.rice.save()
+        self.assertEqual(self.search('jasmine'), ['Jasmine Rice'])
+        self.flour.delete()
+        self.assertEqual(self.search('flour'), ['Sponge Cake'])
+        self.grains.name = 'Cereals'
+        self.grains.save()
+        self.assertEqual(self.search('cereal'), ['Jasmine Rice'])
+
+    @override_settings(PRODUCT_SEARCH_BACKEND='like')
+    def test_like_fallback(self):
+        self.assertEqual(self.search('rice'), ['Brown Rice', 'Rice Flour', 'Sponge Cake'])
+
+
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        autocomplete_index.clear()
+        self.grains = Category.objects.create(name='Grains')
+        for name, popularity in [('Brown Rice', 5), ('Rice Flour', 50), ('Crème Fraîche', 1), ('Brown Bread', 20)]:
+            Product.objects.create(category=self.grains, name=name, description='', price=Decimal('1000'), popularity=popularity)
+        self.client = APIClient()
+
+    def suggest(self, query, **params):
+        response = self.client.get(reverse('autocomplete'), {'q': query, **params})
+        return [(item['type'], item['name']) for item in response.json()['suggestions']]
+
+    def test_suggestions_match_word_prefixes_by_weight(self):
+        self.assertEqual(self.suggest('ric'), [('product', 'Rice Flour'), ('product', 'Brown Rice')])
+        self.assertEqual(self.suggest('BRO'), [('product', 'Brown Bread'), ('product', 'Brown Rice')])
+        self.assertEqual(self.suggest('creme'), [('product', 'Crème Fraîche')])
+        self.assertEqual(self.suggest('gr', limit=1), [('category', 'Grains')])  # weighs all its products
+        with self.assertNumQueries(0):
+            self.suggest('r')
+
+    def test_index_follows_committed_changes(self):
+        self.suggest('r')  # load the index
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(category=self.grains, name='Red Rice', description='', price=Decimal('1000'), popularity=99)
+            Product.objects.filter(name='Rice Flour').get().delete()
+            self.grains.name = 'Cereals'
+            self.grains.save()
+        self.assertEqual(self.suggest('ric'), [('product', 'Red Rice'), ('product', 'Brown Rice')])
+        self.assertEqual(self.suggest('cer'), [('category', 'Cereals')])
+
+    def test_large_prefixes_use_precomputed_lists(self):
+        Product.objects.bulk_create([
+            Product(category=self.grains, name=f'Bean {n}', description='', price=Decimal('1000'), popularity=n)
+            for n in range(SCAN_LIMIT * 2)
+        ])
+        autocomplete_index.rebuild()
+        self.assertEqual(self.suggest('bea', limit=2), [('product', f'Bean {SCAN_LIMIT * 2 - 1}'), ('product', f'Bean {SCAN_LIMIT * 2 - 2}')])
+        autocomplete_index.upsert_product(Product.objects.get(name='Bean 0').id, 'Bean 0', 10_000, self.grains.id)
+        self.assertEqual(self.suggest('bean', limit=1), [('product', 'Bean 0')])
+
+    def test_expired_index_is_served_while_it_reloads(self):
+        self.suggest('r')  # load the index
+        Product.objects.bulk_create([  # written by another process: no receivers here
+            Product(category=self.grains, name='Red Rice', description='', price=Decimal('1000'), popularity=99)
+        ])
+        later = time.monotonic() + 3600
+        with mock.patch('marketplace.autocomplete.time.monotonic', return_value=later), \
+                mock.patch('marketplace.autocomplete.threading.Thread') as thread, self.assertNumQueries(0):
+            self.assertEqual(self.suggest('ric'), [('product', 'Rice Flour'), ('product', 'Brown Rice')])
+        thread.assert_called_once_with(target=autocomplete_index._refresh, name='autocomplete-rebuild', daemon=True)
+        thread.return_value.start.assert_called_once_with()
+        autocomplete_index.rebuild()  # what the thread runs
+        self.assertEqual(self.suggest('ric', limit=1), [('product', 'Red Rice')])
+
+    def test_updates_during_a_reload_are_kept(self):
+        self.suggest('r')
+        flour = Product.objects.get(name='Rice Flour')
+        load = autocomplete_index._load
+
+        def load_then_update(index):
+            load.__func__(index)
+            autocomplete_index.upsert_product(flour.id, 'Rice Flour', 1, self.grains.id)  # committed after the read
+
+        with mock.patch.object(type(autocomplete_index), '_load', load_then_update):
+            autocomplete_index.rebuild()
+        self.assertEqual(self.suggest('ric'), [('product', 'Brown Rice'), ('product', 'Rice Flour')])
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            category=Category.objects.create(name='Dairy'), name='Milk', description='Fresh', price=Decimal('900')
+        )
+        ProductRating.objects.create(product=self.product, user=User.objects.create_user(username='r', password='testtest1234'), rating=5)
+        self.client = APIClient()
+
+    def get(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        # The catalog queries only, without the version stamp lookup of the conditional GET
+        return response, [query['sql'] for query in queries if 'marketplace_collectionversion' not in query['sql']]
+
+    def test_grid_view_reads_and_returns_only_grid_columns(self):
+        response, queries = self.get(reverse('product-list-create'), view='grid')
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'name', 'price', 'image'})
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn('description', queries[0])
+        self.assertNotIn('marketplace_category', queries[0])
+
+    def test_fields_and_expand_drive_the_joins(self):
+        response, queries = self.get(reverse('product-list-create'), fields='id,category,average_rating')
+        self.assertEqual(response.json()['results'][0], {'id': self.product.id, 'category': {'id': self.product.category_id, 'name': 'Dairy', 'description': None}, 'average_rating': 5.0})
+        self.assertEqual(len(queries), 1)
+
+        response, queries = self.get(reverse('product-list-create'), fields='id,name', expand='ratings')
+        self.assertEqual(set(response.json()['results'][0]), {'id', 'name', 'ratings'})
+        self.assertEqual(len(queries), 2)
+
+        response, _ = self.get(reverse('product-detail', args=[self.product.id]))
+        self.assertEqual(len(response.json()['ratings']), 1)  # expanded by default on the detail
+        response, _ = self.get(reverse('product-detail', args=[self.product.id]), expand='')
+        self.assertNotIn('ratings', response.json())
+
+    def test_unknown_names_are_rejected(self):
+        self.assertEqual(self.client.get(reverse('product-list-create'), {'fields': 'id,secret'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('product-list-create'), {'view': 'poster'}).status_code, 400)
+
+
+class CatalogPaginationTests(TestCase):
+    def setUp(self):
+        self.fruit, self.grains = Category.objects.create(name='Fruit'), Category.objects.create(name='Grains')
+        prices = [300, 200, 200, 100, 300, 100, 200]
+        self.products = [
+            Product.objects.create(category=self.fruit if n % 2 else self.grains, name=f'P{n}', description='', price=Decimal(price))
+            for n, price in enumerate(prices)
+        ]
+        self.client = APIClient()
+
+    def walk(self, **params):
+        pages, url = [], reverse('product-list-create')
+        params = {'page_size': 3, 'fields': 'id', **params}
+        while url:
+            body = self.client.get(url, params).json()
+            pages.append([product['id'] for product in body['results']])
+            url, params = body['next'], {}
+        return pages
+
+    def test_every_ordering_pages_through_all_rows_once(self):
+        for ordering, key in [('price', lambda p: (p.price, p.id)), ('-price', lambda p: (-p.price, -p.id)),
+                              ('-created_at', lambda p: (-p.created_at.timestamp(), -p.id))]:
+            pages = self.walk(ordering=ordering)
+            self.assertEqual([len(page) for page in pages], [3, 3, 1])
+            self.assertEqual(sum(pages, []), [p.id for p in sorted(self.products, key=key)], ordering)
+        self.assertEqual(sum(self.walk(), []), sorted(p.id for p in self.products))
+
+    def test_category_filter_and_cursor_checks(self):
+        self.assertEqual(sum(self.walk(category=self.fruit.id, ordering='price'), []), [self.products[n].id for n in (3, 5, 1)])
+        url = reverse('product-list-create')
+        cursor = self.client.get(url, {'page_size': 2, 'ordering': 'price'}).json()['next'].split('cursor=')[1]
+        self.assertEqual(self.client.get(url, {'cursor': cursor, 'ordering': '-price'}).status_code, 404)
+        self.assertEqual(self.client.get(url, {'cursor': 'garbage'}).status_code, 404)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.grains = Category.objects.create(name='Grains')
+        self.rice = Product.objects.create(category=self.grains, name='Rice', description='', price=Decimal('5000'))
+        self.client = APIClient()
+
+    def revalidate(self, url, response, **params):
+        return self.client.get(url, params, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_collections_answer_304_from_the_stamps_alone(self):
+        url = reverse('product-list-create')
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        with CaptureQueriesContext(connection) as queries:
+            again = self.revalidate(url, first)
+        self.assertEqual(len(queries), 1)
+        self.assertIn('marketplace_collectionversion', queries[0]['sql'])
+        self.assertEqual((again.status_code, again['ETag'], again.content), (304, first['ETag'], b''))
+        self.assertEqual(self.revalidate(url, first, view='grid').status_code, 200)  # each query string has its own tag
+
+    def test_product_rating_and_category_writes_change_the_tags(self):
+        product_url, category_url = reverse('product-detail', args=[self.rice.id]), reverse('category-list-create')
+        product, category = self.client.get(product_url), self.client.get(category_url)
+        user = User.objects.create_user(username='rater', password='testtest1234')
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductRating.objects.create(product=self.rice, user=user, rating=4)
+        self.assertEqual(self.revalidate(product_url, product).status_code, 200)
+        self.assertEqual(self.revalidate(category_url, category).status_code, 304)
+
+        product = self.client.get(product_url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.grains.name = 'Cereals'
+            self.grains.save()
+        self.assertEqual(self.revalidate(product_url, product).status_code, 200)
+        self.assertEqual(self.revalidate(category_url, category).status_code, 200)
+
+    def test_if_modified_since(self):
+        url = reverse('category-list-create')
+        with mock.patch('marketplace.versions.time.time', return_value=time.time() + 5):
+            response = self.client.get(url)
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE='Sat, 01 Jan 2000 00:00:00 GMT').status_code, 200)
+        with mock.patch('marketplace.versions.time.time', return_value=collection_version('categories') / 1e9):
+            self.assertNotIn('Last-Modified', self.client.get(url))  # not until the second of the last change is over
+
+
+@override_settings(PRODUCT_CHANGES_LAG=0)
+class ProductChangesTests(TestCase):
+    def setUp(self):
+        self.grains = Category.objects.create(name='Grains')
+        self.products = [
+            Product.objects.create(category=self.grains, name=f'P{n}', description='', price=Decimal('100')) for n in range(5)
+        ]
+        self.client = APIClient()
+
+    def sync(self, since=None, **params):
+        upserted, deleted = [], []
+        while True:
+            body = self.client.get(reverse('product-changes'), {'since': since or '', 'page_size': 2, **params}).json()
+            upserted += body['upserted']
+            deleted += body['deleted']
+            since = body['next']
+            if not body['has_more']:
+                return upserted, deleted, since
+
+    def test_first_sync_pages_through_the_catalog_then_only_changes(self):
+        upserted, deleted, since = self.sync()
+        self.assertEqual((upserted, deleted), ([p.id for p in self.products], []))
+        self.assertEqual(self.sync(since)[:2], ([], []))
+
+        self.products[3].price = Decimal('120')
+        self.products[3].save()
+        deleted_id = self.products.pop(1).id
+        Product.objects.filter(id=deleted_id).delete()
+        ProductRating.objects.create(product=self.products[3], user=User.objects.create_user(username='r', password='testtest1234'), rating=3)
+        upserted, deleted, since = self.sync(since)
+        self.assertEqual((upserted, deleted), ([self.products[2].id, self.products[3].id], [deleted_id]))
+
+        self.grains.description = 'Rice, maize and millet'
+        self.grains.save()
+        self.assertEqual(self.sync(since)[0], [])  # only a rename touches the products
+        self.grains.name = 'Cereals'
+        self.grains.save()
+        self.assertEqual(self.sync(since)[0], [p.id for p in self.products])
+
+        response = self.client.get(reverse('product-list-create'), {'ids': f'{self.products[0].id},{self.products[2].id}'})
+        self.assertEqual([p['id'] for p in response.json()['results']], [self.products[0].id, self.products[2].id])
+
+    @override_settings(PRODUCT_CHANGES_LAG=3600)
+    def test_feed_stays_behind_recent_writes_and_rejects_bad_cursors(self):
+        self.assertEqual(self.sync()[:2], ([], []))
+        self.assertEqual(self.client.get(reverse('product-changes'), {'since': 'garbage'}).status_code, 404)
+
+
+class CatalogExportTests(TestCase):
+    def setUp(self):
+        grains = Category.objects.create(name='Grains')
+        self.products = [
+            Product.objects.create(category=grains, name=f'Rice {n}', description='', price=Decimal('500')) for n in range(3)
+        ]
+        ProductRating.objects.create(product=self.products[1], user=User.objects.create_user(username='r', password='testtest1234'), rating=4)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.get(username='r'))
+
+    def lines(self, data):
+        return [json.loads(line) for line in data.decode().splitlines()]
+
+    def test_export_streams_one_product_per_line(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('product-export'))
+            self.assertTrue(response.streaming)
+            rows = self.lines(b''.join(response.streaming_content))
+        self.assertEqual([row['id'] for row in rows], [p.id for p in self.products])
+        self.assertEqual((rows[1]['category']['name'], rows[1]['average_rating'], rows[1]['rating_histogram']['4']), ('Grains', 4.0, 1))
+        self.assertNotIn('ratings', rows[1])
+
+        response = self.client.get(reverse('product-export'), {'compress': 'gzip'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(self.lines(gzip.decompress(b''.join(response.streaming_content))), rows)
+
+    def test_export_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'catalog.ndjson.gz')
+            call_command('export_catalog', output=path, chunk_size=2, stderr=StringIO())
+            with gzip.open(path) as stream:
+                self.assertEqual(len(self.lines(stream.read())), 3)
@@ -3,7 +3,7 @@ from .views import (
     CategoryListCreateAPIView, CategoryRetrieveUpdateDestroyAPIView,
     ProductListCreateAPIView, ProductRetrieveUpdateDestroyAPIView, ProductRatingCreateUpdateAPIView, 
     FavoriteListView, FavoriteCreateView, FavoriteDeleteView, 
-    ProductRatingListView, ProductRatingDetailView
+    ProductRatingListView, ProductRatingDetailView, AutocompleteView, ProductChangesView, ProductExportView
 )
 
 
@@ -15,6 +15,9 @@ urlpatterns = [
     # Products
     path('products/', ProductListCreateAPIView.as_view(), name='product-list-create'),
     path('products/<int:pk>/', ProductRetrieveUpdateDestroyAPIView.as_view(), name='product-detail'),
+    path('products/changes/', ProductChangesView.as_view(), name='product-changes'), # Delta sync: ids upserted and deleted since a cursor
+    path('products/export/', ProductExportView.as_view(), name='product-export'), # Whole catalog as streamed NDJSON
+    path('autocomplete/', AutocompleteView.as_view(), name='autocomplete'), # Type-ahead product and category names
 
     # Ratings
     path('products/rate/', ProductRatingCreateUpdateAPIView.as_view(), name='product-rate'),
@@ -0,0 +1,99 @@
+import hashlib
+import math
+import time
+
+from django.db import transaction
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import CollectionVersion
+
+
+# Collection Versions
+# A version stamp per marketplace collection, one CollectionVersion row each, so every web and
+# Celery worker reads the same stamp whatever cache backend is configured:
+#
+#   categories   bumped by Category writes
+#   products     bumped by Product, ProductRating and Category writes (products nest their
+#                category and summarise their ratings)
+#
+# A stamp is the time.time_ns() of the last bump, set rather than incremented: every value
+# stored is new, so an ETag built on one can never come back after a later change, and a stamp
+# written late by a slower worker only ever describes data that already includes its change.
+# Bumps run on commit, after the change is visible, and take no lock a writer has to wait on.
+# Writes that skip signals (bulk_create, QuerySet.update) call bump_versions() themselves.
+def collection_versions(collections):
+    """The stamps of `collections`, in order: one primary key lookup."""
+    stamps = dict(CollectionVersion.objects.filter(collection__in=collections).values_list('collection', 'stamp'))
+    missing = [collection for collection in collections if collection not in stamps]
+    if missing:
+        # No row yet (new database, or flushed): start a fresh stamp so old ETags stop matching
+        CollectionVersion.objects.bulk_create(
+            [CollectionVersion(collection=collection, stamp=time.time_ns()) for collection in missing],
+            ignore_conflicts=True,
+        )
+        stamps.update(CollectionVersion.objects.filter(collection__in=missing).values_list('collection', 'stamp'))
+    return [stamps[collection] for collection in collections]
+
+
+def collection_version(collection):
+    return collection_versions([collection])[0]
+
+
+def bump_versions(*collections):
+    def bump():
+        stamp = time.time_ns()
+        if CollectionVersion.objects.filter(collection__in=collections).update(stamp=stamp) < len(collections):
+            CollectionVersion.objects.bulk_create(
+                [CollectionVersion(collection=collection, stamp=stamp) for collection in collections],
+                ignore_conflicts=True,
+            )
+
+    transaction.on_commit(bump)
+
+
+# Conditional Get Mixin
+# Strong ETag and Last-Modified for the GET of a list or detail view, from the versions of the
+# collections it renders. Both are checked before the view builds its queryset, so a matching
+# If-None-Match (or, without one, If-Modified-Since) is answered 304 after one lookup of the
+# stamps, without reading the catalog tables or running the serializer.
+#
+# The ETag hashes the stamps with the full path and query string and the renderer, so every
+# page, field set and ordering has its own. Last-Modified is the stamp rounded up to the next
+# second, and is only sent once that second has passed: a change later in the same second
+# would otherwise leave the header unchanged. Views whose output depends on more than the
+# collections (the requesting user, say) return False from is_conditional().
+class ConditionalGetMixin:
+    version_collections = ()
+
+    def is_conditional(self, request):
+        return True
+
+    def get(self, request, *args, **kwargs):
+        if not self.is_conditional(request):
+            return super().get(request, *args, **kwargs)
+        stamps = collection_versions(self.version_collections)
+        variant = f'{stamps}:{request.get_full_path()}:{request.accepted_renderer.format}'
+        etag = '"%s"' % hashlib.sha1(variant.encode()).hexdigest()
+        modified = math.ceil(max(stamps) / 1e9)
+        last_modified = modified if modified <= time.time() else None
+
+        if self.not_modified(request, etag, modified):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def not_modified(self, request, etag, modified):
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match is not None:
+            return if_none_match.strip() == '*' or etag in [tag.strip() for tag in if_none_match.split(',')]
+        since = parse_http_date_safe(request.headers.get('If-Modified-Since') or '')
+        return since is not None and since >= modified
+
@@ -1,5 +1,8 @@
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
 from django.shortcuts import render
 from rest_framework import generics, filters, permissions, status
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticated
@@ -8,18 +11,64 @@ from .models import Category, Product, ProductRating, Favorite
 from .serializers import CategorySerializer, ProductSerializer, ProductRatingSerializer, FavoriteSerializer
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
+from groroulette.products.filters import PreferenceFilter
+from .autocomplete import MAX_SUGGESTIONS, autocomplete_index
+from .changes import product_changes
+from .export import catalog_blocks
+from .pagination import CatalogPagination
+from .search import ProductSearchFilter
+from .versions import ConditionalGetMixin
 
 
 
+# Sparse Fields Mixin
+# Reads the output shape from the query string and hands it to the serializer context (see
+# SparseFieldsetMixin in serializers.py):
+#   ?fields=id,name,price   only these fields
+#   ?view=grid              a named preset from field_presets, instead of ?fields=
+#   ?expand=ratings         also render expandable fields (?include= is the older spelling)
+# Unknown names are a 400 rather than silently ignored.
+class SparseFieldsMixin:
+    field_presets = {}
+    default_expand = ()
+
+    def sparse_fields(self):
+        if not hasattr(self, '_sparse_fields'):
+            params = self.request.query_params
+            preset = params.get('view')
+            if preset and preset not in self.field_presets:
+                raise ValidationError({'view': f"Unknown view {preset!r}; expected one of {', '.join(self.field_presets)}"})
+            fields = set(self.field_presets[preset]) if preset else split_names(params.get('fields'))
+            if 'expand' in params or 'include' in params:
+                expand = split_names(params.get('expand')) | split_names(params.get('include'))
+            else:
+                expand = set(self.default_expand)
+            unknown = (fields | expand) - set(self.get_serializer_class().Meta.fields)
+            if unknown:
+                raise ValidationError({'fields': f"Unknown field(s): {', '.join(sorted(unknown))}"})
+            self._sparse_fields = (fields or None, expand)
+        return self._sparse_fields
+
+    def get_serializer_context(self):
+        fields, expand = self.sparse_fields()
+        return {**super().get_serializer_context(), 'fields': fields, 'expand': expand}
+
+
+def split_names(value):
+    return {name.strip() for name in (value or '').split(',') if name.strip()}
+
+
 # Category Views
 @method_decorator(csrf_exempt, name='dispatch')
-class CategoryListCreateAPIView(generics.ListCreateAPIView):
+class CategoryListCreateAPIView(ConditionalGetMixin, SparseFieldsMixin, generics.ListCreateAPIView):
+    version_collections = ['categories']
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [permissions.AllowAny]
     authentication_classes = [JWTAuthentication]
 
-class CategoryRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
+class CategoryRetrieveUpdateDestroyAPIView(ConditionalGetMixin, SparseFieldsMixin, generics.RetrieveUpdateDestroyAPIView):
+    version_collections = ['categories']
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [permissions.AllowAny]
@@ -27,24 +76,137 @@ class CategoryRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView
 
 
 # Product Views
+# ?view=grid is the catalog grid shape: id, name, price and image from the product row alone.
+PRODUCT_FIELD_PRESETS = {'grid': ['id', 'name', 'price', 'image']}
+
+
 @method_decorator(csrf_exempt, name='dispatch')
-class ProductListCreateAPIView(generics.ListCreateAPIView):
-    queryset = Product.objects.all()
+class ProductListCreateAPIView(ConditionalGetMixin, SparseFieldsMixin, generics.ListCreateAPIView):
+    version_collections = ['products']  # GET answers 304 while no product, rating or category changed
     serializer_class = ProductSerializer
     permission_classes = [permissions.AllowAny]
     authentication_classes = [JWTAuthentication]
+    field_presets = PRODUCT_FIELD_PRESETS
 
-    # Enable search & filter by name and category
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter]
+    # Enable search & filter by name and category, and by the user's GroRoulette preferences (?match_preferences=true).
+    # ProductSearchFilter goes last so its relevance order replaces the default ordering.
+    filter_backends = [filters.OrderingFilter, PreferenceFilter, ProductSearchFilter]
     search_fields = ['name', 'description', 'category__name']
     ordering_fields = ['price', 'created_at']
     ordering = ['id'] # this enables ordering to display from 1-20.. not in reverse, 20 - 1
+    pagination_class = CatalogPagination  # ?cursor= pages in any of the orderings above
 
-class ProductRetrieveUpdateDestroyAPIView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Product.objects.all()
+    def is_conditional(self, request):
+        # ?match_preferences= depends on the user's preferences, not just the catalog
+        return PreferenceFilter.query_param not in request.query_params
+
+    def get_queryset(self):
+        products = products_for_serializer(*self.sparse_fields())
+        category = self.request.query_params.get('category')
+        if category:
+            if not category.isdigit():
+                raise ValidationError({'category': 'Expected a category id'})
+            products = products.filter(category_id=category)
+        ids = self.request.query_params.get('ids')
+        if ids:  # ?ids=4,8,15 fetches the products a changes feed page reported as upserted
+            ids = split_names(ids)
+            if not all(pk.isdigit() for pk in ids) or len(ids) > CatalogPagination.max_page_size:
+                raise ValidationError({'ids': f'Expected up to {CatalogPagination.max_page_size} product ids'})
+            products = products.filter(id__in=ids)
+        return products
+
+class ProductRetrieveUpdateDestroyAPIView(ConditionalGetMixin, SparseFieldsMixin, generics.RetrieveUpdateDestroyAPIView):
+    version_collections = ['products']
     serializer_class = ProductSerializer
     permission_classes = [permissions.AllowAny]
     authentication_classes = [JWTAuthentication]
+    field_presets = PRODUCT_FIELD_PRESETS
+    default_expand = ['ratings']
+
+    def get_queryset(self):
+        if self.request.method != 'GET':  # writes load the whole row, so save() and the receivers see every field
+            return Product.objects.select_related('category')
+        return products_for_serializer(*self.sparse_fields())
+
+
+# Product Changes View
+# Delta sync for clients that keep a local copy of the catalog (see marketplace/changes.py):
+#   GET /api/marketplace/products/changes/?since=<cursor>&page_size=500
+# returns the ids upserted and deleted since the cursor, and the cursor to send next time.
+# Keep calling while has_more is true; fetch the upserted products with ?ids= on the product list.
+class ProductChangesView(APIView):
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = [JWTAuthentication]
+    page_size = 100
+    max_page_size = 1000
+
+    def get(self, request):
+        try:
+            size = int(request.query_params.get('page_size', self.page_size))
+        except ValueError:
+            size = self.page_size
+        return Response(product_changes(request.query_params.get('since'), max(1, min(size, self.max_page_size))))
+
+
+# Product Export View
+# The whole catalog as streamed NDJSON, one product per line (see marketplace/export.py):
+#   GET /api/marketplace/products/export/                 application/x-ndjson
+#   GET /api/marketplace/products/export/?compress=gzip   the same, gzip Content-Encoding
+# for partners and analytics jobs that would otherwise page through the product list.
+class ProductExportView(APIView):
+    permission_classes = [permissions.IsAuthenticated]
+    authentication_classes = [JWTAuthentication]
+
+    def get(self, request):
+        compress = request.query_params.get('compress', '')
+        if compress not in ('', 'gzip'):
+            raise ValidationError({'compress': "Expected 'gzip'"})
+        response = StreamingHttpResponse(catalog_blocks(compress=bool(compress)), content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="catalog.ndjson"'
+        if compress:
+            response['Content-Encoding'] = 'gzip'
+        return response
+
+
+# Autocomplete View
+# Type-ahead suggestions for product and category names, heaviest (most popular) first:
+#   GET /api/marketplace/autocomplete/?q=bro&limit=8
+# Answered from the in-process autocomplete index without touching the database. It is public,
+# so it skips authentication to stay cheap on every keystroke.
+class AutocompleteView(APIView):
+    permission_classes = [permissions.AllowAny]
+    authentication_classes = []
+
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            limit = 10
+        suggestions = autocomplete_index.suggest(request.query_params.get('q', ''), min(max(limit, 1), MAX_SUGGESTIONS))
+        return Response({
+            'query': request.query_params.get('q', ''),
+            'suggestions': [{'type': item.type, 'id': item.id, 'name': item.name} for item in suggestions],
+        })
+
+
+# Products with only what ProductSerializer will render loaded: the columns behind the rendered
+# fields, the category join when the category is nested, and the ratings with their users when
+# they are expanded.
+def products_for_serializer(fields=None, expand=()):
+    if fields:
+        rendered = set(fields) | set(expand)
+    else:
+        rendered = {name for name in ProductSerializer.Meta.fields if name not in ProductSerializer.Meta.expandable}
+        rendered |= set(expand)
+    columns = {'id'}
+    for name in rendered:
+        columns.update(ProductSerializer.columns.get(name, [name]))
+    products = Product.objects.only(*columns)
+    if 'category' in rendered:
+        products = products.select_related('category')
+    if 'ratings' in rendered:
+        products = products.prefetch_related(Prefetch('ratings', queryset=ProductRating.objects.select_related('user')))
+    return products
 
 
 # Rating Views
@@ -116,7 +278,7 @@ class FavoriteListView(generics.ListAPIView):
     authentication_classes = [JWTAuthentication]
 
     def get_queryset(self):
-        return Favorite.objects.filter(user=self.request.user)
+        return Favorite.objects.filter(user=self.request.user).select_related('user', 'product__category')
     
 
 @method_decorator(csrf_exempt, name='dispatch')
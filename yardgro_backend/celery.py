@@ -0,0 +1,11 @@
+import os
+
+from celery import Celery
+
+# Celery application for background work (async GroRoulette spins, scheduled jobs).
+# Run a worker with: celery -A yardgro_backend worker -l info
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yardgro_backend.settings')
+
+app = Celery('yardgro_backend')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 import os
 from datetime import timedelta
+from celery.schedules import crontab
 
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -104,6 +105,61 @@ SIMPLE_JWT = {
     "BLACKLIST_AFTER_ROTATION": True,
 }
 
+
+# Django cache, used for cached user preferences. Point every web and Celery worker at one Redis
+# so a save in one process invalidates the copies the others hold; without it each process keeps
+# its own and may serve a preference up to GROROULETTE["PREFERENCE_CACHE_TTL"] seconds old.
+if os.environ.get("DJANGO_CACHE_REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.environ["DJANGO_CACHE_REDIS_URL"],
+        }
+    }
+else:
+    CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+
+
+# GroRoulette settings (see groroulette/common/conf.py for every key and its default)
+GROROULETTE = {
+    "OPTIMIZER": "knapsack",  # "greedy" restores the original most-expensive-first behaviour
+    "OPTIMIZER_TIME_BUDGET_MS": 50,  # fall back to greedy when the knapsack takes longer than this
+    "MAX_QUANTITY_PER_ITEM": 10,
+    # Spin candidate pool cache: "local" per process, "redis" to share it between workers, None to disable
+    "CANDIDATE_CACHE_BACKEND": os.environ.get("GROROULETTE_CANDIDATE_CACHE", "local"),
+    "CANDIDATE_CACHE_REDIS_URL": os.environ.get("GROROULETTE_CACHE_REDIS_URL", "redis://localhost:6379/1"),
+    # Candidate ranking; set every weight to 0 to rank by price alone
+    "SCORE_WEIGHTS": {
+        "popularity": 0.3,
+        "rating": 0.25,
+        "value": 0.2,
+        "stock": 0.1,
+        "preference": 0.15,
+    },
+}
+
+
+# Product search: "auto" uses the full-text index of the database (FTS5 on SQLite, tsvector on PostgreSQL)
+# and falls back to LIKE matching elsewhere; "like" forces LIKE matching (see marketplace/search.py)
+PRODUCT_SEARCH_BACKEND = os.environ.get("PRODUCT_SEARCH_BACKEND", "auto")
+
+# Product changes feed: seconds it stays behind now, so rows stamped by transactions still committing
+# are not skipped (see marketplace/changes.py)
+PRODUCT_CHANGES_LAG = int(os.environ.get("PRODUCT_CHANGES_LAG", "5"))
+
+
+# Celery (see yardgro_backend/celery.py)
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+CELERY_TASK_ALWAYS_EAGER = os.environ.get('CELERY_TASK_ALWAYS_EAGER', '').lower() == 'true'  # run tasks inline, no worker
+CELERY_TASK_IGNORE_RESULT = True
+# Run the scheduler with: celery -A yardgro_backend beat -l info
+CELERY_BEAT_SCHEDULE = {
+    'sweep-abandoned-spins': {
+        'task': 'groroulette.tasks.sweep_spins_task',
+        'schedule': crontab(hour=3, minute=0),  # daily, off-peak
+    },
+}
+
 SITE_ID = 1
 
 AUTH_USER_MODEL = 'users.User'